@@ -1,8 +1,24 @@
+import time
+script_start = time.perf_counter()
+
 import streamlit as st
 import os
 from datetime import datetime
-import yaml
 import glob
+import entry_index
+import attachments
+import blobs
+import qc_parser
+import startup
+import storage
+import perf
+import exports
+import jobs
+import functools
+import pathlib
+
+# --- この実行の計測開始（区間時間・ファイル操作・再実行回数） ---
+perf.begin_run(st.session_state)
 
 def check_password():
     def password_entered():
@@ -24,6 +40,9 @@ def check_password():
 if not check_password():
     st.stop()
 
+# --- 認証後、重いモジュールを裏で読み込んでおく ---
+startup.prewarm()
+
 # --- ページ設定 ---
 st.set_page_config(
     page_title="QIDTノートアプリ",
@@ -80,29 +99,128 @@ tab = st.sidebar.radio("ナビゲーション", ["🏠 ホーム", "🧪 新規
 # --- 保存関数 ---
 def save_entry(title, body, tags):
     today = datetime.today().strftime("%Y-%m-%d")
-    slug = title.replace(" ", "_")
-    dir_path = f"entries/{today}"
-    os.makedirs(dir_path, exist_ok=True)
-    file_path = f"{dir_path}/{slug}.md"
-    
+    # 同じ日に同じタイトルがあれば -2, -3, ... を付けて別ファイルにする
+    file_path = entry_index.new_entry_path(today, title)
+
     metadata = {
         "title": title,
         "date": today,
         "tags": tags,
     }
 
-    with open(file_path, "w") as f:
-        f.write("---\n")
-        yaml.dump(metadata, f)
-        f.write("---\n\n")
-        f.write(body)
+    storage.atomic_write(file_path, entry_index.format_entry(metadata, body))
+    entry_index.upsert_entry(file_path)
 
     st.success(f"✅ 記録を保存しました： `{file_path}`")
+    return file_path
+
+
+# --- 計算出力ファイル（ORCA / Gaussian）の解析結果キャッシュ ---
+@st.cache_data(ttl=30, show_spinner=False)
+def list_outputs():
+    # 添付として保存した出力ファイルも、記録のフォルダにあったときのパスで選べるようにする
+    return sorted(set(qc_parser.find_outputs()) | set(blobs.logical_paths(qc_parser.OUTPUT_EXTENSIONS)))
+
+
+@st.cache_data(max_entries=64, show_spinner="出力ファイルを解析中…")
+def parse_output(path, mtime_ns, size):
+    return qc_parser.parse(path)
+
+
+@st.cache_data(max_entries=16, show_spinner="出力ファイルを解析中…")
+def parse_uploaded_output(file_id, _uploaded_file):
+    return qc_parser.parse(_uploaded_file)
+
+
+def choose_output(label, key):
+    # 保存済みの出力ファイルから選ぶか、アップロードしたものを解析する
+    col_pick, col_upload = st.columns(2)
+    picked = col_pick.selectbox(label, ["（選択なし）"] + list_outputs(), key="pick_"+key)
+    uploaded = col_upload.file_uploader("またはアップロード", type=qc_parser.OUTPUT_EXTENSIONS, key="upload_"+key)
+    try:
+        if uploaded is not None:
+            return parse_uploaded_output(uploaded.file_id, uploaded), uploaded.name
+        if picked != "（選択なし）":
+            path = blobs.resolve(picked)
+            st_result = os.stat(path)
+            return parse_output(path, st_result.st_mtime_ns, st_result.st_size), picked
+    except (OSError, ValueError) as e:
+        st.warning(f"⚠️ 出力ファイルを解析できませんでした: {e}")
+    return None, None
+
+
+# --- 表・アーカイブのダウンロード（押されたときだけ書き出し、内容が同じ間は使い回す） ---
+def download_frame(label, content_key, make_frame, file_stem, key, sheet_name="data"):
+    col_fmt, col_button = st.columns([1, 3])
+    fmt = col_fmt.selectbox("形式", exports.available_formats(), key="fmt_"+key, label_visibility="collapsed")
+    ext, mime, _ = exports.FORMATS[fmt]
+    col_button.download_button(
+        label, data=functools.partial(exports.cached_frame_bytes, content_key, fmt, make_frame, sheet_name),
+        file_name=f"{file_stem}.{ext}", mime=mime, key="dl_"+key
+    )
+
+
+def download_archive(label, make_archive, file_name, key):
+    st.download_button(label, data=lambda: pathlib.Path(make_archive()).read_bytes(),
+                       file_name=file_name, mime="application/zip", key="dl_"+key)
+
+
+# --- 画像はサムネイルを表示し、原寸は求められたときだけ送る ---
+def show_image(file_path, caption, key):
+    import thumbnails
+
+    st.image(thumbnails.thumbnail(file_path), caption=caption)
+    if st.checkbox("🔍 原寸で表示", key="full_"+key):
+        st.image(file_path, caption=caption, use_container_width=True)
+
+
+# --- バックグラウンドジョブ（再実行をまたいで進捗を表示し、終わったら結果を返す） ---
+def submit_job(kind, inputs, fn, *args, label="", reuse=True, **kwargs):
+    # 戻り値: ジョブのキー。「🔁 やり直す」が押されていれば、失敗・中止したジョブを同じキーで走らせ直す
+    retry = st.session_state.pop("retry_" + jobs.job_key(kind, inputs), False)
+    return jobs.submit(kind, inputs, fn, *args, label=label, retry=retry, reuse=reuse, **kwargs)
+
+
+def run_job(kind, inputs, fn, *args, label="", reuse=True, **kwargs):
+    # 戻り値: 結果。まだ終わっていなければ進捗を表示して None（同じ入力のジョブは1つだけ走る）
+    return job_result(submit_job(kind, inputs, fn, *args, label=label, reuse=reuse, **kwargs))
+
+
+def job_result(key, wait=0.3):
+    state = jobs.wait(key, wait)
+    if state is None:
+        return None
+    name = state["label"] or state["kind"]
+    if state["status"] == "done":
+        try:
+            return jobs.result(key)
+        except FileNotFoundError:
+            return None
+    if state["status"] in ("failed", "cancelled"):
+        if state["status"] == "failed":
+            st.error(f"⚠️ {name} に失敗しました: {(state['error'] or '').splitlines()[0]}")
+        else:
+            st.warning(f"{name} を中止しました。")
+        st.button("🔁 やり直す", key="retry_button_"+key, on_click=st.session_state.__setitem__, args=("retry_"+key, True))
+        return None
+    show_job_progress(key)
+    return None
+
+
+@st.fragment(run_every=1.0)
+def show_job_progress(key):
+    # 進捗だけを1秒ごとに描き直し、終わったらページ全体を再実行して結果を表示する
+    state = jobs.status(key)
+    if state is None or state["status"] in jobs.FINISHED:
+        st.rerun()
+    st.progress(state["progress"], text=f"⏳ {state['label'] or state['kind']}: {state['message'] or '待機中…'}")
+    st.button("中止", key="cancel_"+key, on_click=jobs.cancel, args=(key,))
 
 
 # --- 各画面処理 ---
 if tab == "🏠 ホーム":
     st.subheader("QIDTへようこそ")
+    startup.record_paint(st.session_state, tab, script_start, "first_paint")
     st.markdown("""
     このアプリは、量子化学的な洞察と直観を記録・構造化し、
     思考の深まりと再発見を支援する **「知のインターフェース」** です。
@@ -112,34 +230,45 @@ if tab == "🏠 ホーム":
 # --- 各画面処理 ---
 
 if tab == "🏠 ホーム":
-    import time
     from streamlit_lottie import st_lottie
-    import requests
-
-    def load_lottieurl(url):
-        r = requests.get(url)
-        if r.status_code != 200:
-            return None
-        return r.json()
-
-    lottie_molecule = load_lottieurl("https://assets2.lottiefiles.com/packages/lf20_j1adxtyb.json")
-    st_lottie(lottie_molecule, height=250, speed=1, key="intro")
+    import assets
+
+    # --- アニメーション（ローカルキャッシュ優先、無ければ同梱版を表示し裏で取得） ---
+    with perf.section("ホーム: アニメーション読み込み"):
+        lottie_molecule = assets.load_lottie(assets.LOTTIE_MOLECULE_URL, bundled=assets.LOTTIE_MOLECULE_BUNDLED)
+    if lottie_molecule:
+        st_lottie(lottie_molecule, height=250, speed=1, key="intro")
+
+    # --- 段階表示はCSSアニメーションで行い、スクリプトは待たせない ---
+    reveal_delays = [0.0, 0.5, 1.3, 2.3, 2.3, 3.5, 4.5]
+    st.markdown(
+        "<style>"
+        "@keyframes qidt-reveal { from { opacity: 0; transform: translateY(6px); } to { opacity: 1; transform: none; } }"
+        + "".join(
+            f".st-key-reveal-{i} {{ opacity: 0; animation: qidt-reveal 0.6s ease-out {delay}s forwards; }}"
+            for i, delay in enumerate(reveal_delays)
+        )
+        + "</style>",
+        unsafe_allow_html=True
+    )
 
     with st.container():
-        st.markdown("## **Quantum Interface Design Theory (QIDT)**")
-        time.sleep(0.5)
-        st.markdown("### 分子スケールで世界を設計する")
-        time.sleep(0.8)
-        st.write("QIDTは、電子構造理論を用いて、界面や反応場を統一的に理解・設計する理論体系です。")
-        time.sleep(1.0)
-        st.write("その中核にある指標は **QIDE**：")
-        st.latex(r"QIDE = E_{total}^{interface} - E_{substrate} - E_{molecule}")
-        time.sleep(1.2)
-        st.write("- 電子密度")
-        st.write("- HOMO/LUMO")
-        st.write("- SCFエネルギー")
-        time.sleep(1.0)
-        st.markdown("> **“分子を越えて、電子のふるまいを解明し、世界の構造を設計可能な知へと昇華する”**")
+        with st.container(key="reveal-0"):
+            st.markdown("## **Quantum Interface Design Theory (QIDT)**")
+        with st.container(key="reveal-1"):
+            st.markdown("### 分子スケールで世界を設計する")
+        with st.container(key="reveal-2"):
+            st.write("QIDTは、電子構造理論を用いて、界面や反応場を統一的に理解・設計する理論体系です。")
+        with st.container(key="reveal-3"):
+            st.write("その中核にある指標は **QIDE**：")
+        with st.container(key="reveal-4"):
+            st.latex(r"QIDE = E_{total}^{interface} - E_{substrate} - E_{molecule}")
+        with st.container(key="reveal-5"):
+            st.write("- 電子密度")
+            st.write("- HOMO/LUMO")
+            st.write("- SCFエネルギー")
+        with st.container(key="reveal-6"):
+            st.markdown("> **“分子を越えて、電子のふるまいを解明し、世界の構造を設計可能な知へと昇華する”**")
 
     st.markdown("""
 ---
@@ -187,6 +316,23 @@ QIDT-Reaction = {S, P, TS, ΔE, Δρ, ΔOrbital, ΔQIDE}
 
 elif tab == "🧪 新規記録":
     st.subheader("新規記録の作成")
+    startup.record_paint(st.session_state, tab, script_start, "first_paint")
+
+    # --- 添付ファイルの保存ジョブ（終わるまで、失敗・中止したら閉じるまで表示し続ける） ---
+    def show_upload(key, wait):
+        upload = st.session_state["upload_jobs"][key]
+        submit_job("upload", upload["inputs"], blobs.add_uploads, upload["files"], upload["dir"], label=upload["label"])
+        saved = job_result(key, wait=wait)
+        if saved is not None:
+            st.success(f"✅ 添付ファイル {saved} 件を保存しました")
+            del st.session_state["upload_jobs"][key]
+        elif jobs.status(key)["status"] in ("failed", "cancelled"):
+            st.caption(f"記録 `{upload['dir']}.md` は保存済みです。やり直すと同じ添付をもう一度保存します（保存済みのものは重複しません）。")
+            st.button("閉じる（この添付は保存しない）", key="dismiss_"+key,
+                      on_click=st.session_state["upload_jobs"].pop, args=(key, None))
+
+    for key in list(st.session_state.get("upload_jobs", {})):
+        show_upload(key, wait=0)
 
     title = st.text_input("タイトル", placeholder="例：MMA-MAA界面の反応場について")
     body = st.text_area("本文（Markdown形式で記述可能）", height=300, placeholder="ここに洞察や考察、発見などを記述します。")
@@ -201,123 +347,198 @@ elif tab == "🧪 新規記録":
     if st.button("保存"):
         if title and body:
             tag_list = [t.strip() for t in tags.split(",") if t.strip()]
-            save_entry(title, body, tag_list)
+            file_path = save_entry(title, body, tag_list)
 
-            # --- 添付ファイル保存処理 ---
+            # --- 添付ファイル保存処理（記録ファイルと同じ名前のフォルダを持ち主として参照する） ---
+            # 添付は内容のハッシュごとに圧縮して1つだけ保存する。小さな添付はその場で保存し終えるまで待ち、
+            # 大きな添付はバックグラウンドで保存して進捗をこのタブの上部に出す
+            file_dir = os.path.splitext(file_path)[0]
             if uploaded_files:
-                from pathlib import Path
-                today = datetime.today().strftime("%Y-%m-%d")
-                slug = title.replace(" ", "_")
-                file_dir = Path(f"entries/{today}/{slug}")
-                file_dir.mkdir(parents=True, exist_ok=True)
-
-                for file in uploaded_files:
-                    file_path = file_dir / file.name
-                    with open(file_path, "wb") as out_file:
-                        out_file.write(file.read())
-
-            st.success("✅ 記録と添付ファイルを保存しました")
+                inputs = (file_dir, tuple(f.file_id for f in uploaded_files))
+                key = jobs.job_key("upload", inputs)
+                st.session_state.setdefault("upload_jobs", {})[key] = {
+                    "inputs": inputs, "files": list(uploaded_files), "dir": file_dir,
+                    "label": f"添付ファイル {len(uploaded_files)} 件の保存",
+                }
+                small = sum(f.size for f in uploaded_files) <= attachments.BACKGROUND_UPLOAD_BYTES
+                show_upload(key, wait=None if small else 0)
+                if not small and key in st.session_state["upload_jobs"]:
+                    st.info("📎 添付ファイルはバックグラウンドで保存しています。")
         else:
             st.warning("⚠️ タイトルと本文は必須です。")
 
 elif tab == "📚 一覧":
     st.subheader("記録一覧")
+    startup.record_paint(st.session_state, tab, script_start, "first_paint")
 
+    def open_entry(path):
+        st.session_state["open_entry"] = path
 
-    entry_files = glob.glob("entries/**/*.md", recursive=True)
-    if not entry_files:
+    def close_entry():
+        path = st.session_state.pop("open_entry", None)
+        if path:
+            reload_entry(path)
+
+    def reload_entry(path):
+        # 編集の基準にした更新時刻と入力中の値を捨て、次の描画でファイルの最新内容から始める
+        for prefix in ["base_", "conflict_", "title_", "body_", "tag_"]:
+            st.session_state.pop(prefix + path, None)
+
+    # --- 上書き保存（編集を開いた時点から他のセッションが更新していれば保存しない） ---
+    def save_edit(path, metadata, body):
+        try:
+            st.session_state["base_"+path] = storage.write_checked(
+                path, entry_index.format_entry(metadata, body), st.session_state.get("base_"+path))
+        except storage.ConflictError:
+            st.session_state["conflict_"+path] = True
+            return
+        except FileNotFoundError:
+            st.error("⚠️ この記録は他のセッションで削除されました。")
+            return
+        entry_index.upsert_entry(path)
+        st.success("✅ 上書き保存しました")
+
+    # --- 大きい添付ファイルは全文を送らず、窓・行範囲・検索で部分表示 ---
+    def show_large_attachment(file_path):
+        view = st.radio("表示方法", ["先頭", "末尾", "行範囲", "検索"], horizontal=True, key="view_"+file_path)
+        if view == "先頭":
+            st.code(attachments.head(file_path), language="text")
+        elif view == "末尾":
+            st.code(attachments.tail(file_path), language="text")
+        elif view == "行範囲":
+            total_lines = attachments.count_lines(file_path)
+            first_line = st.number_input(
+                f"開始行（全 {total_lines} 行、{attachments.LINES_PER_PAGE} 行ずつ表示）",
+                min_value=1, max_value=max(total_lines, 1), value=1, step=attachments.LINES_PER_PAGE,
+                key="line_"+file_path
+            )
+            st.code("\n".join(attachments.read_lines(file_path, first_line - 1)), language="text")
+        else:
+            col_pattern, col_regex = st.columns([3, 1])
+            pattern = col_pattern.text_input("検索語", key="grep_"+file_path, placeholder="例：FINAL SINGLE POINT ENERGY")
+            use_regex = col_regex.checkbox("正規表現", key="regex_"+file_path)
+            if pattern:
+                try:
+                    matches, truncated = attachments.grep(file_path, pattern, regex=use_regex)
+                except Exception as e:
+                    st.error(f"⚠️ 検索できませんでした: {e}")
+                else:
+                    st.caption(f"{len(matches)} 件一致" + ("（上限で打ち切り）" if truncated else ""))
+                    if matches:
+                        st.code("\n".join(f"{n:>8}: {line}" for n, line in matches), language="text")
+
+    # --- インデックス同期（変更されたファイルのみ再解析） ---
+    with perf.section("一覧: インデックス同期"):
+        entry_index.sync_index()
+    if entry_index.count_entries() == 0:
         st.info("記録がまだありません。")
     else:
-        # --- 一覧読み込み ---
-        entries = []
-        all_tags = set()
-        for file_path in entry_files:
-            with open(file_path, "r") as f:
-                lines = f.readlines()
-                if lines[0].strip() == "---":
-                    meta_lines = []
-                    for line in lines[1:]:
-                        if line.strip() == "---":
-                            break
-                        meta_lines.append(line)
-                    metadata = yaml.safe_load("".join(meta_lines))
-                    body = "".join(lines).split("---\n")[-1]
-                    tag_list = metadata.get("tags", [])
-                    all_tags.update(tag_list)
-                    entries.append({
-                        "タイトル": metadata.get("title", "不明"),
-                        "日付": metadata.get("date", "不明"),
-                        "タグリスト": tag_list,
-                        "タグ表示": ", ".join(tag_list),
-                        "本文": body,
-                        "パス": file_path
-                    })
-
-        # --- フィルターUI ---
-        selected_tag = st.selectbox("タグで絞り込み", ["すべて"] + sorted(all_tags))
-        selected_date = st.date_input("日付で絞り込み（任意）", value=None)
-
-        # --- フィルター処理 ---
-        filtered_entries = []
-        for item in entries:
-            match_tag = (selected_tag == "すべて" or selected_tag in item["タグリスト"])
-            match_date = (not selected_date or item["日付"] == selected_date.strftime("%Y-%m-%d"))
-            if match_tag and match_date:
-                filtered_entries.append(item)
-
-        if not filtered_entries:
+        download_archive("📦 全記録をzipで書き出す（メタデータ＋添付ファイル）", exports.notes_archive, "qidt_notes.zip", "notes_zip")
+
+        # --- 全文検索・フィルター・並び順・ページサイズ ---
+        search_text = st.text_input("🔍 全文検索（タイトル・タグ・本文）", placeholder="例：反応場 QIDE")
+        col_tag, col_mode = st.columns([3, 1])
+        selected_tags = col_tag.multiselect("タグで絞り込み", entry_index.all_tags())
+        tag_mode = col_mode.radio("タグ条件", ["OR", "AND"], horizontal=True)
+        col_from, col_to = st.columns(2)
+        date_from = col_from.date_input("開始日（任意）", value=None)
+        date_to = col_to.date_input("終了日（任意）", value=None)
+        sort_labels = {"新しい順": "date_desc", "古い順": "date_asc", "タイトル順": "title"}
+        if search_text.strip():
+            sort_labels = {"関連度順": "rank", **sort_labels}
+        col_sort, col_size = st.columns(2)
+        sort_order = sort_labels[col_sort.selectbox("並び順", list(sort_labels))]
+        page_size = col_size.selectbox("1ページの件数", [10, 20, 50, 100], index=1)
+
+        filters = {
+            "tags": selected_tags,
+            "tag_mode": tag_mode.lower(),
+            "date_from": date_from.strftime("%Y-%m-%d") if date_from else None,
+            "date_to": date_to.strftime("%Y-%m-%d") if date_to else None,
+            "text": search_text.strip() or None,
+        }
+        with perf.section("一覧: 検索・件数"):
+            total = entry_index.count_entries(**filters)
+
+        if total == 0:
             st.warning("条件に一致する記録がありません。")
         else:
-            for item in filtered_entries[::-1]:
+            n_pages = (total + page_size - 1) // page_size
+            page = st.number_input(f"ページ（全 {n_pages} ページ / {total} 件）", min_value=1, max_value=n_pages, value=1)
+
+            # --- 表示中のページ分だけインデックスから取得 ---
+            for record in entry_index.query_entries(order=sort_order, limit=page_size, offset=(page - 1) * page_size, **filters):
+                item = {
+                    "タイトル": record["title"],
+                    "日付": record["date"],
+                    "タグリスト": record["tags"],
+                    "タグ表示": ", ".join(record["tags"]),
+                    "パス": record["path"]
+                }
                 st.markdown(f"### 🧾 {item['タイトル']}")
                 st.markdown(f"🗓 {item['日付']} | 🏷 {item['タグ表示']}")
-
-                with st.expander("📖 内容を表示 / 編集"):
+                if filters["text"]:
+                    excerpt = entry_index.snippet(entry_index.read_body(item["パス"], record["body_offset"]), filters["text"])
+                    if excerpt:
+                        st.caption(excerpt)
+
+                # --- 開いている1件だけ本文・編集UI・添付ファイルを組み立てる ---
+                if st.session_state.get("open_entry") != item["パス"]:
+                    st.button("📖 内容を表示 / 編集", key="open_"+item["パス"], on_click=open_entry, args=(item["パス"],))
+                else:
+                    st.button("📕 閉じる", key="close_"+item["パス"], on_click=close_entry)
+                    item["本文"] = entry_index.read_body(item["パス"], record["body_offset"])
                     mode = st.radio("表示モード", ["読む", "編集する"], key=item["パス"])
 
                     if mode == "読む":
+                        reload_entry(item["パス"])
                         st.markdown(item["本文"])
                     else:
                         new_title = st.text_input("タイトル", value=item["タイトル"], key="title_"+item["パス"])
                         new_body = st.text_area("本文", value=item["本文"], height=300, key="body_"+item["パス"])
                         new_tags = st.text_input("タグ（カンマ区切り）", value=item["タグ表示"], key="tag_"+item["パス"])
 
+                        st.session_state.setdefault("base_"+item["パス"], record["mtime_ns"])
                         if st.button("保存する", key="save_"+item["パス"]):
                             metadata = {
                                 "title": new_title,
                                 "date": item["日付"],
                                 "tags": [t.strip() for t in new_tags.split(",") if t.strip()]
                             }
-                            with open(item["パス"], "w") as f:
-                                f.write("---\n")
-                                yaml.dump(metadata, f)
-                                f.write("---\n\n")
-                                f.write(new_body)
-                            st.success("✅ 上書き保存しました")
-
-                    # --- 添付ファイルの表示 ---
-                    file_dir = os.path.join(os.path.dirname(item["パス"]), item["タイトル"].replace(" ", "_"))
-                    if os.path.exists(file_dir):
+                            save_edit(item["パス"], metadata, new_body)
+                        if st.session_state.get("conflict_"+item["パス"]):
+                            st.error("⚠️ 編集を開いた後に他のセッションがこの記録を更新したため、保存しませんでした。")
+                            st.button("🔄 最新の内容を読み込む（入力中の変更は破棄）", key="reload_"+item["パス"], on_click=reload_entry, args=(item["パス"],))
+
+                    # --- 添付ファイルの表示（テキストは展開を選んだものだけ読む） ---
+                    # ブロブストアの参照と、まだ移行していない添付フォルダの両方を見る
+                    file_dir = os.path.splitext(item["パス"])[0]
+                    attached = {r["name"]: r["size"] for r in blobs.refs(file_dir)}
+                    if os.path.isdir(file_dir):
+                        attached.update((e.name, e.stat().st_size) for e in os.scandir(file_dir) if e.is_file())
+                    if attached:
                         st.markdown("📎 添付ファイル：")
-                        for file_name in os.listdir(file_dir):
+                        for file_name, file_size in sorted(attached.items()):
                             file_path = os.path.join(file_dir, file_name)
                             ext = file_name.split(".")[-1].lower()
-                            if ext in ["png", "jpg", "jpeg"]:
-                                st.image(file_path, caption=file_name, use_column_width=True)
-                            else:
-                                with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                                    file_content = f.read()
-
-                                with st.expander(f"📥 {file_name}（クリックで展開）"):
-                                    st.code(file_content, language="text")
+                            if ext in attachments.IMAGE_EXTENSIONS:
+                                show_image(blobs.resolve(file_path), file_name, file_path)
+                            elif st.checkbox(f"📥 {file_name}（{attachments.format_size(file_size)}・クリックで展開）", key="attach_"+file_path):
+                                if file_size <= attachments.PREVIEW_MAX_BYTES:
+                                    st.code(attachments.read_text(blobs.resolve(file_path)), language="text")
+                                else:
+                                    show_large_attachment(blobs.resolve(file_path))
 
                 # 🗑 削除ボタン（確認付き）
                 if st.button("🗑 この記録を削除する", key="delete_"+item["パス"]):
                     try:
-                        os.remove(item["パス"])  # .mdファイル削除
+                        storage.remove_locked(item["パス"])  # .mdファイル削除
+                        entry_index.remove_entry(item["パス"])
+                        close_entry()
 
-                        # 添付ファイルフォルダ削除（あれば）
-                        file_dir = os.path.join(os.path.dirname(item["パス"]), item["タイトル"].replace(" ", "_"))
+                        # 添付の参照を外し（他の記録が使っていないブロブだけ消える）、移行前のフォルダがあれば削除
+                        file_dir = os.path.splitext(item["パス"])[0]
+                        blobs.release(file_dir)
                         if os.path.exists(file_dir):
                             import shutil
                             shutil.rmtree(file_dir)
@@ -329,99 +550,112 @@ elif tab == "📚 一覧":
                 st.markdown("---")
 
 elif tab == "📊 構造別結果":
-    from pathlib import Path
+    import results_store
 
     st.subheader("構造別の計算結果記録")
+    startup.record_paint(st.session_state, tab, script_start, "first_paint")
+
+    # --- 計算出力ファイルからの自動入力 ---
+    def fill_structure_form(values):
+        for key, value in values.items():
+            st.session_state["form_"+key] = value
+
+    def register_parsed(values, name, notes):
+        results_store.save_result(results_store.record_from_values(values, name, notes))
+        st.session_state["parsed_registered"] = name
+
+    with st.expander("📄 計算出力ファイル（ORCA / Gaussian）から自動入力"):
+        parsed, parsed_source = choose_output("構造（界面全体）の出力ファイル", "total")
+        parsed_sub, _ = choose_output("基板の出力ファイル（E_substrate、任意）", "substrate")
+        parsed_mol, _ = choose_output("分子の出力ファイル（E_molecule、任意）", "molecule")
+
+        if parsed is not None:
+            parsed_values = qc_parser.structure_values(parsed, parsed_sub, parsed_mol)
+            st.caption(f"{parsed['program']} の出力から {len(parsed_values)} 項目、振動数 {len(parsed['frequencies'])} 本を抽出しました")
+            st.table({"項目": list(parsed_values), "値": [f"{v:.6f}" for v in parsed_values.values()]})
+
+            col_fill, col_register = st.columns(2)
+            col_fill.button("⬇️ フォームに反映", on_click=fill_structure_form, args=(parsed_values,))
+            parsed_name = col_register.text_input("構造名（直接登録する場合）", key="parsed_name")
+            col_register.button(
+                "💾 この内容で直接登録", disabled=not parsed_name,
+                on_click=register_parsed, args=(parsed_values, parsed_name, f"{parsed['program']} 出力から登録: {parsed_source}")
+            )
+        if "parsed_registered" in st.session_state:
+            st.success(f"✅ 構造 `{st.session_state.pop('parsed_registered')}` を出力ファイルから登録しました")
 
     # --- 入力フォーム ---
     with st.form("structure_form"):
         col1, col2 = st.columns(2)
         with col1:
             structure_name = st.text_input("構造名（例：MMA-MAA Dimer）")
-            scf_energy = st.number_input("SCFエネルギー [au]", format="%.6f")
-            homo = st.number_input("HOMO [au]", format="%.6f")
-            lumo = st.number_input("LUMO [au]", format="%.6f")
-            mulliken_max = st.number_input("Mulliken最大電荷", format="%.6f")
-            mulliken_min = st.number_input("Mulliken最小電荷", format="%.6f")
-            e_total = st.number_input("E_total (界面全体エネルギー) [au]", format="%.6f")
-            e_sub = st.number_input("E_substrate [au]", format="%.6f")
-            e_mol = st.number_input("E_molecule [au]", format="%.6f")
-            dipole = st.number_input("双極子モーメント [Debye]", format="%.6f")
+            scf_energy = st.number_input("SCFエネルギー [au]", format="%.6f", key="form_SCFエネルギー")
+            homo = st.number_input("HOMO [au]", format="%.6f", key="form_HOMO")
+            lumo = st.number_input("LUMO [au]", format="%.6f", key="form_LUMO")
+            mulliken_max = st.number_input("Mulliken最大電荷", format="%.6f", key="form_Mulliken最大")
+            mulliken_min = st.number_input("Mulliken最小電荷", format="%.6f", key="form_Mulliken最小")
+            e_total = st.number_input("E_total (界面全体エネルギー) [au]", format="%.6f", key="form_E_total")
+            e_sub = st.number_input("E_substrate [au]", format="%.6f", key="form_E_substrate")
+            e_mol = st.number_input("E_molecule [au]", format="%.6f", key="form_E_molecule")
+            dipole = st.number_input("双極子モーメント [Debye]", format="%.6f", key="form_双極子モーメント")
         with col2:
             notes = st.text_area("自由記述（電荷分布、反応性など）")
             image_file = st.file_uploader("構造画像（PNGまたはJPG）", type=["png", "jpg", "jpeg"])
 
         submitted = st.form_submit_button("保存")
         if submitted and structure_name:
-            mu = - (homo + lumo) / 2
-            qide = e_total - e_sub - e_mol
-
-            if "Trimer" in structure_name:
-                tag = "Trimer"
-            elif "Dimer" in structure_name:
-                tag = "Dimer"
-            elif "Tetramer" in structure_name:
-                tag = "Tetramer"
-            else:
-                tag = "Other"
-
-            save_dir = Path(f"results/{structure_name.replace(' ', '_')}")
-            save_dir.mkdir(parents=True, exist_ok=True)
-
-            metadata = {
+            metadata = results_store.derive({
                 "構造名": structure_name,
-                "タグ": tag,
                 "SCFエネルギー": scf_energy,
                 "HOMO": homo,
                 "LUMO": lumo,
-                "μ": mu,
                 "双極子モーメント": dipole,
                 "Mulliken最大": mulliken_max,
                 "Mulliken最小": mulliken_min,
                 "E_total": e_total,
                 "E_substrate": e_sub,
                 "E_molecule": e_mol,
-                "QIDE": qide,
                 "メモ": notes
-            }
-            with open(save_dir / "data.yaml", "w") as f:
-                yaml.dump(metadata, f)
+            })
 
+            image_path = None
             if image_file:
-                with open(save_dir / "structure.png", "wb") as f:
-                    f.write(image_file.read())
+                save_dir = results_store.structure_dir(structure_name)
+                save_dir.mkdir(parents=True, exist_ok=True)
+                image_path = str(save_dir / "structure.png")
+                attachments.save_upload(image_file, image_path)
 
+            results_store.save_result(metadata, image=image_path)
             st.success(f"✅ 構造 `{structure_name}` を保存しました")
 
     # --- 一覧表示 ---
     st.markdown("---")
     st.subheader("構造別の記録一覧（表形式）")
 
-    from glob import glob
-    import pandas as pd
-    import matplotlib.pyplot as plt
-    import seaborn as sns
-    from sklearn.cluster import KMeans
-
-    rows = []
-    for folder in glob("results/*/"):
-        meta_path = Path(folder) / "data.yaml"
-        img_path = Path(folder) / "structure.png"
-        if meta_path.exists():
-            with open(meta_path, "r") as f:
-                data = yaml.safe_load(f)
-            row = data
-            row["画像"] = img_path if img_path.exists() else None
-            row["パス"] = meta_path
-            rows.append(row)
-
-    if rows:
-        display_keys = ["構造名", "タグ", "SCFエネルギー", "HOMO", "LUMO", "μ", "双極子モーメント", "Mulliken最大", "Mulliken最小", "E_total", "E_substrate", "E_molecule", "QIDE", "メモ"]
-        df = pd.DataFrame([{k: r.get(k, '') for k in display_keys} for r in rows])
+    with perf.section("構造別結果: モジュール読み込み"):
+        import pandas as pd
+
+    # --- ストアからの読み込み（書き込み番号が変わるまでメモ化） ---
+    @st.cache_data(max_entries=4, show_spinner=False)
+    def load_results(version):
+        return results_store.load_frame()
+
+    with perf.section("構造別結果: 読み込み"):
+        if not results_store.yaml_migrated():
+            run_job("migrate_yaml", (os.path.abspath(results_store.RESULTS_DIR),), results_store.migrate_yaml,
+                    label="results/ の data.yaml の取り込み", reuse=False)
+        df_all = load_results(results_store.data_version())
+
+    if not df_all.empty:
+        display_keys = results_store.DISPLAY_KEYS
+        df = df_all[display_keys]
         st.dataframe(df, use_container_width=True)
 
-        csv = df.to_csv(index=False).encode("utf-8")
-        st.download_button("📤 CSVとしてエクスポート", data=csv, file_name="qidt_structures.csv", mime="text/csv")
+        version = results_store.data_version()
+        download_frame("📤 表をエクスポート", ("results", version),
+                       lambda: load_results(version)[display_keys], "qidt_structures", "results", sheet_name="構造別結果")
+        download_archive("📦 全構造をzipで書き出す（表＋構造画像）",
+                         lambda: exports.results_archive(load_results(version)), "qidt_structures.zip", "results_zip")
 
         st.markdown("---")
         st.subheader("構造特性の散布図（項目選択＋タグ色分け）")
@@ -429,77 +663,232 @@ elif tab == "📊 構造別結果":
         x_axis = st.selectbox("X軸を選択", options=numeric_columns, index=0)
         y_axis = st.selectbox("Y軸を選択", options=numeric_columns, index=1 if len(numeric_columns) > 1 else 0)
 
+        # --- 描画結果のキャッシュ（データ版数・軸・ラベル対象で再利用） ---
+        @st.cache_data(max_entries=32, show_spinner=False)
+        def label_mask_for(version, x_axis, y_axis, max_labels, selected):
+            import plots
+            return plots.label_mask(load_results(version), x_axis, y_axis, max_labels, selected)
+
+        @st.cache_data(max_entries=16, show_spinner="散布図を描画中…")
+        def scatter_png_for(version, x_axis, y_axis, max_labels, selected):
+            import plots
+            mask = label_mask_for(version, x_axis, y_axis, max_labels, selected)
+            return plots.scatter_png(load_results(version), x_axis, y_axis, mask)
+
         try:
-            fig, ax = plt.subplots()
-            tags = df["タグ"].unique()
-            colors = sns.color_palette("husl", len(tags))
-            for tag, color in zip(tags, colors):
-                subset = df[df["タグ"] == tag]
-                ax.scatter(subset[x_axis], subset[y_axis], label=tag, color=color)
-                for i in subset.index:
-                    ax.annotate(subset["構造名"][i], (subset[x_axis][i], subset[y_axis][i]), fontsize=8)
-            ax.set_xlabel(x_axis)
-            ax.set_ylabel(y_axis)
-            ax.set_title(f"{y_axis} vs {x_axis} by タグ")
-            ax.legend()
-            st.pyplot(fig)
+            import plots
+
+            version = results_store.data_version()
+            col_mode, col_labels = st.columns([2, 1])
+            render_mode = col_mode.radio("表示方法", ["インタラクティブ（ホバーで構造名）", "静止画（PNG）"], horizontal=True)
+            max_labels = col_labels.number_input("名前を表示する点の上限", min_value=0, max_value=500, value=plots.MAX_LABELS, step=10)
+            selected = tuple(sorted(st.multiselect("必ず名前を表示する構造", options=df["構造名"].tolist())))
+            mask = label_mask_for(version, x_axis, y_axis, int(max_labels), selected)
+            if len(df) > max_labels:
+                st.caption(f"{len(df)} 点中 {int(mask.sum())} 点に名前を表示（外れ値＋選択した構造）")
+
+            with perf.section("構造別結果: 散布図"):
+                if render_mode.startswith("インタラクティブ"):
+                    st.altair_chart(plots.scatter_chart(df, x_axis, y_axis, mask), use_container_width=True)
+                else:
+                    st.image(scatter_png_for(version, x_axis, y_axis, int(max_labels), selected))
         except Exception as e:
             st.warning("⚠️ 散布図を描画できませんでした。")
 
         st.markdown("---")
         st.subheader("クラスタリング（KMeans）")
+
+        # --- クラスタリング結果のメモ化（データ版数・特徴量・k・標準化の有無で再利用） ---
+        @st.cache_data(max_entries=32, show_spinner="クラスタリング中…")
+        def run_clustering(version, features, n_clusters, scale):
+            import clustering
+            data = clustering.add_derived(load_results(version))
+            X, index = clustering.prepare(data, features, scale)
+            labels, inertia = clustering.fit(X, n_clusters)
+            coords, explained = clustering.pca_2d(X) if len(features) > 2 else (X, None)
+            return index, labels, inertia, coords, explained
+
+        def k_sweep_job(features, k_range, scale, progress=None):
+            import clustering
+            data = clustering.add_derived(results_store.load_frame())
+            X, _ = clustering.prepare(data, features, scale)
+            return clustering.sweep(X, range(k_range[0], k_range[1] + 1), progress=progress)
+
         try:
-            n_clusters = st.slider("クラスタ数を選択", min_value=2, max_value=6, value=3)
-            clustering_data = df[[x_axis, y_axis]].dropna()
-            kmeans = KMeans(n_clusters=n_clusters, n_init=10)
-            clusters = kmeans.fit_predict(clustering_data)
-            df_clust = clustering_data.copy()
-            df_clust["Cluster"] = clusters
-
-            fig2, ax2 = plt.subplots()
-            palette = sns.color_palette("Set2", n_clusters)
-            for cl in range(n_clusters):
-                cluster_data = df_clust[df_clust["Cluster"] == cl]
-                ax2.scatter(cluster_data[x_axis], cluster_data[y_axis], label=f"Cluster {cl+1}", color=palette[cl])
-            ax2.set_xlabel(x_axis)
-            ax2.set_ylabel(y_axis)
-            ax2.set_title(f"クラスタリング結果: {y_axis} vs {x_axis}")
-            ax2.legend()
-            st.pyplot(fig2)
+            import clustering
+            import matplotlib.pyplot as plt
+            import seaborn as sns
+
+            version = results_store.data_version()
+            feature_options = numeric_columns + list(clustering.DERIVED_FEATURES)
+            features = tuple(st.multiselect(
+                "クラスタリングに使う特徴量", options=feature_options,
+                default=list(dict.fromkeys([x_axis, y_axis]))
+            ))
+            col_k, col_scale = st.columns([3, 1])
+            n_clusters = col_k.slider("クラスタ数を選択", min_value=2, max_value=15, value=st.session_state.get("best_k", 3))
+            scale = col_scale.checkbox("標準化する", value=True)
+
+            if not features:
+                st.info("特徴量を1つ以上選択してください。")
+            else:
+                # --- k の自動選択（シルエット係数・慣性を並列に評価） ---
+                with st.expander("🔎 k の自動選択（シルエット係数）"):
+                    k_range = st.slider("評価する k の範囲", min_value=2, max_value=15, value=(2, 8))
+                    if st.button("k をスイープする"):
+                        st.session_state["k_sweep"] = (version, features, k_range, scale)
+                    if st.session_state.get("k_sweep") == (version, features, k_range, scale):
+                        scores = run_job("k_sweep", (version, features, k_range, scale), k_sweep_job,
+                                         features, k_range, scale, label="k のスイープ")
+                        if scores:
+                            best = clustering.best_k(scores)
+                            st.dataframe(pd.DataFrame(scores).set_index("k"), use_container_width=True)
+                            st.line_chart(pd.DataFrame(scores).set_index("k")["silhouette"])
+                            if best is not None:
+                                st.caption(f"シルエット係数が最大の k = {best}")
+                                if st.button(f"k = {best} を使う"):
+                                    st.session_state["best_k"] = best
+                                    st.rerun()
+                        elif scores is not None:
+                            st.info(f"構造が少ないため、k = {k_range[0]}〜{k_range[1]} はどれも評価できません"
+                                    "（k は特徴量がそろった構造の数より小さくしてください）。")
+
+                with perf.section("構造別結果: クラスタリング"):
+                    index, clusters, inertia, coords, explained = run_clustering(version, features, n_clusters, scale)
+                if explained is not None:
+                    x_label = f"PC1 ({explained[0]:.0%})"
+                    y_label = f"PC2 ({explained[1]:.0%})" if len(explained) > 1 else "PC2"
+                elif len(features) == 1:
+                    x_label, y_label = features[0], features[0]
+                    coords = coords[:, [0, 0]]
+                else:
+                    x_label, y_label = features[0], features[1]
+                if scale and explained is None:
+                    x_label, y_label = f"{x_label}（標準化）", f"{y_label}（標準化）"
+
+                fig2, ax2 = plt.subplots()
+                palette = sns.color_palette("Set2", n_clusters)
+                for cl in range(n_clusters):
+                    mask = clusters == cl
+                    ax2.scatter(coords[mask, 0], coords[mask, 1], label=f"Cluster {cl+1}", color=palette[cl])
+                ax2.set_xlabel(x_label)
+                ax2.set_ylabel(y_label)
+                ax2.set_title(f"クラスタリング結果（{len(index)} 構造, inertia = {inertia:.3g}）")
+                ax2.legend()
+                with perf.section("構造別結果: クラスタ図の描画"):
+                    st.pyplot(fig2)
         except Exception as e:
-            st.warning("⚠️ クラスタリングに失敗しました。")
+            st.warning(f"⚠️ クラスタリングに失敗しました: {e}")
+
+        st.markdown("---")
+        st.subheader("反応（QIDT-Reaction: S → TS → P）")
+        import reactions
+
+        # --- 反応表（構造・反応の版数が変わったとき、変わった反応だけ再計算） ---
+        @st.cache_data(max_entries=8, show_spinner=False)
+        def load_reactions(version, unit):
+            return reactions.load_table(unit)
+
+        def add_reaction():
+            try:
+                reactions.save_reaction(st.session_state["rx_name"], st.session_state["rx_s"], st.session_state["rx_p"],
+                                        st.session_state["rx_ts"] or None, st.session_state["rx_notes"])
+                st.session_state["rx_message"] = ("success", f"✅ 反応 `{st.session_state['rx_name']}` を保存しました")
+            except ValueError as e:
+                st.session_state["rx_message"] = ("error", f"⚠️ {e}")
+
+        with st.expander("➕ 反応を登録する"):
+            names = df_all["構造名"].tolist()
+            st.text_input("反応名", key="rx_name")
+            col_s, col_ts, col_p = st.columns(3)
+            col_s.selectbox("反応物 (S)", names, key="rx_s")
+            col_ts.selectbox("遷移状態 (TS・任意)", [""] + names, key="rx_ts")
+            col_p.selectbox("生成物 (P)", names, key="rx_p")
+            st.text_input("メモ", key="rx_notes")
+            st.button("反応を保存", on_click=add_reaction)
+            rx_csv = st.file_uploader("CSVで一括登録（列: 反応名, S, TS, P, メモ）", type=["csv"], key="rx_csv")
+            if rx_csv is not None and st.button("CSVの反応を登録"):
+                try:
+                    rows = pd.read_csv(rx_csv).rename(columns=reactions.CSV_ALIASES).to_dict("records")
+                    st.success(f"✅ {reactions.save_reactions(rows)} 件の反応を登録しました")
+                except (ValueError, KeyError) as e:
+                    st.error(f"⚠️ 登録できませんでした: {e}")
+        if "rx_message" in st.session_state:
+            kind, message = st.session_state.pop("rx_message")
+            getattr(st, kind)(message)
+
+        unit = st.radio("エネルギーの単位", list(reactions.UNITS), index=1, horizontal=True, key="rx_unit")
+        with perf.section("構造別結果: 反応表"):
+            df_rx = load_reactions(reactions.data_version(), unit)
+        if df_rx.empty:
+            st.info("反応はまだ登録されていません。")
+        else:
+            col_sort, col_order = st.columns([3, 1])
+            sort_key = col_sort.selectbox("並べ替え", [c for c in df_rx.columns if c not in ("S", "TS", "P", "メモ")],
+                                          index=2, key="rx_sort")
+            ascending = col_order.checkbox("昇順", value=True, key="rx_ascending")
+            st.dataframe(df_rx.sort_values(sort_key, ascending=ascending, na_position="last"),
+                         use_container_width=True, hide_index=True)
+            if df_rx["見つからない構造"].fillna("").str.len().any():
+                st.caption("「見つからない構造」がある反応は、その構造が削除・改名されたため差分を計算できません。")
+            rx_version = reactions.data_version()
+            download_frame("📤 反応表をエクスポート", ("reactions", rx_version, unit),
+                           lambda: load_reactions(rx_version, unit), "qidt_reactions", "reactions", sheet_name="反応")
+            col_del, col_btn = st.columns([3, 1])
+            rx_delete = col_del.selectbox("削除する反応", df_rx["反応名"].tolist(), key="rx_delete")
+            if col_btn.button("🗑 反応を削除"):
+                reactions.delete_reaction(rx_delete)
+                st.rerun()
 
         st.markdown("---")
         st.subheader("構造別の詳細表示・編集")
 
-        for row in rows:
-            with st.expander(f"🧬 {row['構造名']}"):
+        def reload_result(name):
+            for key in ["rev_", "memo_"] + [f"{label}_" for label in results_store.NUMERIC_KEYS]:
+                st.session_state.pop(key + name, None)
+
+        # --- 選んだ構造だけを組み立てる（件数が増えても描画量は一定） ---
+        chosen = st.selectbox("構造を選択", df_all["構造名"].tolist())
+        for row in df_all[df_all["構造名"] == chosen].to_dict("records"):
+            with st.expander(f"🧬 {row['構造名']}", expanded=True):
                 mode = st.radio("モード", ["表示", "編集"], key=f"mode_{row['構造名']}")
 
                 if mode == "表示":
+                    reload_result(row["構造名"])
                     for key in display_keys:
                         st.write(f"**{key}**: {row.get(key, '')}")
                     if row["画像"]:
-                        st.image(str(row["画像"]), caption="構造画像", use_container_width=True)
+                        show_image(str(row["画像"]), "構造画像", f"image_{row['構造名']}")
                 else:
                     new_values = {}
                     for key in ["SCFエネルギー", "HOMO", "LUMO", "Mulliken最大", "Mulliken最小", "E_total", "E_substrate", "E_molecule", "双極子モーメント"]:
-                        new_values[key] = st.number_input(key, value=float(row.get(key, 0.0)), format="%.6f", key=f"{key}_{row['構造名']}")
-                    new_values["μ"] = - (new_values["HOMO"] + new_values["LUMO"]) / 2
+                        value = row.get(key)
+                        # 未取得の値は空欄のまま（0 を入れると μ・QIDE が偽の値になる）
+                        new_values[key] = st.number_input(key, value=None if pd.isna(value) else float(value), format="%.6f", key=f"{key}_{row['構造名']}")
                     new_values["構造名"] = row["構造名"]
-                    new_values["タグ"] = row.get("タグ", "Other")
-                    new_values["QIDE"] = new_values["E_total"] - new_values["E_substrate"] - new_values["E_molecule"]
-                    new_values["メモ"] = st.text_area("メモ", value=row.get("メモ", ""), key=f"memo_{row['構造名']}")
+                    new_values["タグ"] = row.get("タグ") or "Other"
+                    new_values["メモ"] = st.text_area("メモ", value=row.get("メモ") or "", key=f"memo_{row['構造名']}")
 
+                    # 編集を開いた時点の更新番号（他のセッションの保存を上書きしない）
+                    base_key = f"rev_{row['構造名']}"
+                    st.session_state.setdefault(base_key, int(row["更新番号"]))
                     if st.button("保存", key=f"save_{row['構造名']}"):
-                        with open(row["パス"], "w") as f:
-                            yaml.dump(new_values, f)
-                        st.success("✅ 上書き保存しました。再読み込みしてください。")
+                        try:
+                            st.session_state[base_key] = results_store.save_result(
+                                results_store.derive(new_values), expected_revision=st.session_state[base_key])
+                            st.success("✅ 上書き保存しました。")
+                        except storage.ConflictError:
+                            st.error("⚠️ 編集を開いた後に他のセッションがこの構造を更新（または削除）したため、保存しませんでした。")
+                            st.button("🔄 最新の値を読み込む（入力中の変更は破棄）", key=f"reload_{row['構造名']}",
+                                      on_click=reload_result, args=(row["構造名"],))
 
                 if st.button(f"🗑 削除する：{row['構造名']}", key=f"delete_{row['構造名']}"):
                     import shutil
                     try:
-                        shutil.rmtree(f"results/{row['構造名'].replace(' ', '_')}")
+                        results_store.delete_result(row["構造名"])
+                        save_dir = results_store.structure_dir(row["構造名"])
+                        if save_dir.exists():
+                            shutil.rmtree(save_dir)
                         st.success(f"✅ 「{row['構造名']}」を削除しました。ページを再読み込みしてください。")
                     except Exception as e:
                         st.error(f"⚠️ 削除できませんでした: {e}")
@@ -509,57 +898,396 @@ elif tab == "📊 構造別結果":
         st.info("まだ構造別の記録がありません。")
 
 elif tab == "📉 IRスペクトル可視化":
-    import pandas as pd
-    import numpy as np
-    import matplotlib.pyplot as plt
-
     st.subheader("IR Spectrum Simulator")
+    startup.record_paint(st.session_state, tab, script_start, "first_paint")
+
+    with perf.section("IR: モジュール読み込み"):
+        import numpy as np
+        import pandas as pd
+        import matplotlib.pyplot as plt
+        import ir
+
+    # --- ブロードニング結果のキャッシュ（ピークデータのハッシュ・線形・σ・グリッドで再利用） ---
+    @st.cache_data(max_entries=64, show_spinner=False)
+    def broaden_spectrum(peak_hash, _freqs, _intensities, lineshape, sigma, eta, scale, grid):
+        x = ir.make_grid(*grid)
+        return x, ir.broaden(_freqs, _intensities, x, sigma=sigma, lineshape=lineshape, eta=eta, scale=scale)
+
+    def broaden_batch(peak_lists, lineshape, sigma, eta, scale, grid, progress=None):
+        x = ir.make_grid(*grid)
+        return x, ir.broaden_many(peak_lists, x, progress=progress, sigma=sigma, lineshape=lineshape, eta=eta, scale=scale)
+
+    # --- スペクトルライブラリ（保存・構造/記録との紐付け・類似検索） ---
+    import spectral_library
+
+    @st.cache_data(max_entries=4, show_spinner=False)
+    def library_links(results_version):
+        import results_store
+        structures = results_store.load_frame()["構造名"].tolist()
+        entry_index.sync_index()
+        notes = {f"{r['date']} {r['title']}": r["path"] for r in entry_index.query_entries(order="date_desc", limit=500)}
+        return structures, notes
+
+    @st.cache_data(max_entries=16, show_spinner="ライブラリを検索中…")
+    def search_library(version, query_hash, _x, _y, method, top, max_shift):
+        return spectral_library.search(_x, _y, method, top, max_shift)
+
+    def save_to_library(spectra, key, info):
+        # spectra: [(名前, x, y)]。複数のときは構造名と同じ名前のスペクトルを自動で結び付ける
+        import results_store
+        structures, notes = library_links(results_store.data_version())
+        col_structure, col_note = st.columns(2)
+        if len(spectra) == 1:
+            structure = col_structure.selectbox("結び付ける構造", [""] + structures, key=f"lib_structure_{key}")
+        else:
+            structure = None
+            col_structure.caption("構造名と同じ名前のスペクトルは、その構造に結び付けます。")
+        note = col_note.selectbox("結び付ける記録", [""] + list(notes), key=f"lib_note_{key}")
+        if st.button("📚 ライブラリに保存", key=f"lib_save_{key}"):
+            known = set(structures)
+            items = [{"name": name, "x": x, "y": y, "structure": structure or (name if name in known else None),
+                      "note": notes.get(note), **info} for name, x, y in spectra]
+            with perf.section("IR: ライブラリ保存"):
+                ids = spectral_library.add_spectra(items)
+            st.success(f"✅ {len(ids)} 本をライブラリに保存しました（id: {', '.join(map(str, ids[:10]))}{' …' if len(ids) > 10 else ''}）")
+
+    def show_library_search():
+        source = st.radio("検索するスペクトル", ["ピークCSV（ブロードニングして比較）", "連続スペクトルCSV（波数, 強度）",
+                                             "計算出力ファイル（ORCA / Gaussian）"], horizontal=True)
+        query = None
+        if source == "計算出力ファイル（ORCA / Gaussian）":
+            parsed, _ = choose_output("出力ファイル", "ir_library")
+            if parsed is not None and parsed["frequencies"]:
+                freqs, intensities = np.asarray(parsed["frequencies"]), np.asarray(parsed["intensities"])
+                query = broaden_spectrum(ir.peaks_hash(freqs, intensities), freqs, intensities, lineshape, sigma, eta, scale, grid)
+        else:
+            uploaded = st.file_uploader("CSVファイル（1列目 = 波数、2列目 = 強度）", type="csv", key="library_query")
+            if uploaded is not None:
+                a, b = ir.read_peaks(uploaded)
+                if source.startswith("ピーク"):
+                    query = broaden_spectrum(ir.peaks_hash(a, b), a, b, lineshape, sigma, eta, scale, grid)
+                else:
+                    query = (a, b)
+
+        col_method, col_top, col_shift = st.columns(3)
+        method = col_method.selectbox("類似度", list(spectral_library.METHODS), format_func=spectral_library.METHODS.get)
+        top = col_top.number_input("表示件数", min_value=1, max_value=500, value=20)
+        max_shift = col_shift.slider("許容するずれ (cm⁻¹)", 1, 100, 20) if method == "shifted" else 20
+        version = spectral_library.data_version()
+        if query is None:
+            st.info("検索するスペクトルを指定してください。")
+            return
+        with perf.section("IR: ライブラリ検索"):
+            hits = search_library(version, ir.peaks_hash(*query), query[0], query[1], method, int(top), float(max_shift))
+        if hits.empty:
+            st.info("ライブラリは空です。単一・バッチモードでスペクトルを保存してください。")
+            return
+        st.dataframe(hits, use_container_width=True, hide_index=True)
+
+        # --- クエリと上位スペクトルを重ねて表示（最大強度で規格化） ---
+        x_lib = spectral_library.grid()
+        shown = hits.head(5)
+        rows = ir.normalize(spectral_library.spectra_rows(shown["id"]).astype(np.float64))
+        fig, ax = plt.subplots(figsize=(8, 4))
+        ax.plot(x_lib, ir.normalize(spectral_library.to_row(*query)[None, :].astype(np.float64))[0], color="black", lw=2, label="query")
+        for (_, hit), row in zip(shown.iterrows(), rows):
+            ax.plot(x_lib, row, lw=1.0, label=f"{hit['名前']} ({hit['類似度']:.3f})")
+        ax.set_xlabel("Wavenumber (cm⁻¹)")
+        ax.set_ylabel("Normalized intensity")
+        ax.invert_xaxis()
+        ax.grid(True)
+        ax.legend(fontsize=7)
+        with perf.section("IR: 図の描画"):
+            st.pyplot(fig)
+
+    def show_library_manager():
+        with st.expander("🗂 ライブラリの管理"):
+            library = spectral_library.list_spectra()
+            st.caption(f"{len(library)} 本（共通グリッド {spectral_library.GRID[0]:.0f}–{spectral_library.GRID[1]:.0f} cm⁻¹, "
+                       f"{spectral_library.GRID[2]} 点, float32）")
+            st.dataframe(library.drop(columns=["mean", "created_at"]).tail(200), use_container_width=True, hide_index=True)
+            delete_ids = st.text_input("削除する id（カンマ区切り）", key="library_delete")
+            if st.button("🗑 ライブラリから削除") and delete_ids.strip():
+                try:
+                    spectral_library.delete_spectra([int(v) for v in delete_ids.split(",") if v.strip()])
+                    st.success("✅ 削除しました。")
+                except ValueError:
+                    st.error("⚠️ id は整数で指定してください。")
+
     st.markdown("""
-    このセクションでは、アップロードされたCSVファイルの離散的なIRピークデータをガウス関数で平滑化し、連続的なスペクトルとして表示します。  
+    このセクションでは、アップロードされたCSVファイルの離散的なIRピークデータをガウス・ローレンツ・pseudo-Voigt関数で平滑化し、連続的なスペクトルとして表示します。  
     **CSV形式：1列目 = 波数 (cm⁻¹)、2列目 = 強度 (km/mol)** を想定。
     """)
 
-    uploaded_file = st.file_uploader("IRデータのCSVファイルをアップロードしてください", type="csv")
-    if uploaded_file is not None:
+    ir_mode = st.radio("モード", ["単一スペクトル", "バッチ比較（複数CSV）", "ライブラリ検索"], horizontal=True)
+
+    # --- ブロードニング条件（単一・バッチ共通） ---
+    with st.expander("⚙️ ブロードニング条件", expanded=True):
+        lineshape = st.selectbox("線形", ir.LINESHAPES)
+        sigma = st.slider("ガウス平滑化幅 σ (cm⁻¹)", 1, 50, 10)
+        eta = st.slider("Lorentz成分の割合 η（pseudo-Voigtのみ）", 0.0, 1.0, 0.5) if lineshape == "pseudo-Voigt" else 0.5
+        scale = st.number_input("振動数スケーリング係数", value=1.0, min_value=0.5, max_value=1.5, step=0.001, format="%.4f")
+        col_min, col_max, col_n = st.columns(3)
+        x_min = col_min.number_input("波数下限 (cm⁻¹)", value=400.0, step=50.0)
+        x_max = col_max.number_input("波数上限 (cm⁻¹)", value=4000.0, step=50.0)
+        n_points = col_n.number_input("グリッド点数", value=5000, min_value=100, max_value=200000, step=500)
+    if x_min >= x_max:
+        st.error("⚠️ 波数下限は上限より小さくしてください。")
+        st.stop()
+    grid = (x_min, x_max, int(n_points))
+
+    if ir_mode == "単一スペクトル":
+        # --- 入力：CSV、または計算出力ファイルの振動解析結果 ---
+        ir_source = st.radio("入力", ["CSVファイル", "計算出力ファイル（ORCA / Gaussian）"], horizontal=True)
+        df = None
         try:
-            df = pd.read_csv(uploaded_file, header=None, names=["freq", "intensity"])
-            st.dataframe(df.head())
-
-            x = np.linspace(400, 4000, 5000)
-            y = np.zeros_like(x)
-            sigma = st.slider("ガウス平滑化幅 σ (cm⁻¹)", 1, 50, 10)
-
-            def gaussian(x, mu, sigma):
-                return np.exp(-((x - mu) ** 2) / (2 * sigma ** 2))
-
-            for _, row in df.iterrows():
-                y += row["intensity"] * gaussian(x, row["freq"], sigma)
-
-            # スペクトルの描画
-            fig, ax = plt.subplots(figsize=(8, 4))
-            ax.plot(x, y, color="blue", lw=2)
-            ax.set_xlabel("Wavenumber (cm⁻¹)")
-            ax.set_ylabel("Intensity (a.u.)")
-            ax.set_title("Simulated IR Spectrum")
-            ax.invert_xaxis()
-            ax.grid(True)
-            st.pyplot(fig)
-
-            # 名前をつけて保存
-            spectrum_name = st.text_input("保存ファイル名（例：sample_spectrum）", value="spectrum")
-            result_df = pd.DataFrame({
-                "Wavenumber (cm⁻¹)": x,
-                "Intensity (a.u.)": y
-            })
-            csv_bytes = result_df.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                "📥 平滑化スペクトルをCSVで保存",
-                data=csv_bytes,
-                file_name=f"{spectrum_name}.csv",
-                mime="text/csv"
-            )
+            if ir_source == "CSVファイル":
+                uploaded_file = st.file_uploader("IRデータのCSVファイルをアップロードしてください", type="csv")
+                if uploaded_file is not None:
+                    df = pd.read_csv(uploaded_file, header=None, names=["freq", "intensity"])
+            else:
+                parsed, parsed_source = choose_output("出力ファイル", "ir")
+                if parsed is not None and not parsed["frequencies"]:
+                    st.warning(f"⚠️ `{parsed_source}` に振動数（IR強度）が見つかりませんでした。")
+                elif parsed is not None:
+                    df = pd.DataFrame({"freq": parsed["frequencies"], "intensity": parsed["intensities"]})
+        except Exception as e:
+            st.error(f"ファイルの読み込み中にエラーが発生しました: {e}")
+
+        if df is not None:
+            try:
+                st.dataframe(df.head())
+
+                freqs = df["freq"].to_numpy(dtype=float)
+                intensities = df["intensity"].to_numpy(dtype=float)
+                with perf.section("IR: ブロードニング"):
+                    x, y = broaden_spectrum(
+                        ir.peaks_hash(freqs, intensities), freqs, intensities,
+                        lineshape, sigma, eta, scale, grid
+                    )
+
+                # スペクトルの描画
+                fig, ax = plt.subplots(figsize=(8, 4))
+                ax.plot(x, y, color="blue", lw=2)
+                ax.set_xlabel("Wavenumber (cm⁻¹)")
+                ax.set_ylabel("Intensity (a.u.)")
+                ax.set_title("Simulated IR Spectrum")
+                ax.invert_xaxis()
+                ax.grid(True)
+                with perf.section("IR: 図の描画"):
+                    st.pyplot(fig)
+
+                # 名前をつけて保存
+                spectrum_name = st.text_input("保存ファイル名（例：sample_spectrum）", value="spectrum")
+                download_frame(
+                    "📥 平滑化スペクトルを保存",
+                    ("ir", ir.peaks_hash(freqs, intensities), lineshape, sigma, eta, scale, grid),
+                    lambda: pd.DataFrame({"Wavenumber (cm⁻¹)": x, "Intensity (a.u.)": y}),
+                    spectrum_name, "ir_single", sheet_name="spectrum"
+                )
+                save_to_library([(spectrum_name, x, y)], "single",
+                                {"source": ir_source, "lineshape": lineshape, "sigma": sigma, "scale": scale})
+
+            except Exception as e:
+                st.error(f"CSVファイルの読み込みや処理中にエラーが発生しました: {e}")
+        else:
+            st.info("CSVファイルのアップロード、または出力ファイルの選択をお待ちしています。")
+
+    elif ir_mode == "バッチ比較（複数CSV）":
+        # --- バッチ入力：複数アップロード or サーバー上のディレクトリ ---
+        uploaded_files = st.file_uploader("IRデータのCSVファイル（複数選択可）", type="csv", accept_multiple_files=True)
+        csv_dir = st.text_input("またはディレクトリを指定（サーバー上のパス、*.csv を読み込み）", value="")
+
+        sources = [(f.name.rsplit(".", 1)[0], f) for f in uploaded_files or []]
+        if csv_dir:
+            if os.path.isdir(csv_dir):
+                for path in sorted(glob.glob(os.path.join(csv_dir, "*.csv"))):
+                    sources.append((os.path.splitext(os.path.basename(path))[0], path))
+            else:
+                st.warning(f"⚠️ ディレクトリが見つかりません: `{csv_dir}`")
+
+        if sources:
+            try:
+                names, peak_lists = [], []
+                for name, source in sources:
+                    if name in names:
+                        name = f"{name}_{len(names)}"
+                    names.append(name)
+                    peak_lists.append(ir.read_peaks(source))
+                with perf.section("IR: 一括ブロードニング"):
+                    batch = run_job(
+                        "ir_batch", (tuple(ir.peaks_hash(f, i) for f, i in peak_lists), lineshape, sigma, eta, scale, grid),
+                        broaden_batch, peak_lists, lineshape, sigma, eta, scale, grid, label=f"{len(names)} 本のブロードニング"
+                    )
+                if batch is not None:
+                    x, spectra = batch
+                    st.caption(f"{len(names)} スペクトル × {len(x)} 点")
+
+                    # --- 表示オプション ---
+                    col_norm, col_diff = st.columns(2)
+                    normalized = col_norm.checkbox("最大強度で規格化", value=True)
+                    reference = col_diff.selectbox("差スペクトルの基準", ["（なし）"] + names)
+
+                    shown = ir.normalize(spectra) if normalized else spectra
+                    if reference != "（なし）":
+                        shown = ir.difference(shown, names.index(reference))
+
+                    fig, ax = plt.subplots(figsize=(8, 4))
+                    for name, row in zip(names, shown):
+                        ax.plot(x, row, lw=1.2, label=name)
+                    ax.set_xlabel("Wavenumber (cm⁻¹)")
+                    ax.set_ylabel("Intensity (a.u.)" if reference == "（なし）" else f"Δ Intensity (vs {reference})")
+                    ax.set_title("Simulated IR Spectra")
+                    ax.invert_xaxis()
+                    ax.grid(True)
+                    if len(names) <= 20:
+                        ax.legend(fontsize=7)
+                    with perf.section("IR: 図の描画"):
+                        st.pyplot(fig)
+
+                    # --- 全スペクトルを1つのワイド形式CSVに ---
+                    batch_name = st.text_input("保存ファイル名（例：conformers）", value="spectra")
+                    download_frame(
+                        "📥 全スペクトルをまとめて保存",
+                        ("ir_batch", tuple(ir.peaks_hash(f, i) for f, i in peak_lists), tuple(names),
+                         lineshape, sigma, eta, scale, grid, normalized, reference),
+                        lambda: ir.to_wide_frame(x, shown, names),
+                        batch_name, "ir_batch", sheet_name="spectra"
+                    )
+                    save_to_library([(name, x, row) for name, row in zip(names, spectra)], "batch",
+                                    {"source": "CSV", "lineshape": lineshape, "sigma": sigma, "scale": scale})
+            except Exception as e:
+                st.error(f"CSVファイルの読み込みや処理中にエラーが発生しました: {e}")
+        else:
+            st.info("CSVファイルのアップロード、またはディレクトリの指定をお待ちしています。")
 
+    else:
+        # --- 保存済みスペクトルとの類似検索（ブロードニング条件は上の設定を使う） ---
+        try:
+            show_library_search()
         except Exception as e:
-            st.error(f"CSVファイルの読み込みや処理中にエラーが発生しました: {e}")
+            st.error(f"ライブラリの検索中にエラーが発生しました: {e}")
+        show_library_manager()
+
+elif tab == "⚙️ 設定":
+    st.subheader("設定")
+    startup.record_paint(st.session_state, tab, script_start, "first_paint")
+
+    # --- 起動・描画時間 ---
+    st.markdown("#### ⏱ タブごとの描画時間（このセッション）")
+    paint_ms = st.session_state.get("tab_paint_ms", {})
+    if paint_ms:
+        st.table({
+            "タブ": list(paint_ms),
+            "初回描画 [ms]": [f"{t.get('first_paint', 0):.0f}" for t in paint_ms.values()],
+            "完了 [ms]": [f"{t.get('complete', 0):.0f}" for t in paint_ms.values()],
+        })
+    warm = startup.import_times()
+    if warm:
+        st.markdown("#### 📦 事前読み込みしたモジュール")
+        st.table({"モジュール": list(warm), "読み込み時間 [ms]": [f"{v * 1000:.0f}" for v in warm.values()]})
+
+    # --- 管理者パネル（区間ごとの時間・ファイル操作・読み込みバイト数・再実行回数） ---
+    def section_table(sections):
+        rows = sorted(sections.items(), key=lambda kv: -kv[1]["seconds"])
+        return {
+            "区間": [name for name, _ in rows],
+            "回数": [v["count"] for _, v in rows],
+            "合計 [ms]": [f"{v['seconds'] * 1000:.1f}" for _, v in rows],
+            "最大 [ms]": [f"{v['max_seconds'] * 1000:.1f}" for _, v in rows],
+        }
+
+    def fs_table(fs):
+        rows = sorted(fs.items(), key=lambda kv: -kv[1]["seconds"])
+        return {
+            "操作": [kind for kind, _ in rows],
+            "回数": [v["count"] for _, v in rows],
+            "合計 [ms]": [f"{v['seconds'] * 1000:.1f}" for _, v in rows],
+            "読み込み": [attachments.format_size(v["bytes"]) for _, v in rows],
+        }
+
+    def show_perf_panel():
+        if not perf.ENABLED:
+            st.info("計測は無効です（環境変数 QIDT_PERF=0）。")
+            return
+        process = perf.totals()
+        col_runs, col_all, col_sessions = st.columns(3)
+        col_runs.metric("このセッションの再実行回数", st.session_state.get("perf_runs", 0))
+        col_all.metric("プロセス全体の実行回数", process["runs"])
+        col_sessions.metric("セッション数", process["sessions"])
+
+        history = list(st.session_state.get("perf_history", []))
+        if history:
+            st.markdown("##### 直近の実行（このセッション）")
+            st.table({
+                "実行": [h["run"] for h in history[::-1]],
+                "タブ": [h["tab"] for h in history[::-1]],
+                "時間 [ms]": [f"{h['seconds'] * 1000:.0f}" for h in history[::-1]],
+                "読み込み": ["-" if h["read_bytes"] is None else attachments.format_size(h["read_bytes"]) for h in history[::-1]],
+                "read回数": ["-" if h["read_syscalls"] is None else h["read_syscalls"] for h in history[::-1]],
+                "ファイル操作": [sum(v["count"] for v in h["fs"].values()) for h in history[::-1]],
+            })
+            picked = st.selectbox("内訳を見る実行", [h["run"] for h in history[::-1]])
+            run = next(h for h in history if h["run"] == picked)
+            if run["sections"]:
+                st.table(section_table(run["sections"]))
+            if run["fs"]:
+                st.table(fs_table(run["fs"]))
+
+        st.markdown("##### プロセス全体の累計")
+        if process["sections"]:
+            st.table(section_table(process["sections"]))
+        if process["fs"]:
+            st.table(fs_table(process["fs"]))
+
+        col_json, col_prom = st.columns(2)
+        col_json.download_button("📤 JSONで書き出す", data=perf.to_json(st.session_state),
+                                 file_name="qidt_perf.json", mime="application/json")
+        col_prom.download_button("📤 Prometheus形式で書き出す", data=perf.to_prometheus(),
+                                 file_name="qidt_perf.prom", mime="text/plain")
+
+    # --- バックグラウンドジョブ（最近の20件。結果は入力ごとにディスクへキャッシュ） ---
+    st.markdown("#### 🧵 バックグラウンドジョブ")
+    recent_jobs = jobs.recent(20)
+    if recent_jobs:
+        st.dataframe({
+            "作成": [datetime.fromtimestamp(j["created_at"]).strftime("%m-%d %H:%M:%S") for j in recent_jobs],
+            "種類": [j["kind"] for j in recent_jobs],
+            "内容": [j["label"] for j in recent_jobs],
+            "状態": [j["status"] for j in recent_jobs],
+            "進捗": [f"{j['progress']:.0%}" for j in recent_jobs],
+            "所要 [s]": ["-" if not (j["started_at"] and j["finished_at"]) else f"{j['finished_at'] - j['started_at']:.1f}"
+                       for j in recent_jobs],
+            "エラー": [(j["error"] or "").split("\n")[0] for j in recent_jobs],
+        }, use_container_width=True, hide_index=True)
     else:
-        st.info("CSVファイルのアップロードをお待ちしています。")
+        st.caption("まだジョブはありません。")
+
+    # --- 添付ファイルストア（内容ごとに1つだけ圧縮保存。移行前のフォルダはバックグラウンドで取り込む） ---
+    st.markdown("#### 🗄 添付ファイルストア")
+    blob_stats = blobs.stats()
+    col_refs, col_logical, col_stored = st.columns(3)
+    col_refs.metric("添付（ブロブ）", f"{blob_stats['refs']} 件（{blob_stats['blobs']} 個）")
+    col_logical.metric("添付の合計", attachments.format_size(blob_stats["logical_bytes"]))
+    col_stored.metric("ディスク上", attachments.format_size(blob_stats["stored_bytes"]))
+    legacy = blobs.legacy_folders()
+    if legacy and st.button(f"📦 移行前の添付フォルダ {len(legacy)} 件をストアへ移す"):
+        st.session_state["blob_migrate"] = True
+    if st.session_state.get("blob_migrate"):
+        if legacy:
+            run_job("blob_migrate", (os.path.abspath("entries"),), blobs.migrate, label="添付フォルダの移行", reuse=False)
+        else:
+            st.session_state.pop("blob_migrate")
+            st.success("✅ 添付フォルダをストアへ移しました")
+    elif not legacy:
+        st.caption("すべての添付がストアに入っています。")
+
+    st.markdown("---")
+    if st.checkbox("🛠 管理者パネル（性能計測）", key="perf_admin"):
+        show_perf_panel()
+
+# --- このタブの描画時間をサイドバーに表示 ---
+complete_ms = startup.record_paint(st.session_state, tab, script_start, "complete")
+perf.end_run(st.session_state, tab)
+first_paint_ms = st.session_state["tab_paint_ms"][tab].get("first_paint", complete_ms)
+st.sidebar.caption(f"⏱ 初回描画 {first_paint_ms:.0f} ms / 完了 {complete_ms:.0f} ms")
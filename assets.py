@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import storage
+
+# --- 静的アセット（同梱ファイル＋コンテンツハッシュ付きローカルキャッシュ） ---
+ASSET_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
+CACHE_DIR = os.path.join(ASSET_DIR, "cache")
+INDEX_PATH = os.path.join(CACHE_DIR, "index.json")
+
+LOTTIE_MOLECULE_URL = "https://assets2.lottiefiles.com/packages/lf20_j1adxtyb.json"
+LOTTIE_MOLECULE_BUNDLED = "lottie_molecule.json"
+
+# 取得は必ずこの秒数で打ち切る（閉域網では即座に失敗してフォールバック）
+FETCH_TIMEOUT = 3.0
+# 取得に失敗したURLを再試行するまでの秒数
+RETRY_AFTER = 600
+
+_lock = threading.Lock()
+_in_flight = set()
+_failed_at = {}
+
+
+def _read_index():
+    try:
+        with open(INDEX_PATH, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def read_cached(url):
+    digest = _read_index().get(url)
+    if not digest:
+        return None
+    try:
+        with open(os.path.join(CACHE_DIR, f"{digest}.json"), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    # 壊れたキャッシュは使わない
+    if hashlib.sha256(data).hexdigest() != digest:
+        return None
+    return json.loads(data)
+
+
+def read_bundled(name):
+    try:
+        with open(os.path.join(ASSET_DIR, name), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def fetch(url):
+    import requests
+
+    try:
+        r = requests.get(url, timeout=FETCH_TIMEOUT)
+        if r.status_code != 200:
+            raise ValueError(f"HTTP {r.status_code}")
+        data = r.content
+        json.loads(data)
+    except Exception:
+        with _lock:
+            _failed_at[url] = time.time()
+        return False
+
+    digest = hashlib.sha256(data).hexdigest()
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    storage.atomic_write(os.path.join(CACHE_DIR, f"{digest}.json"), data)
+    with _lock:
+        index = _read_index()
+        index[url] = digest
+        storage.atomic_write(INDEX_PATH, json.dumps(index, indent=1).encode("utf-8"))
+    return True
+
+
+def prefetch(url):
+    # バックグラウンドで取得してキャッシュする（描画スレッドは待たない）
+    with _lock:
+        if url in _in_flight or time.time() - _failed_at.get(url, 0) < RETRY_AFTER:
+            return
+        _in_flight.add(url)
+
+    def run():
+        try:
+            fetch(url)
+        finally:
+            with _lock:
+                _in_flight.discard(url)
+
+    threading.Thread(target=run, name="qidt-asset-prefetch", daemon=True).start()
+
+
+def load_lottie(url, bundled=None):
+    # キャッシュ → （裏で取得を開始しつつ）同梱ファイル → None の順に返す
+    cached = read_cached(url)
+    if cached is not None:
+        return cached
+    prefetch(url)
+    return read_bundled(bundled) if bundled else None
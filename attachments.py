@@ -0,0 +1,189 @@
+import bisect
+import functools
+import mmap
+import os
+import re
+import perf
+import storage
+
+# --- 添付ファイル（ストリーミング保存と、巨大ファイルの部分プレビュー） ---
+CHUNK_SIZE = 4 * 1024 * 1024
+# 合計がこれを超える添付はバックグラウンドで保存する
+BACKGROUND_UPLOAD_BYTES = 32 * 1024 * 1024
+# これより大きいファイルは全文をブラウザへ送らない
+PREVIEW_MAX_BYTES = 2 * 1024 * 1024
+# 先頭・末尾プレビューの窓サイズ
+WINDOW_BYTES = 64 * 1024
+LINES_PER_PAGE = 200
+MAX_GREP_MATCHES = 200
+MAX_LINE_CHARS = 500
+
+IMAGE_EXTENSIONS = ["png", "jpg", "jpeg"]
+
+
+def format_size(n_bytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if n_bytes < 1024 or unit == "GB":
+            return f"{n_bytes:.0f} {unit}" if unit == "B" else f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+
+
+# --- 保存（アップロードをチャンク単位で書き出す） ---
+def save_upload(uploaded_file, dest_path, chunk_size=CHUNK_SIZE):
+    # 一時ファイルに書き切ってから置き換えるので、他のセッションが書きかけを読むことはない
+    uploaded_file.seek(0)
+    return storage.atomic_copy(str(dest_path), uploaded_file, chunk_size)
+
+
+def _decode(data):
+    return data.decode("utf-8", errors="ignore")
+
+
+def _open_map(file_path):
+    f = open(file_path, "rb")
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            return f, b""
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except Exception:
+        f.close()
+        raise
+
+
+def _close_map(f, mm):
+    if isinstance(mm, mmap.mmap):
+        mm.close()
+    f.close()
+
+
+def read_text(file_path):
+    with perf.fs_op("read") as op, open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+        op["bytes"] = os.fstat(f.fileno()).st_size
+        return f.read()
+
+
+# --- 先頭・末尾の窓（行の途中で切れた部分は落とす） ---
+def head(file_path, n_bytes=WINDOW_BYTES):
+    f, mm = _open_map(file_path)
+    try:
+        data = mm[:n_bytes]
+        perf.add_fs("mmap", n_bytes=len(data))
+        if len(mm) > n_bytes and b"\n" in data:
+            data = data[:data.rfind(b"\n") + 1]
+        return _decode(data)
+    finally:
+        _close_map(f, mm)
+
+
+def tail(file_path, n_bytes=WINDOW_BYTES):
+    f, mm = _open_map(file_path)
+    try:
+        start = max(0, len(mm) - n_bytes)
+        data = mm[start:]
+        perf.add_fs("mmap", n_bytes=len(data))
+        if start > 0 and b"\n" in data:
+            data = data[data.find(b"\n") + 1:]
+        return _decode(data)
+    finally:
+        _close_map(f, mm)
+
+
+# --- 行インデックス（CHUNK_SIZEごとの行番号チェックポイントだけを保持） ---
+@functools.lru_cache(maxsize=32)
+def _line_checkpoints(file_path, mtime_ns, size):
+    # 戻り値: (各チャンク先頭の行番号, 各チャンク先頭のバイト位置, 総行数)
+    lines, offsets = [], []
+    line_no = 0
+    with perf.fs_op("read") as op, open(file_path, "rb") as f:
+        op["bytes"] = size
+        offset = 0
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            lines.append(line_no)
+            offsets.append(offset)
+            line_no += chunk.count(b"\n")
+            offset += len(chunk)
+    if size and not _ends_with_newline(file_path):
+        line_no += 1
+    return lines, offsets, line_no
+
+
+def _ends_with_newline(file_path):
+    with open(file_path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def line_index(file_path):
+    st_result = os.stat(file_path)
+    return _line_checkpoints(file_path, st_result.st_mtime_ns, st_result.st_size)
+
+
+def count_lines(file_path):
+    return line_index(file_path)[2]
+
+
+def read_lines(file_path, start, count=LINES_PER_PAGE):
+    # start は0始まりの行番号
+    chunk_lines, chunk_offsets, total = line_index(file_path)
+    if start >= total or not chunk_lines:
+        return []
+    f, mm = _open_map(file_path)
+    try:
+        pos = 0
+        if start > 0:
+            # チャンク先頭は行の途中かもしれないので、必ず手前のチェックポイントから改行を数えて進む
+            i = bisect.bisect_left(chunk_lines, start) - 1
+            pos = chunk_offsets[i]
+            for _ in range(start - chunk_lines[i]):
+                pos = mm.find(b"\n", pos) + 1
+        result = []
+        scan_start = chunk_offsets[i] if start > 0 else 0
+        for _ in range(count):
+            if pos >= len(mm):
+                break
+            end = mm.find(b"\n", pos)
+            end = len(mm) if end < 0 else end
+            result.append(_decode(mm[pos:min(end, pos + MAX_LINE_CHARS)]))
+            pos = end + 1
+        perf.add_fs("mmap", n_bytes=min(pos, len(mm)) - scan_start)
+        return result
+    finally:
+        _close_map(f, mm)
+
+
+def _count_newlines(mm, start, end):
+    n = 0
+    for pos in range(start, end, CHUNK_SIZE):
+        n += mm[pos:min(end, pos + CHUNK_SIZE)].count(b"\n")
+    return n
+
+
+# --- ファイル内検索（mmap上で正規表現を走らせ、一致行だけ返す） ---
+def grep(file_path, pattern, regex=False, ignore_case=True, max_matches=MAX_GREP_MATCHES):
+    # 戻り値: ([(1始まりの行番号, 行), ...], 上限で打ち切ったか)
+    source = pattern.encode("utf-8") if regex else re.escape(pattern.encode("utf-8"))
+    # ファイル全体を1つのバッファとして検索するので、^ と $ を行ごとに効かせる
+    compiled = re.compile(source, re.MULTILINE | (re.IGNORECASE if ignore_case else 0))
+    matches = []
+    f, mm = _open_map(file_path)
+    perf.add_fs("grep", n_bytes=len(mm))
+    try:
+        line_no, counted_to, last_line_end = 0, 0, -1
+        for m in compiled.finditer(mm):
+            if m.start() <= last_line_end:
+                continue
+            line_start = mm.rfind(b"\n", 0, m.start()) + 1
+            line_end = mm.find(b"\n", m.start())
+            line_end = len(mm) if line_end < 0 else line_end
+            line_no += _count_newlines(mm, counted_to, line_start)
+            counted_to = line_start
+            matches.append((line_no + 1, _decode(mm[line_start:min(line_end, line_start + MAX_LINE_CHARS)])))
+            last_line_end = line_end
+            if len(matches) >= max_matches:
+                return matches, True
+        return matches, False
+    finally:
+        _close_map(f, mm)
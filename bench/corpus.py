@@ -0,0 +1,168 @@
+"""ベンチマーク用の合成コーパス生成。
+
+    python bench/corpus.py OUT_DIR [--notes N] [--results M] [--spectra K] [--peaks P] [--seed S]
+
+OUT_DIR の下に entries/（フロントマター・添付つきの記録）、results/（構造フォルダと data.yaml）、
+spectra/（IR ピークの CSV）を作る。同じシードなら同じ内容になる。
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+import yaml
+
+# --- 語彙（記録の本文・タグ・構造名） ---
+TAGS = [
+    "MMA", "MAA", "PMMA", "QIDT", "ORCA", "Gaussian", "DFT", "B3LYP", "ωB97X-D", "界面", "反応場", "吸着",
+    "水素結合", "電荷移動", "HOMO", "LUMO", "IR", "振動解析", "溶媒効果", "二量体", "三量体", "遷移状態",
+    "分散補正", "基底関数", "収束", "再計算", "考察", "文献", "アイデア", "TODO",
+]
+WORDS_JA = [
+    "界面", "反応場", "電子密度", "分極", "安定化", "相互作用", "軌道", "電荷", "エネルギー", "構造最適化",
+    "振動数", "吸着エネルギー", "水素結合", "配向", "基板", "分子", "溶媒", "計算条件", "収束", "傾向",
+]
+WORDS_EN = [
+    "HOMO", "LUMO", "QIDE", "SCF", "dimer", "trimer", "basis", "def2-TZVP", "D3BJ", "Mulliken",
+    "dipole", "frequency", "gap", "charge", "transfer", "ORCA", "Gaussian", "RIJCOSX", "TightSCF", "PCM",
+]
+MONOMERS = ["MMA", "MAA", "St", "AN", "VAc", "HEMA", "AA", "BA"]
+SIZES = ["Dimer", "Trimer", "Tetramer", "Complex"]
+START_DATE = date(2022, 1, 1)
+
+
+def sentence(rng):
+    parts = []
+    for _ in range(rng.randint(6, 16)):
+        parts.append(rng.choice(WORDS_JA) if rng.random() < 0.6 else rng.choice(WORDS_EN))
+    return "".join(p if not p.isascii() else f" {p} " for p in parts).strip() + "。"
+
+
+def note_body(rng):
+    lines = [f"## {rng.choice(WORDS_JA)}について", ""]
+    for _ in range(rng.randint(2, 6)):
+        lines.append(" ".join(sentence(rng) for _ in range(rng.randint(1, 4))))
+        lines.append("")
+    if rng.random() < 0.3:
+        lines += ["| 項目 | 値 |", "|---|---|"]
+        lines += [f"| {rng.choice(WORDS_EN)} | {rng.uniform(-1, 1):.4f} |" for _ in range(rng.randint(2, 5))]
+    return "\n".join(lines)
+
+
+# --- 記録 ---
+def make_notes(root, n, attachment_every=10, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        day = START_DATE + timedelta(days=rng.randrange(3 * 365))
+        title = f"{rng.choice(WORDS_JA)}と{rng.choice(WORDS_EN)}の検討 {i}"
+        metadata = {"title": title, "date": day.isoformat(), "tags": rng.sample(TAGS, rng.randint(1, 4))}
+        dir_path = os.path.join(root, "entries", day.isoformat())
+        os.makedirs(dir_path, exist_ok=True)
+        slug = title.replace(" ", "_")
+        with open(os.path.join(dir_path, slug + ".md"), "w") as f:
+            f.write("---\n" + yaml.dump(metadata) + "---\n\n" + note_body(rng))
+        if attachment_every and i % attachment_every == 0:
+            attach_dir = os.path.join(dir_path, slug)
+            os.makedirs(attach_dir, exist_ok=True)
+            with open(os.path.join(attach_dir, "energies.csv"), "w") as f:
+                f.write("step,energy\n" + "".join(f"{s},{-100 - rng.random():.8f}\n" for s in range(rng.randint(10, 200))))
+            with open(os.path.join(attach_dir, "run.out"), "w") as f:
+                f.write(synthetic_orca_output(rng, n_atoms=rng.randint(10, 40)))
+
+
+# --- 構造別結果（移行前の results/<構造名>/data.yaml 形式） ---
+def structure_record(rng, name):
+    homo = rng.gauss(-0.24, 0.02)
+    lumo = homo + abs(rng.gauss(0.2, 0.04))
+    e_sub = rng.gauss(-1200, 150)
+    e_mol = rng.gauss(-350, 40)
+    e_total = e_sub + e_mol + rng.gauss(-0.02, 0.01)
+    charges = [rng.gauss(0, 0.3) for _ in range(8)]
+    return {
+        "構造名": name,
+        "SCFエネルギー": e_total,
+        "HOMO": homo,
+        "LUMO": lumo,
+        "μ": -(homo + lumo) / 2,
+        "双極子モーメント": abs(rng.gauss(2.5, 1.5)),
+        "Mulliken最大": max(charges),
+        "Mulliken最小": min(charges),
+        "E_total": e_total,
+        "E_substrate": e_sub,
+        "E_molecule": e_mol,
+        "QIDE": e_total - e_sub - e_mol,
+        "メモ": sentence(rng),
+    }
+
+
+def make_results(root, m, seed=0):
+    rng = random.Random(seed + 1)
+    for i in range(m):
+        name = f"{rng.choice(MONOMERS)}-{rng.choice(MONOMERS)} {rng.choice(SIZES)} {i}"
+        folder = os.path.join(root, "results", name.replace(" ", "_"))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, "data.yaml"), "w") as f:
+            yaml.dump(structure_record(rng, name), f, allow_unicode=True)
+
+
+# --- IR ピーク ---
+def peak_list(rng, n_peaks):
+    freqs = [rng.uniform(400, 4000) for _ in range(n_peaks)]
+    intensities = [rng.lognormvariate(3, 1.2) for _ in range(n_peaks)]
+    return freqs, intensities
+
+
+def make_spectra(root, k, n_peaks, seed=0):
+    rng = random.Random(seed + 2)
+    dir_path = os.path.join(root, "spectra")
+    os.makedirs(dir_path, exist_ok=True)
+    paths = []
+    for i in range(k):
+        freqs, intensities = peak_list(rng, n_peaks)
+        path = os.path.join(dir_path, f"conformer_{i:04d}.csv")
+        with open(path, "w") as f:
+            f.write("freq,intensity\n" + "".join(f"{a:.4f},{b:.4f}\n" for a, b in zip(freqs, intensities)))
+        paths.append(path)
+    return paths
+
+
+# --- 合成 ORCA 出力（添付・取り込みの解析用） ---
+def synthetic_orca_output(rng, n_atoms=20, n_orbitals=None):
+    n_orbitals = n_orbitals or n_atoms * 6
+    n_occupied = n_orbitals // 3
+    lines = ["                                 * O   R   C   A *", ""]
+    lines += [f"FINAL SINGLE POINT ENERGY     {rng.gauss(-500, 100):.9f}", ""]
+    lines += ["ORBITAL ENERGIES", "----------------", "", "  NO   OCC          E(Eh)            E(eV) "]
+    energy = -20.0
+    for i in range(n_orbitals):
+        energy += abs(rng.gauss(0.1, 0.05))
+        lines.append(f"{i:4d}   {2.0 if i < n_occupied else 0.0:.4f}   {energy:14.6f}   {energy * 27.2114:12.4f}")
+    lines += ["", "MULLIKEN ATOMIC CHARGES", "-----------------------"]
+    lines += [f"{i:4d} {rng.choice(['C', 'H', 'O', 'N']):>2}:  {rng.gauss(0, 0.3):10.6f}" for i in range(n_atoms)]
+    lines += ["Sum of atomic charges:    0.0000000", "", f"Magnitude (Debye)      :      {abs(rng.gauss(2, 1)):.5f}", ""]
+    lines += ["IR SPECTRUM", "-----------", ""]
+    for i in range(3 * n_atoms - 6):
+        lines.append(f"  {i + 6:4d}:   {rng.uniform(400, 4000):10.2f}   0.001000   {rng.lognormvariate(2, 1):10.2f}  0.000000  ( 0.0  0.0  0.0)")
+    lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("out_dir")
+    parser.add_argument("--notes", type=int, default=100)
+    parser.add_argument("--results", type=int, default=100)
+    parser.add_argument("--spectra", type=int, default=10)
+    parser.add_argument("--peaks", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    make_notes(args.out_dir, args.notes, seed=args.seed)
+    make_results(args.out_dir, args.results, seed=args.seed)
+    make_spectra(args.out_dir, args.spectra, args.peaks, seed=args.seed)
+    print(f"{args.out_dir}: 記録 {args.notes} 件 / 構造 {args.results} 件 / スペクトル {args.spectra} 本")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
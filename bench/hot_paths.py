@@ -0,0 +1,290 @@
+"""各タブのホットパスを合成コーパスで規模別に計測し、JSONで出力する。
+
+    python bench/hot_paths.py [--scales 100,10000] [--only notes,results,plots,ir] [--repeat 3]
+                              [--out bench.json] [--baseline old.json --tolerance 1.5]
+
+規模ごとに新しい作業ディレクトリへコーパスを生成し、タブと同じ関数を呼んで時間を測る。
+--baseline を渡すと、同じ (パス, 規模) の中央値が tolerance 倍を超えたものを退行として終了コード1で終わる。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import corpus  # noqa: E402
+
+GROUPS = ["notes", "results", "plots", "ir"]
+DEFAULT_SCALES = [100, 10000]
+# 保存系は1回が短いので、この回数をまとめて1回分として測る
+SAVE_BATCH = 20
+
+
+# --- 計測 ---
+def measure(fn, repeat=3):
+    # 複数回測るものは、初回の import やキャッシュ作成を除くため1回空打ちする
+    if repeat > 1:
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"min_s": min(times), "median_s": statistics.median(times), "max_s": max(times), "repeat": repeat}
+
+
+class Recorder:
+    def __init__(self, scale, repeat):
+        self.scale, self.repeat, self.rows = scale, repeat, []
+
+    def time(self, path, fn, repeat=None, items=1):
+        stats = measure(fn, self.repeat if repeat is None else repeat)
+        row = {"path": path, "scale": self.scale, "items": items, **stats}
+        row["per_item_s"] = row["median_s"] / items
+        self.rows.append(row)
+        print(f"  {path:<28} {row['median_s'] * 1000:10.2f} ms", file=sys.stderr)
+        return row
+
+
+# --- 記録一覧（インデックス同期・検索・保存） ---
+def bench_notes(rec, scale, seed):
+    import entry_index
+    import storage
+
+    corpus.make_notes(".", scale, seed=seed)
+    rec.time("notes.sync_cold", entry_index.sync_index, repeat=1)
+    rec.time("notes.sync_warm", entry_index.sync_index)
+    rec.time("notes.count_all", entry_index.count_entries)
+    rec.time("notes.page_date_desc", lambda: entry_index.query_entries(order="date_desc", limit=20, offset=scale // 2))
+    rec.time("notes.filter_tags_and", lambda: entry_index.query_entries(tags=["QIDT", "ORCA"], tag_mode="and", limit=20))
+    rec.time("notes.filter_date", lambda: entry_index.count_entries(date_from="2023-01-01", date_to="2023-06-30"))
+    rec.time("notes.search_text", lambda: entry_index.query_entries(text="界面 HOMO", limit=20))
+    rec.time("notes.search_rank", lambda: entry_index.query_entries(text="反応場", order="rank", limit=20))
+
+    rng = random.Random(seed)
+
+    def save_batch():
+        # save_entry と同じ手順（名前の確保 → 一時ファイル＋rename → インデックス更新）
+        for _ in range(SAVE_BATCH):
+            metadata = {"title": "ベンチマーク 保存", "date": "2024-01-01", "tags": rng.sample(corpus.TAGS, 2)}
+            path = entry_index.new_entry_path(metadata["date"], metadata["title"])
+            storage.atomic_write(path, entry_index.format_entry(metadata, corpus.note_body(rng)))
+            entry_index.upsert_entry(path)
+
+    rec.time("notes.save", save_batch, items=SAVE_BATCH)
+
+    target = entry_index.query_entries(limit=1)[0]["path"]
+
+    def edit_batch():
+        for _ in range(SAVE_BATCH):
+            metadata = {"title": "ベンチマーク 編集", "date": "2024-01-01", "tags": ["QIDT"]}
+            storage.write_checked(target, entry_index.format_entry(metadata, corpus.note_body(rng)), storage.mtime_ns(target))
+            entry_index.upsert_entry(target)
+
+    rec.time("notes.edit", edit_batch, items=SAVE_BATCH)
+
+    # 添付ファイルストア（既存フォルダの移行・同じ出力の再添付・展開して読む）
+    import blobs
+    import io
+
+    rec.time("notes.blob_migrate", blobs.migrate, repeat=1)
+    output = corpus.synthetic_orca_output(rng, n_atoms=200).encode("utf-8")
+
+    def attach_batch():
+        for i in range(SAVE_BATCH):
+            blobs.add(f"entries/2024-01-01/bench_{i}", "run.out", io.BytesIO(output))
+
+    rec.time("notes.blob_add_dedup", attach_batch, items=SAVE_BATCH)
+
+    def resolve_cold():
+        blobs.prune_cache(0)
+        blobs.resolve("entries/2024-01-01/bench_0/run.out")
+
+    rec.time("notes.blob_resolve_cold", resolve_cold)
+    rec.time("notes.blob_resolve_warm", lambda: blobs.resolve("entries/2024-01-01/bench_0/run.out"))
+
+
+# --- 構造別結果（移行・表の構築・CSV・保存） ---
+def bench_results(rec, scale, seed):
+    import results_store
+
+    corpus.make_results(".", scale, seed=seed)
+    rec.time("results.migrate_yaml", lambda: results_store.migrate_yaml(force=True), repeat=1)
+    rec.time("results.load_frame", results_store.load_frame)
+    df = results_store.load_frame()
+    rec.time("results.to_csv", lambda: df[results_store.DISPLAY_KEYS].to_csv(index=False).encode("utf-8"))
+
+    rng = random.Random(seed)
+
+    def save_batch():
+        for i in range(SAVE_BATCH):
+            results_store.save_result(results_store.derive(corpus.structure_record(rng, f"Bench Dimer {i}")))
+
+    rec.time("results.save", save_batch, items=SAVE_BATCH)
+
+    # 反応（構造数と同じ本数）。全件の再計算と、構造1件の更新後の差分再計算
+    import reactions
+
+    names = df["構造名"].tolist()
+    reactions.save_reactions([{"name": f"Bench Reaction {i}", "reactant": rng.choice(names), "ts": rng.choice(names),
+                               "product": rng.choice(names)} for i in range(scale)])
+
+    def full_refresh():
+        conn = results_store.connect()
+        with conn:
+            conn.execute("DELETE FROM reaction_values")
+        conn.close()
+        reactions.refresh()
+
+    rec.time("results.reactions_full", full_refresh, items=scale)
+    record = df.iloc[0][results_store.DISPLAY_KEYS].to_dict()
+    rec.time("results.reactions_incremental", lambda: (results_store.save_result(record), reactions.refresh()))
+    rec.time("results.reactions_table", lambda: reactions.load_table("kJ/mol"))
+
+
+# --- 散布図・クラスタリング ---
+def bench_plots(rec, scale, seed):
+    import numpy as np
+    import pandas as pd
+    import clustering
+    import plots
+    import results_store
+
+    rng = random.Random(seed)
+    df = pd.DataFrame([results_store.derive(corpus.structure_record(rng, f"{rng.choice(corpus.MONOMERS)} Dimer {i}"))
+                       for i in range(scale)])
+    x_axis, y_axis = "HOMO", "QIDE"
+    mask = plots.label_mask(df, x_axis, y_axis)
+    rec.time("plots.label_mask", lambda: plots.label_mask(df, x_axis, y_axis))
+    rec.time("plots.scatter_chart", lambda: plots.scatter_chart(df, x_axis, y_axis, mask).to_dict())
+    rec.time("plots.scatter_png", lambda: plots.scatter_png(df, x_axis, y_axis, mask), repeat=1)
+
+    features = ("HOMO", "LUMO", "QIDE", "双極子モーメント")
+    X, _ = clustering.prepare(df, features, scale=True)
+    rec.time("plots.kmeans_fit_k3", lambda: clustering.fit(X, 3))
+    rec.time("plots.kmeans_sweep_2_6", lambda: clustering.sweep(X, range(2, 7)), repeat=1)
+    rec.time("plots.pca_2d", lambda: clustering.pca_2d(np.asarray(X)))
+
+
+# --- IR ブロードニング ---
+def bench_ir(rec, scale, seed):
+    import numpy as np
+    import ir
+
+    rng = random.Random(seed)
+    freqs, intensities = (np.asarray(v) for v in corpus.peak_list(rng, scale))
+    x = ir.make_grid()
+    rec.time("ir.broaden_auto", lambda: ir.broaden(freqs, intensities, x))
+    rec.time("ir.broaden_direct", lambda: ir.broaden(freqs, intensities, x, method="direct"), repeat=1)
+    rec.time("ir.broaden_fft", lambda: ir.broaden(freqs, intensities, x, method="fft"))
+    rec.time("ir.broaden_voigt", lambda: ir.broaden(freqs, intensities, x, lineshape="pseudo-Voigt"))
+
+    # 一括モード：規模に応じた本数 × 100 本のピーク
+    n_spectra = max(4, min(scale // 100, 1000))
+    peak_lists = [tuple(np.asarray(v) for v in corpus.peak_list(rng, 100)) for _ in range(n_spectra)]
+    rec.time("ir.broaden_many", lambda: ir.broaden_many(peak_lists, x), repeat=1, items=n_spectra)
+
+    # スペクトルライブラリ：規模と同じ本数（一括ブロードニングの結果をずらして水増し）
+    import spectral_library
+
+    x_lib = spectral_library.grid()
+    base = ir.broaden_many(peak_lists, x_lib)
+    items = [{"name": f"bench_{i}", "x": x_lib, "y": np.roll(base[i % len(base)], i // len(base))} for i in range(scale)]
+    rec.time("ir.library_add", lambda: spectral_library.add_spectra(items), repeat=1, items=scale)
+    query = (x_lib, np.roll(base[0], 7))
+    for method in spectral_library.METHODS:
+        rec.time(f"ir.library_search_{method}", lambda: spectral_library.search(*query, method=method))
+
+
+BENCHES = {"notes": bench_notes, "results": bench_results, "plots": bench_plots, "ir": bench_ir}
+
+
+# --- 実行環境・比較 ---
+def environment():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        rev = None
+    return {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "git": rev or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def regressions(rows, baseline_rows, tolerance):
+    base = {(r["path"], r["scale"]): r for r in baseline_rows}
+    found = []
+    for row in rows:
+        old = base.get((row["path"], row["scale"]))
+        if old and old["median_s"] > 0 and row["median_s"] > old["median_s"] * tolerance:
+            found.append({"path": row["path"], "scale": row["scale"], "baseline_s": old["median_s"],
+                          "median_s": row["median_s"], "ratio": row["median_s"] / old["median_s"]})
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)), help="カンマ区切りの規模（例: 100,10000,100000）")
+    parser.add_argument("--only", default=",".join(GROUPS), help="計測するグループ（notes,results,plots,ir）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="コーパスを作る場所（既定: 一時ディレクトリ）")
+    parser.add_argument("--out", default=None, help="JSONの出力先（既定: 標準出力）")
+    parser.add_argument("--baseline", default=None, help="比較する過去の出力JSON")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="退行とみなす中央値の倍率")
+    args = parser.parse_args()
+    # 日本語フォントが無い環境の matplotlib の警告で進捗が読みにくくなるので抑える
+    warnings.filterwarnings("ignore", message="Glyph .* missing from font")
+
+    scales = [int(s) for s in args.scales.split(",") if s]
+    groups = [g for g in args.only.split(",") if g]
+    unknown = set(groups) - set(BENCHES)
+    if unknown:
+        parser.error(f"不明なグループ: {', '.join(sorted(unknown))}")
+
+    rows = []
+    cwd = os.getcwd()
+    for scale in scales:
+        for group in groups:
+            print(f"[{group} × {scale}]", file=sys.stderr)
+            rec = Recorder(scale, args.repeat)
+            with tempfile.TemporaryDirectory(dir=args.workdir, prefix=f"qidt-bench-{group}-{scale}-") as workdir:
+                os.chdir(workdir)
+                try:
+                    BENCHES[group](rec, scale, args.seed)
+                finally:
+                    os.chdir(cwd)
+            for row in rec.rows:
+                row["group"] = group
+            rows += rec.rows
+
+    report = {"environment": environment(), "scales": scales, "results": rows}
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["regressions"] = regressions(rows, json.load(f)["results"], args.tolerance)
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    for r in report.get("regressions", []):
+        print(f"NG: {r['path']} @ {r['scale']}: {r['baseline_s'] * 1000:.1f} ms → {r['median_s'] * 1000:.1f} ms (×{r['ratio']:.2f})", file=sys.stderr)
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
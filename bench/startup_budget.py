@@ -0,0 +1,133 @@
+"""起動時間の予算チェック。予算を超えたら終了コード1で終わる。
+
+    python bench/startup_budget.py [--json]
+    python -m pytest -q tests      # 同じ予算をテストとして確認する
+
+各計測は新しいプロセス・空の作業ディレクトリで行う（事前読み込みは無効化）。
+"""
+import argparse
+import ast
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# --- 予算 ---
+HELPER_IMPORT_BUDGET_MS = 300
+TAB_FIRST_PAINT_BUDGET_MS = 100
+# タブ表示時点で読み込まれていてはいけないモジュール
+FORBIDDEN_ON_LIGHT_TABS = ["sklearn", "seaborn", "matplotlib.pyplot"]
+LIGHT_TABS = ["🏠 ホーム", "🧪 新規記録", "📚 一覧", "⚙️ 設定"]
+
+
+def app_helper_modules(app_path=os.path.join(ROOT, "app.py")):
+    # app.py の先頭で import しているこのリポジトリのモジュール（起動時に必ず読み込まれるもの）
+    with open(app_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names += [alias.name.split(".")[0] for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.append(node.module.split(".")[0])
+    return sorted({name for name in names if os.path.exists(os.path.join(ROOT, name + ".py"))})
+
+
+# 先頭の import に加え、軽いタブの中で読み込む補助モジュール（ホームのアセット、一覧の構造名の参照）
+HELPER_MODULES = sorted(set(app_helper_modules()) | {"assets", "results_store"})
+
+HELPER_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{"elapsed_ms": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+TAB_PROBE = """
+import json, sys
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=60)
+at.session_state["authenticated"] = True
+at.run()
+if {tab!r} != "🏠 ホーム":
+    at.sidebar.radio[0].set_value({tab!r}).run()
+paint = at.session_state["tab_paint_ms"][{tab!r}]
+print(json.dumps({{"paint": paint, "errors": [str(e.value) for e in at.exception], "modules": sorted(sys.modules)}}))
+"""
+
+
+def run_probe(code, workdir):
+    env = dict(os.environ, QIDT_PREWARM="0", PYTHONPATH=ROOT)
+    out = subprocess.run([sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def loaded(modules, name):
+    return any(m == name or m.startswith(name + ".") for m in modules)
+
+
+def check_helpers(workdir):
+    # 戻り値: (読み込み時間 ms, 予算違反のリスト)
+    failures = []
+    probe = run_probe(HELPER_PROBE.format(modules=HELPER_MODULES), workdir)
+    if probe["elapsed_ms"] > HELPER_IMPORT_BUDGET_MS:
+        failures.append(f"補助モジュールの読み込み {probe['elapsed_ms']:.0f} ms > {HELPER_IMPORT_BUDGET_MS} ms")
+    for name in ["pandas", "numpy", *FORBIDDEN_ON_LIGHT_TABS]:
+        if loaded(probe["modules"], name):
+            failures.append(f"補助モジュールの読み込みで {name} が読み込まれた")
+    return probe["elapsed_ms"], failures
+
+
+def check_tabs(workdir):
+    # 戻り値: ({タブ: 描画時間}, 予算違反のリスト)。streamlit が無ければ None
+    if importlib.util.find_spec("streamlit") is None:
+        return None, []
+    paints, failures = {}, []
+    for tab in LIGHT_TABS:
+        probe = run_probe(TAB_PROBE.format(app=os.path.join(ROOT, "app.py"), tab=tab), workdir)
+        paints[tab] = probe["paint"]
+        failures += [f"{tab}: {e}" for e in probe["errors"]]
+        first_paint = probe["paint"].get("first_paint", float("inf"))
+        if first_paint > TAB_FIRST_PAINT_BUDGET_MS:
+            failures.append(f"{tab}: 初回描画 {first_paint:.0f} ms > {TAB_FIRST_PAINT_BUDGET_MS} ms")
+        for name in FORBIDDEN_ON_LIGHT_TABS:
+            if loaded(probe["modules"], name):
+                failures.append(f"{tab}: {name} が読み込まれた")
+    return paints, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        results["helper_import_ms"], failures = check_helpers(workdir)
+        paints, tab_failures = check_tabs(workdir)
+        results["tabs"] = paints if paints is not None else "skipped (streamlit not installed)"
+        failures += tab_failures
+
+    results["failures"] = failures
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=1))
+    else:
+        print(f"補助モジュール読み込み: {results['helper_import_ms']:.1f} ms")
+        if isinstance(results["tabs"], dict):
+            for tab, paint in results["tabs"].items():
+                print(f"{tab}: 初回描画 {paint.get('first_paint', 0):.1f} ms / 完了 {paint.get('complete', 0):.1f} ms")
+        else:
+            print(f"タブ計測: {results['tabs']}")
+        for failure in failures:
+            print(f"NG: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
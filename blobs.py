@@ -0,0 +1,404 @@
+import functools
+import gzip
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+import perf
+import storage
+
+# --- 添付ファイルのブロブストア（内容のハッシュで1つだけ圧縮保存し、記録ごとの参照を数える） ---
+STORE_DIR = os.path.join("entries", ".blobs")
+DB_PATH = os.path.join(STORE_DIR, "blobs.sqlite")
+# 圧縮したブロブを mmap で読むための展開済みキャッシュ
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "cache", "blobs")
+MAX_CACHE_BYTES = 1024 * 1024 * 1024
+CHUNK_SIZE = 4 * 1024 * 1024
+ZSTD_LEVEL = 10
+GZIP_LEVEL = 6
+# 既に圧縮された形式はそのまま置く（画像はパスのまま表示・サムネイル化できる）
+RAW_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp", "pdf", "zip", "gz", "zst", "xz", "bz2", "7z"}
+SUFFIXES = {"zstd": ".zst", "gzip": ".gz", "raw": ""}
+# これより古い一時ファイルは書き込み途中で止まったものとして gc で消す（秒）
+TEMP_MAX_AGE = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest      TEXT PRIMARY KEY,
+    codec       TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    stored_size INTEGER NOT NULL,
+    refcount    INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    owner    TEXT NOT NULL,
+    name     TEXT NOT NULL,
+    digest   TEXT NOT NULL,
+    added_at REAL NOT NULL,
+    PRIMARY KEY (owner, name)
+);
+CREATE INDEX IF NOT EXISTS idx_refs_digest ON refs(digest);
+"""
+
+_schema_ready = set()
+
+
+def connect():
+    os.makedirs(STORE_DIR, exist_ok=True)
+    fresh = DB_PATH not in _schema_ready or not os.path.exists(DB_PATH)
+    conn = storage.sqlite_connect(DB_PATH)
+    if fresh:
+        conn.executescript(SCHEMA)
+        _schema_ready.add(DB_PATH)
+    return conn
+
+
+def _zstd():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def default_codec():
+    # zstandard が無ければ標準ライブラリの gzip を使う（QIDT_BLOB_CODEC で固定できる）
+    return os.environ.get("QIDT_BLOB_CODEC") or ("zstd" if _zstd() else "gzip")
+
+
+def owner_key(dir_path):
+    # 記録ごとの参照の持ち主（添付フォルダだったパス。例: entries/2024-01-01/タイトル）
+    return os.path.normpath(str(dir_path))
+
+
+def blob_path(digest, codec):
+    return os.path.join(STORE_DIR, digest[:2], digest + SUFFIXES[codec])
+
+
+# --- 圧縮・展開（どちらもチャンク単位で流す） ---
+def _writer(codec, out):
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=ZSTD_LEVEL).stream_writer(out, closefd=False)
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=out, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+    return None
+
+
+def _open_blob(digest, codec):
+    path = blob_path(digest, codec)
+    if codec == "zstd":
+        zstandard = _zstd()
+        if zstandard is None:
+            raise RuntimeError("zstd で圧縮された添付を読むには zstandard が必要です")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True), CHUNK_SIZE)
+    if codec == "gzip":
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+
+# --- 書き込み（ハッシュと圧縮を1回の読み込みで行い、同じ内容は1つだけ置く） ---
+def add(owner, name, source, progress=None, total=None):
+    # source: バイナリで読めるファイルオブジェクト。戻り値: 内容のハッシュ
+    ext = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    codec = "raw" if ext in RAW_EXTENSIONS else default_codec()
+    os.makedirs(STORE_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=STORE_DIR, prefix=".tmp-")
+    try:
+        with perf.fs_op("write") as op, os.fdopen(fd, "wb") as out:
+            writer = _writer(codec, out) or out
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+                writer.write(chunk)
+                size += len(chunk)
+                if progress is not None:
+                    progress(size / (total or size), f"{name}: {size // 1024 ** 2} MB")
+            if writer is not out:
+                writer.close()
+            out.flush()
+            os.fsync(out.fileno())
+            op["bytes"] = size
+        digest = digest.hexdigest()
+        with storage.file_lock(DB_PATH):
+            conn = connect()
+            try:
+                with conn:
+                    if conn.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone() is None:
+                        path = blob_path(digest, codec)
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        stored_size = os.path.getsize(tmp_path)
+                        os.replace(tmp_path, path)
+                        conn.execute("INSERT INTO blobs (digest, codec, size, stored_size, created_at) VALUES (?, ?, ?, ?, ?)",
+                                     (digest, codec, size, stored_size, time.time()))
+                    freed = _set_ref(conn, owner_key(owner), name, digest)
+                _remove_files(freed)
+            finally:
+                conn.close()
+        return digest
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class UploadError(Exception):
+    # 一部の添付を保存できなかった。failed: [(ファイル名, エラー)]
+    def __init__(self, failed):
+        self.failed = failed
+        super().__init__("保存できなかった添付: " + ", ".join(f"{name}（{type(e).__name__}: {e}）" for name, e in failed))
+
+
+def _scaled_progress(progress, offset, span, fraction, message):
+    progress(offset + fraction * span, message)
+
+
+def add_uploads(uploaded_files, owner, progress=None):
+    # 記録の添付（st.file_uploader の UploadedFile）をまとめて保存する。戻り値: 保存したファイル数
+    # 保存できないファイルがあっても残りは保存し、最後に UploadError で名前を知らせる（やり直しても保存済みのものは増えない）
+    total = sum(getattr(f, "size", 0) for f in uploaded_files) or 1
+    done = 0
+    failed = []
+    for f in uploaded_files:
+        size = getattr(f, "size", 0)
+        file_progress = None if progress is None else functools.partial(_scaled_progress, progress, done / total, size / total)
+        try:
+            f.seek(0)
+            add(owner, f.name, f, file_progress, size or None)
+        except Exception as e:
+            failed.append((f.name, e))
+        done += size
+    if failed:
+        raise UploadError(failed)
+    return len(uploaded_files)
+
+
+def _set_ref(conn, owner, name, digest):
+    old = conn.execute("SELECT digest FROM refs WHERE owner = ? AND name = ?", (owner, name)).fetchone()
+    if old is not None and old["digest"] == digest:
+        return []
+    conn.execute("INSERT OR REPLACE INTO refs (owner, name, digest, added_at) VALUES (?, ?, ?, ?)",
+                 (owner, name, digest, time.time()))
+    conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE digest = ?", (digest,))
+    return _decref(conn, [old["digest"]]) if old is not None else []
+
+
+def _decref(conn, digests):
+    # 戻り値: 参照が無くなったブロブの (digest, codec)。ファイルはコミット後に消す
+    for digest in digests:
+        conn.execute("UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", (digest,))
+    marks = ", ".join("?" * len(digests))
+    freed = [(r["digest"], r["codec"]) for r in
+             conn.execute(f"SELECT digest, codec FROM blobs WHERE refcount <= 0 AND digest IN ({marks})", digests)]
+    conn.executemany("DELETE FROM blobs WHERE digest = ?", [(d,) for d, _ in freed])
+    return freed
+
+
+def _remove_files(freed):
+    for digest, codec in freed:
+        for path in [blob_path(digest, codec), os.path.join(CACHE_DIR, digest)]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def release(owner, name=None):
+    # 記録（name を渡せばその添付だけ）の参照を外す。戻り値: 消えたブロブの数
+    owner = owner_key(owner)
+    with storage.file_lock(DB_PATH):
+        conn = connect()
+        try:
+            with conn:
+                if name is None:
+                    rows = conn.execute("SELECT digest FROM refs WHERE owner = ?", (owner,)).fetchall()
+                    conn.execute("DELETE FROM refs WHERE owner = ?", (owner,))
+                else:
+                    rows = conn.execute("SELECT digest FROM refs WHERE owner = ? AND name = ?", (owner, name)).fetchall()
+                    conn.execute("DELETE FROM refs WHERE owner = ? AND name = ?", (owner, name))
+                freed = _decref(conn, [r["digest"] for r in rows]) if rows else []
+            _remove_files(freed)
+        finally:
+            conn.close()
+    return len(freed)
+
+
+# --- 読み込み ---
+def refs(owner):
+    # 戻り値: 記録の添付の一覧（name, digest, codec, size, stored_size）
+    conn = connect()
+    try:
+        return [dict(r) for r in conn.execute(
+            "SELECT r.name, r.digest, b.codec, b.size, b.stored_size FROM refs r JOIN blobs b ON b.digest = r.digest "
+            "WHERE r.owner = ? ORDER BY r.name", (owner_key(owner),))]
+    finally:
+        conn.close()
+
+
+def logical_paths(extensions=None):
+    # 添付フォルダにあったときのパス（entries/<日付>/<タイトル>/<ファイル名>）
+    conn = connect()
+    try:
+        paths = [os.path.join(r["owner"], r["name"]) for r in conn.execute("SELECT owner, name FROM refs")]
+    finally:
+        conn.close()
+    if extensions is not None:
+        paths = [p for p in paths if p.rsplit(".", 1)[-1].lower() in extensions]
+    return paths
+
+
+def _lookup(path):
+    owner, name = os.path.split(owner_key(path))
+    conn = connect()
+    try:
+        row = conn.execute("SELECT b.digest, b.codec, b.size FROM refs r JOIN blobs b ON b.digest = r.digest "
+                           "WHERE r.owner = ? AND r.name = ?", (owner, name)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        raise FileNotFoundError(path)
+    return dict(row)
+
+
+def open_attachment(path):
+    # 添付を展開しながら読むファイルオブジェクト（フォルダに残っている移行前のファイルはそのまま開く）
+    if os.path.exists(path):
+        return open(path, "rb")
+    row = _lookup(path)
+    return _open_blob(row["digest"], row["codec"])
+
+
+def resolve(path):
+    # mmap で読める実ファイルのパス。圧縮したブロブは展開済みキャッシュへ1回だけ書き出す
+    if os.path.exists(path):
+        return path
+    row = _lookup(path)
+    if row["codec"] == "raw":
+        return blob_path(row["digest"], row["codec"])
+    cached = os.path.join(CACHE_DIR, row["digest"])
+    if os.path.exists(cached):
+        return cached
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=".tmp-")
+    try:
+        with perf.fs_op("decompress") as op, os.fdopen(fd, "wb") as out, _open_blob(row["digest"], row["codec"]) as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                out.write(chunk)
+            op["bytes"] = row["size"]
+        os.replace(tmp_path, cached)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    prune_cache()
+    return cached
+
+
+def prune_cache(max_bytes=MAX_CACHE_BYTES):
+    # 展開済みキャッシュは最終アクセスの古いものから消す（ブロブ本体は消さない）
+    return storage.prune_dir(CACHE_DIR, max_bytes)
+
+
+def stats():
+    conn = connect()
+    try:
+        blob = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS size, COALESCE(SUM(stored_size), 0) AS stored "
+                            "FROM blobs").fetchone()
+        ref = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(b.size), 0) AS size FROM refs r "
+                           "JOIN blobs b ON b.digest = r.digest").fetchone()
+    finally:
+        conn.close()
+    return {"blobs": blob["n"], "refs": ref["n"], "logical_bytes": ref["size"], "unique_bytes": blob["size"],
+            "stored_bytes": blob["stored"]}
+
+
+# --- 既存の添付フォルダの移行（ブロブに入れてから元のファイルを消すので、途中で止まってもやり直せる） ---
+def _legacy_files(folder):
+    return [e for e in os.scandir(folder) if e.is_file() and not e.name.startswith(".") and not e.name.endswith(".part")]
+
+
+def legacy_folders(root="entries"):
+    # 戻り値: まだ移行していないファイルが残っている添付フォルダ（記録の .md と同じ名前のもの）
+    folders = []
+    for date_dir in sorted(os.scandir(root), key=lambda e: e.name) if os.path.isdir(root) else []:
+        if not date_dir.is_dir() or date_dir.name.startswith("."):
+            continue
+        for entry in sorted(os.scandir(date_dir.path), key=lambda e: e.name):
+            if (entry.is_dir() and not entry.name.startswith(".") and os.path.exists(entry.path + ".md")
+                    and _legacy_files(entry.path)):
+                folders.append(entry.path)
+    return folders
+
+
+def migrate(root="entries", progress=None):
+    # 戻り値: {"folders": 移行したフォルダ数, "files": ファイル数, "bytes": 元の合計バイト数}
+    files = []
+    for folder in legacy_folders(root):
+        files += [(folder, e.name, e.path, e.stat().st_size) for e in _legacy_files(folder)]
+    total = sum(size for *_, size in files) or 1
+    done = 0
+    for folder, name, path, size in files:
+        with open(path, "rb") as f:
+            add(folder, name, f)
+        os.remove(path)
+        done += size
+        if progress is not None:
+            progress(done / total, f"{os.path.relpath(path, root)}")
+    folders = sorted({folder for folder, *_ in files})
+    for folder in folders:
+        try:
+            os.rmdir(folder)
+        except OSError:
+            # 隠しファイルやサブフォルダが残っていれば消さない
+            pass
+    gc()
+    return {"folders": len(folders), "files": len(files), "bytes": sum(size for *_, size in files)}
+
+
+def gc():
+    # 表に無いブロブと、書き込み途中で止まった古い一時ファイルを消す。戻り値: 消したファイル数
+    now = time.time()
+    with storage.file_lock(DB_PATH):
+        conn = connect()
+        try:
+            known = {os.path.normpath(blob_path(r["digest"], r["codec"])) for r in conn.execute("SELECT digest, codec FROM blobs")}
+        finally:
+            conn.close()
+        removed = 0
+        for dir_path, _, file_names in os.walk(STORE_DIR):
+            for file_name in file_names:
+                path = os.path.normpath(os.path.join(dir_path, file_name))
+                if file_name.startswith(".tmp-"):
+                    if now - os.path.getmtime(path) < TEMP_MAX_AGE:
+                        continue
+                elif dir_path == STORE_DIR or path in known:
+                    continue
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+    return removed
+
+
+def main():
+    import argparse
+    import attachments
+
+    parser = argparse.ArgumentParser(description="添付ファイルのブロブストア")
+    parser.add_argument("command", choices=["migrate", "stats", "gc"])
+    args = parser.parse_args()
+    if args.command == "migrate":
+        result = migrate()
+        print(f"{result['folders']} フォルダ / {result['files']} ファイル（{attachments.format_size(result['bytes'])}）を移行しました")
+    elif args.command == "gc":
+        print(f"{gc()} ファイルを削除しました")
+    s = stats()
+    print(f"ブロブ {s['blobs']} 個 / 参照 {s['refs']} 件 / 添付の合計 {attachments.format_size(s['logical_bytes'])} → "
+          f"保存 {attachments.format_size(s['stored_bytes'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
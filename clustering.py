@@ -0,0 +1,87 @@
+import os
+import numpy as np
+
+# --- 構造特性のクラスタリング（特徴量の選択・標準化・k の自動選択・PCA） ---
+# これより行数が多い表では MiniBatchKMeans を使う
+MINIBATCH_THRESHOLD = 10000
+# シルエット係数は O(n²) なので、この点数までサンプリングして評価する
+SILHOUETTE_SAMPLE = 5000
+RANDOM_STATE = 0
+
+# 表に無い派生特徴量
+DERIVED_FEATURES = {
+    "HOMO-LUMOギャップ": lambda df: df["LUMO"] - df["HOMO"],
+}
+
+
+def add_derived(df):
+    df = df.copy()
+    for name, compute in DERIVED_FEATURES.items():
+        try:
+            df[name] = compute(df)
+        except KeyError:
+            continue
+    return df
+
+
+def prepare(df, features, scale=True):
+    # 戻り値: (特徴量行列, 使った行のインデックス)。欠損のある行は除く
+    data = df[list(features)].apply(lambda col: col.astype("float64")).dropna()
+    X = data.to_numpy()
+    if scale and len(X):
+        std = X.std(axis=0)
+        X = (X - X.mean(axis=0)) / np.where(std > 0, std, 1.0)
+    return X, data.index
+
+
+def _model(k, n_rows):
+    from sklearn.cluster import KMeans, MiniBatchKMeans
+
+    if n_rows > MINIBATCH_THRESHOLD:
+        return MiniBatchKMeans(n_clusters=k, n_init=3, batch_size=4096, random_state=RANDOM_STATE)
+    return KMeans(n_clusters=k, n_init=10, random_state=RANDOM_STATE)
+
+
+def fit(X, k):
+    model = _model(k, len(X))
+    labels = model.fit_predict(X)
+    return labels, float(model.inertia_)
+
+
+def _score(X, k):
+    from sklearn.metrics import silhouette_score
+
+    labels, inertia = fit(X, k)
+    sample = min(len(X), SILHOUETTE_SAMPLE)
+    silhouette = silhouette_score(X, labels, sample_size=sample, random_state=RANDOM_STATE) if len(set(labels)) > 1 else float("nan")
+    return {"k": k, "inertia": inertia, "silhouette": float(silhouette)}
+
+
+def sweep(X, ks, n_jobs=None, progress=None):
+    # k ごとの当てはめを複数コアで並列に評価する。progress(割合, メッセージ) を渡すと k ごとに呼ぶ
+    from joblib import Parallel, delayed
+
+    ks = [k for k in ks if 2 <= k < len(X)]
+    n_jobs = n_jobs or min(len(ks), os.cpu_count() or 1) or 1
+    scores = []
+    for score in Parallel(n_jobs=n_jobs, return_as="generator")(delayed(_score)(X, k) for k in ks):
+        scores.append(score)
+        if progress is not None:
+            progress(len(scores) / len(ks), f"k = {score['k']} を評価しました")
+    return scores
+
+
+def best_k(scores):
+    valid = [s for s in scores if not np.isnan(s["silhouette"])]
+    return max(valid, key=lambda s: s["silhouette"])["k"] if valid else None
+
+
+def pca_2d(X):
+    # 戻り値: (2次元座標, 各主成分の寄与率)
+    centered = X - X.mean(axis=0)
+    _, singular, components = np.linalg.svd(centered, full_matrices=False)
+    explained = singular ** 2 / max((singular ** 2).sum(), 1e-300)
+    coords = centered @ components[:2].T
+    if coords.shape[1] < 2:
+        coords = np.column_stack([coords, np.zeros(len(coords))])
+    return coords, explained[:2]
@@ -0,0 +1,320 @@
+import os
+import re
+import glob
+import json
+import time
+import yaml
+import perf
+import storage
+
+# --- 記録インデックス（entries/*.md のメタデータをSQLiteに保持） ---
+ENTRIES_DIR = "entries"
+INDEX_PATH = os.path.join(ENTRIES_DIR, ".index.sqlite")
+# スキーマを変えたら上げる（インデックスはキャッシュなので作り直す）
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path        TEXT PRIMARY KEY,
+    title       TEXT NOT NULL,
+    date        TEXT NOT NULL,
+    tags        TEXT NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    size        INTEGER NOT NULL,
+    body_offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_date ON entries(date);
+CREATE TABLE IF NOT EXISTS entry_tags (
+    tag  TEXT NOT NULL,
+    path TEXT NOT NULL REFERENCES entries(path) ON DELETE CASCADE,
+    PRIMARY KEY (tag, path)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    title, tags, body, tokenize = "unicode61"
+);
+"""
+
+
+# スキーマの確認はプロセスごとに1回だけ（接続のたびに書き込みロックを取らない）
+_schema_ready = set()
+
+
+def connect():
+    os.makedirs(ENTRIES_DIR, exist_ok=True)
+    fresh = INDEX_PATH not in _schema_ready or not os.path.exists(INDEX_PATH)
+    conn = storage.sqlite_connect(INDEX_PATH)
+    conn.execute("PRAGMA foreign_keys = ON")
+    if fresh:
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            conn.executescript("""
+                DROP TABLE IF EXISTS entry_tags;
+                DROP TABLE IF EXISTS entries;
+                DROP TABLE IF EXISTS entries_fts;
+            """)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.executescript(SCHEMA)
+        _schema_ready.add(INDEX_PATH)
+    return conn
+
+
+# --- 全文検索用トークナイズ（英数字は単語、日本語はバイグラム） ---
+WORD_RE = re.compile(r"[0-9A-Za-z_]+|[^\W0-9A-Za-z_]+")
+
+
+def ngram_tokens(text):
+    # 戻り値: 連続する文字列ごとのトークンのリスト（フレーズ検索に使う）
+    runs = []
+    for m in WORD_RE.finditer(text):
+        run = m.group(0)
+        if run.isascii():
+            runs.append([run.lower()])
+        elif len(run) == 1:
+            runs.append([run])
+        else:
+            runs.append([run[i:i + 2] for i in range(len(run) - 1)])
+    return runs
+
+
+def _fts_text(text):
+    return " ".join(token for run in ngram_tokens(text) for token in run)
+
+
+def fts_query(text):
+    # 各語をフレーズとしてAND結合したFTS5クエリ（1文字の日本語は前方一致）
+    phrases = []
+    for run in ngram_tokens(text):
+        phrase = '"' + " ".join(run) + '"'
+        if len(run) == 1 and len(run[0]) == 1 and not run[0].isascii():
+            phrase += "*"
+        phrases.append(phrase)
+    return " AND ".join(phrases)
+
+
+# --- フロントマター解析 ---
+def parse_entry(file_path):
+    # 戻り値: (metadata, 本文のバイトオフセット, 本文)。フロントマターが無ければ None
+    with perf.fs_op("read") as op, open(file_path, "rb") as f:
+        first = f.readline()
+        if first.strip() != b"---":
+            return None
+        meta_lines = []
+        for line in f:
+            if line.strip() == b"---":
+                break
+            meta_lines.append(line)
+        else:
+            return None
+        offset = f.tell()
+        # save_entry は区切りの後に空行を1つ入れるので読み飛ばす
+        if f.read(1) == b"\n":
+            offset += 1
+        f.seek(offset)
+        raw = f.read()
+        op["bytes"] = offset + len(raw)
+        body = raw.decode("utf-8", errors="replace")
+    metadata = yaml.safe_load(b"".join(meta_lines).decode("utf-8")) or {}
+    return metadata, offset, body
+
+
+def format_entry(metadata, body):
+    return "---\n" + yaml.dump(metadata) + "---\n\n" + body
+
+
+def new_entry_path(date, title):
+    # entries/<日付>/<slug>.md を確保する（同名があれば -2, -3, ...）
+    return storage.claim_path(os.path.join(ENTRIES_DIR, date), storage.slugify(title), ".md")
+
+
+def read_body(file_path, body_offset):
+    with perf.fs_op("read") as op, open(file_path, "rb") as f:
+        f.seek(body_offset)
+        raw = f.read()
+        op["bytes"] = len(raw)
+    return raw.decode("utf-8", errors="replace")
+
+
+def _delete(conn, paths):
+    # entries_fts の rowid は entries の rowid と一致させている
+    for file_path in paths:
+        row = conn.execute("SELECT rowid FROM entries WHERE path = ?", (file_path,)).fetchone()
+        if row is not None:
+            conn.execute("DELETE FROM entries_fts WHERE rowid = ?", (row[0],))
+            conn.execute("DELETE FROM entries WHERE rowid = ?", (row[0],))
+
+
+def _upsert(conn, file_path, st_result):
+    try:
+        parsed = parse_entry(file_path)
+    except FileNotFoundError:
+        # 他のセッションが削除した直後
+        parsed = None
+    _delete(conn, [file_path])
+    if parsed is None:
+        return
+    metadata, offset, body = parsed
+    title = str(metadata.get("title", "不明"))
+    tags = [str(t) for t in (metadata.get("tags") or [])]
+    cur = conn.execute(
+        "INSERT INTO entries (path, title, date, tags, mtime_ns, size, body_offset) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (
+            file_path,
+            title,
+            str(metadata.get("date", "不明")),
+            json.dumps(tags, ensure_ascii=False),
+            st_result.st_mtime_ns,
+            st_result.st_size,
+            offset,
+        ),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO entry_tags (tag, path) VALUES (?, ?)",
+        [(t, file_path) for t in tags],
+    )
+    conn.execute(
+        "INSERT INTO entries_fts (rowid, title, tags, body) VALUES (?, ?, ?, ?)",
+        (cur.lastrowid, _fts_text(title), _fts_text(" ".join(tags)), _fts_text(body)),
+    )
+
+
+# --- 差分同期：mtime・サイズが変わったファイルだけ再解析 ---
+def sync_index():
+    conn = connect()
+    try:
+        known = {
+            r["path"]: (r["mtime_ns"], r["size"])
+            for r in conn.execute("SELECT path, mtime_ns, size FROM entries")
+        }
+        seen = set()
+        with perf.fs_op("glob"):
+            paths = glob.glob(f"{ENTRIES_DIR}/**/*.md", recursive=True)
+        with conn:
+            stat_seconds = 0.0
+            for file_path in paths:
+                start = time.perf_counter()
+                try:
+                    st_result = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                finally:
+                    stat_seconds += time.perf_counter() - start
+                seen.add(file_path)
+                if known.get(file_path) != (st_result.st_mtime_ns, st_result.st_size):
+                    _upsert(conn, file_path, st_result)
+            _delete(conn, [p for p in known if p not in seen])
+            perf.add_fs("stat", len(paths), stat_seconds)
+    finally:
+        conn.close()
+
+
+# --- 保存・編集・削除時のインプレース更新 ---
+def upsert_entry(file_path):
+    conn = connect()
+    try:
+        with conn:
+            _upsert(conn, file_path, os.stat(file_path))
+    finally:
+        conn.close()
+
+
+def remove_entry(file_path):
+    conn = connect()
+    try:
+        with conn:
+            _delete(conn, [file_path])
+    finally:
+        conn.close()
+
+
+# --- 検索 ---
+def all_tags():
+    conn = connect()
+    try:
+        return [r["tag"] for r in conn.execute("SELECT DISTINCT tag FROM entry_tags ORDER BY tag")]
+    finally:
+        conn.close()
+
+
+SORT_ORDERS = {
+    "rank": "bm25(entries_fts, 5.0, 3.0, 1.0), e.date DESC",
+    "date_desc": "e.date DESC, e.path DESC",
+    "date_asc": "e.date ASC, e.path ASC",
+    "title": "e.title COLLATE NOCASE ASC, e.path ASC",
+}
+
+
+def _filter_sql(tags=None, tag_mode="or", date_from=None, date_to=None, text=None):
+    sql = " FROM entries e"
+    where, params = [], []
+    query = fts_query(text) if text else ""
+    if query:
+        sql += " JOIN entries_fts ON entries_fts.rowid = e.rowid"
+        where.append("entries_fts MATCH ?")
+        params.append(query)
+    if tags:
+        marks = ", ".join("?" * len(tags))
+        if tag_mode == "and":
+            where.append(f"e.path IN (SELECT path FROM entry_tags WHERE tag IN ({marks}) GROUP BY path HAVING COUNT(*) = ?)")
+            params += list(tags) + [len(set(tags))]
+        else:
+            where.append(f"e.path IN (SELECT path FROM entry_tags WHERE tag IN ({marks}))")
+            params += list(tags)
+    if date_from:
+        where.append("e.date >= ?")
+        params.append(date_from)
+    if date_to:
+        where.append("e.date <= ?")
+        params.append(date_to)
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    return sql, params, bool(query)
+
+
+def query_entries(tags=None, tag_mode="or", date_from=None, date_to=None, text=None, order="date_desc", limit=None, offset=0):
+    sql, params, ranked = _filter_sql(tags, tag_mode, date_from, date_to, text)
+    if order == "rank" and not ranked:
+        order = "date_desc"
+    sql = "SELECT e.*" + sql + " ORDER BY " + SORT_ORDERS[order]
+    if limit is not None:
+        sql += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+
+    conn = connect()
+    try:
+        return [
+            {
+                "title": r["title"],
+                "date": r["date"],
+                "tags": json.loads(r["tags"]),
+                "path": r["path"],
+                "mtime_ns": r["mtime_ns"],
+                "body_offset": r["body_offset"],
+            }
+            for r in conn.execute(sql, params)
+        ]
+    finally:
+        conn.close()
+
+
+def count_entries(tags=None, tag_mode="or", date_from=None, date_to=None, text=None):
+    sql, params, _ = _filter_sql(tags, tag_mode, date_from, date_to, text)
+    conn = connect()
+    try:
+        return conn.execute("SELECT COUNT(*)" + sql, params).fetchone()[0]
+    finally:
+        conn.close()
+
+
+# --- 検索語をハイライトした抜粋 ---
+def snippet(body, text, width=60):
+    terms = sorted({m.group(0) for m in WORD_RE.finditer(text)}, key=len, reverse=True)
+    if not terms:
+        return ""
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    m = pattern.search(body)
+    if m is None:
+        return ""
+    start = max(0, m.start() - width)
+    end = min(len(body), m.end() + width)
+    excerpt = body[start:end].replace("\n", " ")
+    excerpt = pattern.sub(lambda hit: f"**{hit.group(0)}**", excerpt)
+    return ("…" if start > 0 else "") + excerpt + ("…" if end < len(body) else "")
@@ -0,0 +1,158 @@
+import collections
+import functools
+import glob
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import threading
+import zipfile
+
+import perf
+
+# --- 書き出し（表の CSV / Parquet / Excel と、記録・構造のzipアーカイブ） ---
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "cache", "exports")
+# 形式名 → (拡張子, MIME, 必要なモジュール)
+FORMATS = {
+    "CSV": ("csv", "text/csv", None),
+    "Parquet": ("parquet", "application/vnd.apache.parquet", "pyarrow"),
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "openpyxl"),
+}
+# メモリに残す書き出し結果の上限
+MAX_CACHED_BYTES = 64 * 1024 * 1024
+# 形式ごとに残すアーカイブの数
+KEEP_ARCHIVES = 2
+
+_lock = threading.Lock()
+_cache = collections.OrderedDict()
+_cached_bytes = 0
+
+
+def available_formats():
+    return [name for name, (_, _, module) in FORMATS.items() if module is None or importlib.util.find_spec(module)]
+
+
+def frame_bytes(df, fmt, sheet_name="data"):
+    if fmt == "CSV":
+        return df.to_csv(index=False).encode("utf-8")
+    buffer = io.BytesIO()
+    if fmt == "Parquet":
+        df.to_parquet(buffer, index=False)
+    elif fmt == "Excel":
+        df.to_excel(buffer, index=False, sheet_name=sheet_name[:31])
+    else:
+        raise ValueError(f"未対応の形式: {fmt}")
+    return buffer.getvalue()
+
+
+def cached_frame_bytes(content_key, fmt, make_frame, sheet_name="data"):
+    # content_key が同じ間は書き出し結果を使い回す（ダウンロードが押されたときだけ呼ばれる）
+    global _cached_bytes
+    key = (content_key, fmt)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+    with perf.fs_op("export") as op:
+        data = frame_bytes(make_frame(), fmt, sheet_name)
+        op["bytes"] = len(data)
+    with _lock:
+        if key not in _cache:
+            _cache[key] = data
+            _cached_bytes += len(data)
+        while _cached_bytes > MAX_CACHED_BYTES and len(_cache) > 1:
+            _, dropped = _cache.popitem(last=False)
+            _cached_bytes -= len(dropped)
+    return data
+
+
+# --- zipアーカイブ（元ファイルをディスクから順に詰め、一時ファイル経由で作る） ---
+def fingerprint(paths):
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        try:
+            st_result = os.stat(path)
+        except FileNotFoundError:
+            continue
+        digest.update(f"{path}\0{st_result.st_mtime_ns}\0{st_result.st_size}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def build_archive(name, key, members):
+    # members: [(zip内の名前, 元ファイルのパス・bytes・ファイルオブジェクトを返す関数)]。同じ key のアーカイブがあれば再利用する
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f"{name}-{key[:16]}.zip")
+    if os.path.exists(path):
+        return path
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=".tmp-", suffix=".zip")
+    os.close(fd)
+    try:
+        with perf.fs_op("archive") as op, zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+            for arcname, source in members:
+                if isinstance(source, bytes):
+                    zf.writestr(arcname, source)
+                    op["bytes"] += len(source)
+                elif callable(source):
+                    # 圧縮して保存した添付は展開しながら流し込む
+                    with source() as src, zf.open(arcname, "w", force_zip64=True) as dst:
+                        for chunk in iter(lambda: src.read(1024 * 1024), b""):
+                            dst.write(chunk)
+                            op["bytes"] += len(chunk)
+                elif os.path.exists(source):
+                    # zf.write はチャンク単位でコピーするので、元ファイル全体をメモリに載せない
+                    zf.write(source, arcname)
+                    op["bytes"] += os.path.getsize(source)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _prune_archives(name)
+    return path
+
+
+def _prune_archives(name):
+    old = sorted(glob.glob(os.path.join(CACHE_DIR, f"{name}-*.zip")), key=os.path.getmtime, reverse=True)
+    for path in old[KEEP_ARCHIVES:]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def notes_archive():
+    # 全記録（.md とメタデータ一覧、添付ファイル）
+    import blobs
+    import entry_index
+
+    entry_index.sync_index()
+    records = entry_index.query_entries(order="date_asc")
+    files = []
+    stored = []
+    for record in records:
+        files.append(record["path"])
+        attach_dir = os.path.splitext(record["path"])[0]
+        if os.path.isdir(attach_dir):
+            files += [os.path.join(attach_dir, f) for f in sorted(os.listdir(attach_dir))]
+        stored += [(os.path.join(attach_dir, r["name"]), r["digest"]) for r in blobs.refs(attach_dir)]
+    metadata = [{"title": r["title"], "date": r["date"], "tags": r["tags"], "path": r["path"]} for r in records]
+    members = [("index.json", json.dumps(metadata, ensure_ascii=False, indent=1).encode("utf-8"))]
+    members += [(os.path.relpath(path, entry_index.ENTRIES_DIR), path) for path in files]
+    members += [(os.path.relpath(path, entry_index.ENTRIES_DIR), functools.partial(blobs.open_attachment, path))
+                for path, _ in stored]
+    key = hashlib.sha256((fingerprint(files) + "".join(f"{p}\0{d}\n" for p, d in stored)).encode("utf-8")).hexdigest()
+    return build_archive("notes", key, members)
+
+
+def results_archive(df):
+    # 全構造（表の CSV と構造画像）。df は load_frame() の結果
+    import results_store
+
+    images = [(name, path) for name, path in zip(df["構造名"], df["画像"]) if path and os.path.exists(path)]
+    table = frame_bytes(df[results_store.DISPLAY_KEYS], "CSV")
+    key = hashlib.sha256(table + fingerprint([path for _, path in images]).encode("utf-8")).hexdigest()
+    members = [("results.csv", table)]
+    members += [(f"images/{results_store.structure_dir(name).name}{os.path.splitext(path)[1]}", path) for name, path in images]
+    return build_archive("results", key, members)
@@ -0,0 +1,365 @@
+import argparse
+import functools
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import yaml
+
+import attachments
+import blobs
+import entry_index
+import qc_parser
+import results_store
+import storage
+
+# --- 一括取り込み（コマンドライン）：計算出力 → 構造別結果、Markdown → 記録 ---
+# 使い方:
+#   python ingest.py results <出力フォルダ> [--substrate 基板.out] [--molecule 分子.out] [--workers 8]
+#   python ingest.py notes <Markdownフォルダ> [--tag 追加タグ ...]
+# 取り込んだものは台帳（既定 .ingest_ledger.sqlite）に記録し、変更の無いものは次回読み飛ばす
+LEDGER_PATH = ".ingest_ledger.sqlite"
+BATCH_SIZE = 200
+IMAGE_NAMES = ["structure.png", "structure.jpg", "structure.jpeg"]
+
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    kind     TEXT NOT NULL,
+    source   TEXT NOT NULL,
+    mtime_ns INTEGER,
+    size     INTEGER,
+    target   TEXT,
+    PRIMARY KEY (kind, source)
+);
+"""
+
+
+# --- 台帳（取り込み済みのソースと、その時点の更新時刻・サイズ） ---
+def open_ledger(path=LEDGER_PATH):
+    conn = storage.sqlite_connect(path)
+    conn.executescript(LEDGER_SCHEMA)
+    return conn
+
+
+def _ledger_rows(conn, kind):
+    return {r["source"]: r for r in conn.execute("SELECT * FROM ledger WHERE kind = ?", (kind,))}
+
+
+def _ledger_put(conn, kind, rows):
+    # rows: [(source, (mtime_ns, size) または None, target)]
+    conn.executemany(
+        "INSERT OR REPLACE INTO ledger (kind, source, mtime_ns, size, target) VALUES (?, ?, ?, ?, ?)",
+        [(kind, source, *(signature or (None, None)), target) for source, signature, target in rows],
+    )
+
+
+def signature(paths):
+    # 複数ファイルをまとめた版：(最新の更新時刻, 合計サイズ)
+    stats = [os.stat(p) for p in paths if p]
+    return max(s.st_mtime_ns for s in stats), sum(s.st_size for s in stats)
+
+
+def _unchanged(row, sig):
+    return row is not None and (row["mtime_ns"], row["size"]) == sig
+
+
+# --- 進捗表示（標準エラーへ） ---
+class Progress:
+    def __init__(self, total, label, quiet=False):
+        self.total, self.label, self.quiet = total, label, quiet
+        self.counts = {"登録": 0, "スキップ": 0, "失敗": 0}
+        self.start = self.last = time.perf_counter()
+
+    def add(self, status):
+        self.counts[status] += 1
+        now = time.perf_counter()
+        if not self.quiet and (now - self.last > 0.5 or self.done == self.total):
+            self.last = now
+            rate = self.done / max(now - self.start, 1e-9)
+            eta = (self.total - self.done) / rate if rate else 0
+            counts = " ".join(f"{k} {v}" for k, v in self.counts.items())
+            print(f"\r{self.label}: {self.done}/{self.total}  {counts}  {rate:.1f} 件/秒  残り {eta:.0f} 秒", end="", file=sys.stderr)
+
+    @property
+    def done(self):
+        return sum(self.counts.values())
+
+    def finish(self):
+        if not self.quiet and self.total:
+            print(file=sys.stderr)
+        return dict(self.counts)
+
+
+# --- 構造別結果：出力フォルダの走査 ---
+def _is_output(file_name):
+    return file_name.rsplit(".", 1)[-1].lower() in qc_parser.OUTPUT_EXTENSIONS
+
+
+def find_structures(root, substrate=None, molecule=None, substrate_pattern="substrate", molecule_pattern="molecule"):
+    # フォルダの規約:
+    #   <root>/<構造名>/*.out   … サブフォルダ1つが1構造（出力が複数あれば <構造名>_<ファイル名>）
+    #   <root>/*.out            … 直下のファイルは1つずつ別の構造（ファイル名が構造名）
+    # ファイル名に substrate / molecule を含む出力は基板・分子として扱い、同じフォルダか
+    # 近い親フォルダのものを使う（無ければ --substrate / --molecule）
+    root = os.path.normpath(root)
+    patterns = {"substrate": substrate_pattern.lower(), "molecule": molecule_pattern.lower()}
+    fragments = {os.path.dirname(root): {"substrate": substrate, "molecule": molecule}}
+    jobs = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(d for d in dir_names if not d.startswith("."))
+        outputs = sorted(f for f in file_names if _is_output(f))
+        inherited = fragments.get(os.path.dirname(dir_path), {})
+        own = {}
+        for kind, pattern in patterns.items():
+            matched = [f for f in outputs if pattern in os.path.splitext(f)[0].lower()]
+            own[kind] = os.path.join(dir_path, matched[0]) if matched else inherited.get(kind)
+        fragments[dir_path] = own
+        fragment_names = {os.path.basename(p) for p in own.values() if p and os.path.dirname(p) == dir_path}
+        totals = [f for f in outputs if f not in fragment_names]
+
+        rel = os.path.relpath(dir_path, root)
+        image = next((os.path.join(dir_path, f) for f in IMAGE_NAMES if f in file_names), None)
+        for file_name in totals:
+            stem = os.path.splitext(file_name)[0]
+            if rel == ".":
+                name = stem
+            else:
+                name = rel.replace(os.sep, "_") if len(totals) == 1 else f"{rel.replace(os.sep, '_')}_{stem}"
+            jobs.append({
+                "name": name,
+                "total": os.path.join(dir_path, file_name),
+                "substrate": own["substrate"],
+                "molecule": own["molecule"],
+                "image": image if rel != "." else None,
+            })
+    return jobs
+
+
+# --- ワーカープロセス側：解析と派生量の計算 ---
+@functools.lru_cache(maxsize=64)
+def _parse_cached(path, mtime_ns, size):
+    # 基板・分子の出力は多くの構造で共有されるので、ワーカーごとに1回だけ解析する
+    return qc_parser.parse(path)
+
+
+def _parse(path):
+    st_result = os.stat(path)
+    return _parse_cached(path, st_result.st_mtime_ns, st_result.st_size)
+
+
+def parse_structure(job):
+    # 戻り値: (job, 構造レコード, エラーメッセージ)。1つのフォルダの失敗で一括取り込み全体を止めない
+    try:
+        total = qc_parser.parse(job["total"])
+        substrate = _parse(job["substrate"]) if job["substrate"] else None
+        molecule = _parse(job["molecule"]) if job["molecule"] else None
+        values = qc_parser.structure_values(total, substrate, molecule)
+        missing = [key for key in ["HOMO", "LUMO", "E_total", "E_substrate", "E_molecule"] if key not in values]
+        notes = f"{total['program']} 出力から一括登録: {job['total']}"
+        if missing:
+            notes += f"（未取得: {', '.join(missing)}）"
+        return job, results_store.record_from_values(values, job["name"], notes), None
+    except (OSError, ValueError) as e:
+        return job, None, f"{job['total']}: {e}"
+    except Exception as e:
+        return job, None, f"{job['total']}: {type(e).__name__}: {e}"
+
+
+# --- 構造別結果の取り込み ---
+def _store_results(batch, copy_outputs):
+    records = []
+    for job, record in batch:
+        save_dir = results_store.structure_dir(job["name"])
+        image_path = None
+        if job["image"] or copy_outputs:
+            save_dir.mkdir(parents=True, exist_ok=True)
+        if job["image"]:
+            image_path = str(save_dir / "structure.png")
+            with open(job["image"], "rb") as f:
+                attachments.save_upload(f, image_path)
+        if copy_outputs:
+            # 一覧の IR タブや自動入力から選べるよう、出力ファイルも構造フォルダへ置く
+            for path in [job["total"], job["substrate"], job["molecule"]]:
+                if path:
+                    with open(path, "rb") as f:
+                        attachments.save_upload(f, str(save_dir / os.path.basename(path)))
+        records.append((record, image_path))
+    results_store.save_results(records)
+
+
+def ingest_results(root, substrate=None, molecule=None, substrate_pattern="substrate", molecule_pattern="molecule",
+                   workers=None, force=False, dry_run=False, copy_outputs=False, ledger_path=LEDGER_PATH, quiet=False):
+    jobs = find_structures(root, substrate, molecule, substrate_pattern, molecule_pattern)
+    ledger = open_ledger(ledger_path)
+    try:
+        known = _ledger_rows(ledger, "results")
+        progress = Progress(len(jobs), "構造別結果", quiet)
+        pending = []
+        for job in jobs:
+            job["signature"] = signature([job["total"], job["substrate"], job["molecule"], job["image"]])
+            if not force and _unchanged(known.get(job["total"]), job["signature"]):
+                progress.add("スキップ")
+            else:
+                pending.append(job)
+        if dry_run:
+            for job in pending:
+                print(f"{job['name']}\t{job['total']}")
+                progress.add("登録")
+            return progress.finish()
+
+        errors, batch = [], []
+
+        def flush():
+            _store_results(batch, copy_outputs)
+            with ledger:
+                _ledger_put(ledger, "results", [(job["total"], job["signature"], job["name"]) for job, _ in batch])
+            batch.clear()
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(parse_structure, job) for job in pending]
+            for future in as_completed(futures):
+                job, record, error = future.result()
+                if error:
+                    errors.append(error)
+                    progress.add("失敗")
+                    continue
+                batch.append((job, record))
+                progress.add("登録")
+                if len(batch) >= BATCH_SIZE:
+                    flush()
+        if batch:
+            flush()
+        counts = progress.finish()
+        for error in errors:
+            print(f"⚠️ {error}", file=sys.stderr)
+        return counts
+    finally:
+        ledger.close()
+
+
+# --- 記録（Markdown）の取り込み ---
+def find_notes(root):
+    notes = []
+    for dir_path, dir_names, file_names in os.walk(root):
+        dir_names[:] = sorted(d for d in dir_names if not d.startswith("."))
+        notes.extend(os.path.join(dir_path, f) for f in sorted(file_names) if f.endswith(".md") and not f.startswith("."))
+    return notes
+
+
+def read_note(path, extra_tags=()):
+    # save_entry と同じメタデータ（title・date・tags）。フロントマターが無ければ
+    # 最初の見出し・ファイル名・更新日から補う
+    parsed = entry_index.parse_entry(path)
+    if parsed is None:
+        metadata, body = {}, attachments.read_text(path)
+    else:
+        metadata, _, body = parsed
+    title = metadata.get("title")
+    if not title:
+        heading = next((line[2:].strip() for line in body.splitlines() if line.startswith("# ")), "")
+        title = heading or os.path.splitext(os.path.basename(path))[0]
+    date = metadata.get("date") or datetime.fromtimestamp(os.path.getmtime(path)).strftime("%Y-%m-%d")
+    tags = [str(t) for t in (metadata.get("tags") or [])]
+    tags += [t for t in extra_tags if t not in tags]
+    return {"title": str(title), "date": str(date), "tags": tags}, body
+
+
+def _note_attachments(path):
+    # 記録と同じ名前のフォルダがあれば添付ファイルとして扱う
+    folder = os.path.splitext(path)[0]
+    if not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if os.path.isfile(os.path.join(folder, f))]
+
+
+def ingest_notes(root, extra_tags=(), force=False, dry_run=False, ledger_path=LEDGER_PATH, quiet=False):
+    notes = find_notes(root)
+    ledger = open_ledger(ledger_path)
+    try:
+        known = _ledger_rows(ledger, "notes")
+        progress = Progress(len(notes), "記録", quiet)
+        errors = []
+        for path in notes:
+            files = _note_attachments(path)
+            sig = signature([path] + files)
+            row = known.get(path)
+            if not force and _unchanged(row, sig):
+                progress.add("スキップ")
+                continue
+            if dry_run:
+                print(path)
+                progress.add("登録")
+                continue
+            try:
+                metadata, body = read_note(path, extra_tags)
+                # 前回の取り込み先があれば上書きし、同じ記録を二重に作らない
+                target = row["target"] if row is not None and row["target"] and os.path.exists(row["target"]) else None
+                if target is None:
+                    target = entry_index.new_entry_path(metadata["date"], metadata["title"])
+                    with ledger:
+                        _ledger_put(ledger, "notes", [(path, None, target)])
+                storage.atomic_write(target, entry_index.format_entry(metadata, body))
+                if files:
+                    # 添付はブロブストアへ（同じ内容のファイルは記録をまたいで1つだけ保存される）
+                    attach_dir = os.path.splitext(target)[0]
+                    for file_path in files:
+                        with open(file_path, "rb") as f:
+                            blobs.add(attach_dir, os.path.basename(file_path), f)
+            except (OSError, ValueError, yaml.YAMLError) as e:
+                errors.append(f"{path}: {e}")
+                progress.add("失敗")
+                continue
+            with ledger:
+                _ledger_put(ledger, "notes", [(path, sig, target)])
+            progress.add("登録")
+        if not dry_run:
+            entry_index.sync_index()
+        counts = progress.finish()
+        for error in errors:
+            print(f"⚠️ {error}", file=sys.stderr)
+        return counts
+    finally:
+        ledger.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="計算出力・Markdown記録の一括取り込み")
+    parser.add_argument("--ledger", default=LEDGER_PATH, help="取り込み台帳のパス")
+    parser.add_argument("--force", action="store_true", help="台帳を無視してすべて取り込み直す")
+    parser.add_argument("--dry-run", action="store_true", help="取り込み対象を表示するだけで書き込まない")
+    parser.add_argument("--quiet", action="store_true", help="進捗を表示しない")
+    sub = parser.add_subparsers(dest="kind", required=True)
+
+    p_results = sub.add_parser("results", help="ORCA / Gaussian の出力から構造別結果を登録")
+    p_results.add_argument("root")
+    p_results.add_argument("--substrate", help="共通の基板の出力ファイル（E_substrate）")
+    p_results.add_argument("--molecule", help="共通の分子の出力ファイル（E_molecule）")
+    p_results.add_argument("--substrate-pattern", default="substrate", help="基板の出力とみなすファイル名の一部")
+    p_results.add_argument("--molecule-pattern", default="molecule", help="分子の出力とみなすファイル名の一部")
+    p_results.add_argument("--workers", type=int, default=None, help="解析に使うプロセス数（既定: CPU数）")
+    p_results.add_argument("--copy-outputs", action="store_true", help="出力ファイルを results/<構造名>/ にコピーする")
+
+    p_notes = sub.add_parser("notes", help="Markdown ファイルを記録として取り込む")
+    p_notes.add_argument("root")
+    p_notes.add_argument("--tag", action="append", default=[], help="すべての記録に付けるタグ（複数可）")
+
+    args = parser.parse_args(argv)
+    common = {"force": args.force, "dry_run": args.dry_run, "ledger_path": args.ledger, "quiet": args.quiet}
+    try:
+        if args.kind == "results":
+            counts = ingest_results(args.root, args.substrate, args.molecule, args.substrate_pattern, args.molecule_pattern,
+                                    workers=args.workers, copy_outputs=args.copy_outputs, **common)
+        else:
+            counts = ingest_notes(args.root, args.tag, **common)
+    except sqlite3.Error as e:
+        print(f"⚠️ データベースに書き込めませんでした: {e}", file=sys.stderr)
+        return 1
+    print(" / ".join(f"{k} {v} 件" for k, v in counts.items()))
+    return 1 if counts["失敗"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import hashlib
+import numpy as np
+
+# --- IRスペクトルのブロードニング ---
+LINESHAPES = ["Gaussian", "Lorentzian", "pseudo-Voigt"]
+
+# 直接計算で一度に確保する (ピーク数 × グリッド点数) 行列の上限要素数
+CHUNK_ELEMENTS = 4_000_000
+# これを超えるピーク数ではスティックスペクトル＋FFT畳み込みに切り替える
+FFT_THRESHOLD = 2000
+# FFT はピークをグリッドへビン分けするので、σ がグリッド間隔のこの倍数以上のときだけ使う
+# （4 倍で直接計算との差はピーク最大値の 0.3 % 程度。σ ≈ 間隔では 6 % を超える）
+FFT_MIN_SIGMA_STEPS = 4.0
+
+FWHM_PER_SIGMA = 2.0 * np.sqrt(2.0 * np.log(2.0))
+
+
+def make_grid(x_min=400.0, x_max=4000.0, n_points=5000):
+    return np.linspace(x_min, x_max, int(n_points))
+
+
+def peaks_hash(freqs, intensities):
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(freqs, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(intensities, dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+# --- 線形（ピーク高さ1に規格化、幅はガウスのσで統一） ---
+def profile(offset, sigma, lineshape="Gaussian", eta=0.5):
+    gamma = FWHM_PER_SIGMA * sigma / 2.0
+    if lineshape == "Gaussian":
+        return np.exp(-(offset ** 2) / (2.0 * sigma ** 2))
+    if lineshape == "Lorentzian":
+        return gamma ** 2 / (offset ** 2 + gamma ** 2)
+    if lineshape == "pseudo-Voigt":
+        g = np.exp(-(offset ** 2) / (2.0 * sigma ** 2))
+        l = gamma ** 2 / (offset ** 2 + gamma ** 2)
+        return eta * l + (1.0 - eta) * g
+    raise ValueError(f"未対応の線形です: {lineshape}")
+
+
+def _broaden_direct(x, freqs, intensities, sigma, lineshape, eta):
+    y = np.zeros_like(x)
+    chunk = max(1, CHUNK_ELEMENTS // len(x))
+    for start in range(0, len(freqs), chunk):
+        f = freqs[start:start + chunk]
+        kernel = profile(x[None, :] - f[:, None], sigma, lineshape, eta)
+        y += intensities[start:start + chunk] @ kernel
+    return y
+
+
+def _broaden_fft(x, freqs, intensities, sigma, lineshape, eta):
+    # 等間隔グリッドを前後にn点ずつ拡張してスティックを線形補間でビン分けし、線形カーネルと畳み込む
+    if x[-1] < x[0]:
+        # 降順のグリッドは昇順で計算して並びを戻す（直接計算と同じ結果にする）
+        return _broaden_fft(x[::-1], freqs, intensities, sigma, lineshape, eta)[::-1]
+    n = len(x)
+    dx = x[1] - x[0]
+    pos = (freqs - x[0]) / dx + n
+    lo = np.floor(pos).astype(np.int64)
+    frac = pos - lo
+    sticks = np.zeros(3 * n + 1)
+    for idx, weight in ((lo, 1.0 - frac), (lo + 1, frac)):
+        inside = (idx >= 0) & (idx <= 3 * n)
+        np.add.at(sticks, idx[inside], intensities[inside] * weight[inside])
+
+    kernel = profile(np.arange(-2 * n, 2 * n + 1) * dx, sigma, lineshape, eta)
+    size = 1 << int(np.ceil(np.log2(len(sticks) + len(kernel) - 1)))
+    full = np.fft.irfft(np.fft.rfft(sticks, size) * np.fft.rfft(kernel, size), size)
+    return full[3 * n:4 * n]
+
+
+def broaden(freqs, intensities, x, sigma=10.0, lineshape="Gaussian", eta=0.5, scale=1.0, method="auto"):
+    freqs = np.asarray(freqs, dtype=np.float64) * scale
+    intensities = np.asarray(intensities, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    if len(freqs) == 0:
+        return np.zeros_like(x)
+    if method == "auto":
+        use_fft = len(freqs) > FFT_THRESHOLD and len(x) > 1 and sigma >= FFT_MIN_SIGMA_STEPS * abs(x[1] - x[0])
+        method = "fft" if use_fft else "direct"
+    if method == "fft":
+        return _broaden_fft(x, freqs, intensities, sigma, lineshape, eta)
+    return _broaden_direct(x, freqs, intensities, sigma, lineshape, eta)
+
+
+# --- バッチ処理（複数スペクトルを共通グリッドで並列にブロードニング） ---
+def read_peaks(source):
+    import pandas as pd
+    df = pd.read_csv(source, header=None, names=["freq", "intensity"])
+    return df["freq"].to_numpy(dtype=float), df["intensity"].to_numpy(dtype=float)
+
+
+def _broaden_job(job):
+    freqs, intensities, x, options = job
+    return broaden(freqs, intensities, x, **options)
+
+
+def broaden_many(peak_lists, x, max_workers=None, progress=None, **options):
+    # 戻り値: (スペクトル数 × グリッド点数) の2次元配列。progress(割合, メッセージ) を渡すと1本ごとに呼ぶ
+    from concurrent.futures import ProcessPoolExecutor
+
+    x = np.asarray(x, dtype=np.float64)
+    jobs = [(f, i, x, options) for f, i in peak_lists]
+    if not jobs:
+        return np.zeros((0, len(x)))
+    rows = []
+    if len(jobs) == 1 or max_workers == 1:
+        results = map(_broaden_job, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+        results = pool.map(_broaden_job, jobs)
+    try:
+        for row in results:
+            rows.append(row)
+            if progress is not None:
+                progress(len(rows) / len(jobs), f"{len(rows)} / {len(jobs)} 本")
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return np.vstack(rows)
+
+
+def normalize(spectra):
+    peak = np.abs(spectra).max(axis=1, keepdims=True)
+    return np.divide(spectra, peak, out=np.zeros_like(spectra), where=peak > 0)
+
+
+def difference(spectra, reference_index):
+    return spectra - spectra[reference_index]
+
+
+def to_wide_frame(x, spectra, names):
+    import pandas as pd
+    data = {"Wavenumber (cm⁻¹)": x}
+    data.update({name: row for name, row in zip(names, spectra)})
+    return pd.DataFrame(data)
@@ -0,0 +1,253 @@
+import functools
+import hashlib
+import os
+import pickle
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+import perf
+import storage
+
+# --- バックグラウンドジョブ（スクリプトのスレッドの外で実行し、進捗と結果をディスクに残す） ---
+JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "cache", "jobs")
+DB_PATH = os.path.join(JOBS_DIR, "jobs.sqlite")
+# 同時に走らせるジョブの数（重い処理は中でさらにプロセスを使う）
+MAX_WORKERS = int(os.environ.get("QIDT_JOB_WORKERS", "2"))
+# 進捗を表へ書き込む間隔（秒）
+PROGRESS_INTERVAL = 0.5
+# 結果ファイルの上限。超えたら古いものから消す（消えた結果は次に頼まれたとき計算し直す）
+MAX_RESULT_BYTES = 512 * 1024 * 1024
+FINISHED = ("done", "failed", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key         TEXT PRIMARY KEY,
+    kind        TEXT NOT NULL,
+    label       TEXT NOT NULL DEFAULT '',
+    status      TEXT NOT NULL,
+    progress    REAL NOT NULL DEFAULT 0,
+    message     TEXT NOT NULL DEFAULT '',
+    error       TEXT,
+    pid         INTEGER,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at);
+"""
+
+
+class JobCancelled(BaseException):
+    # ジョブ関数の中の except Exception で握りつぶされないよう BaseException から派生させる
+    pass
+
+
+_schema_ready = set()
+_lock = threading.Lock()
+_executor = None
+_futures = {}
+# このプロセスで動いているジョブの最新状態（表を読まずに進捗を返す）
+_live = {}
+_cancel_requested = set()
+
+
+def connect():
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    fresh = DB_PATH not in _schema_ready or not os.path.exists(DB_PATH)
+    conn = storage.sqlite_connect(DB_PATH)
+    if fresh:
+        conn.executescript(SCHEMA)
+        _recover(conn)
+        _schema_ready.add(DB_PATH)
+    return conn
+
+
+def _alive(pid):
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _recover(conn):
+    # 前回のプロセスが落ちて走りかけのまま残ったジョブは中断扱いにする
+    stale = [(row["key"],) for row in conn.execute("SELECT key, pid FROM jobs WHERE status IN ('queued', 'running')")
+             if not _alive(row["pid"]) or (row["pid"] == os.getpid() and row["key"] not in _futures)]
+    if stale:
+        with conn:
+            conn.executemany("UPDATE jobs SET status = 'failed', error = 'プロセスの終了で中断されました', "
+                             "finished_at = ? WHERE key = ?", [(time.time(), key) for key, in stale])
+
+
+def _update(key, **values):
+    with _lock:
+        if key in _live:
+            _live[key].update(values)
+    conn = connect()
+    try:
+        with conn:
+            conn.execute(f"UPDATE jobs SET {', '.join(f'{k} = ?' for k in values)} WHERE key = ?", (*values.values(), key))
+    finally:
+        conn.close()
+
+
+def job_key(kind, inputs):
+    # inputs は repr が内容で決まるもの（文字列・数値・タプル）に限る
+    return hashlib.sha256(repr((kind, inputs)).encode("utf-8")).hexdigest()[:32]
+
+
+def result_path(key):
+    return os.path.join(JOBS_DIR, f"{key}.pkl")
+
+
+# --- 実行 ---
+class Progress:
+    # ジョブ関数に progress= で渡す。progress(割合, メッセージ) を何度呼んでも書き込みは間引く
+    def __init__(self, key):
+        self.key = key
+        self.last_write = 0.0
+
+    def __call__(self, fraction, message=""):
+        if self.key in _cancel_requested:
+            raise JobCancelled()
+        fraction = min(max(float(fraction), 0.0), 1.0)
+        with _lock:
+            _live[self.key].update(progress=fraction, message=message)
+        now = time.monotonic()
+        if now - self.last_write >= PROGRESS_INTERVAL:
+            self.last_write = now
+            _update(self.key, progress=fraction, message=message)
+
+
+def _run(key, kind, fn, args, kwargs):
+    if key in _cancel_requested:
+        _finish(key, status="cancelled")
+        return
+    _update(key, status="running", started_at=time.time())
+    try:
+        with perf.section(f"ジョブ: {kind}"):
+            result = fn(*args, progress=Progress(key), **kwargs)
+            data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+            storage.atomic_write(result_path(key), data)
+        _finish(key, status="done", progress=1.0, message="")
+        prune()
+    except JobCancelled:
+        _finish(key, status="cancelled")
+    except Exception as e:
+        _finish(key, status="failed", error=f"{type(e).__name__}: {e}\n{traceback.format_exc(limit=5)}")
+
+
+def _finish(key, **values):
+    _update(key, finished_at=time.time(), **values)
+    with _lock:
+        _live.pop(key, None)
+        _cancel_requested.discard(key)
+
+
+def submit(kind, inputs, fn, *args, label="", retry=False, reuse=True, **kwargs):
+    # 戻り値: ジョブのキー。同じ (kind, inputs) が実行中・完了済みなら新しく走らせない
+    # retry: 失敗・中止したジョブをやり直す。reuse=False: 完了済みでも走らせ直す（副作用が目的のジョブ）
+    global _executor
+    key = job_key(kind, inputs)
+    with _lock:
+        future = _futures.get(key)
+        if future is not None and not future.done():
+            return key
+    row = status(key)
+    if row is not None:
+        if row["status"] == "done" and reuse and os.path.exists(result_path(key)):
+            return key
+        if row["status"] in ("failed", "cancelled") and not retry:
+            return key
+        if row["status"] in ("queued", "running") and row["pid"] != os.getpid() and _alive(row["pid"]):
+            # 別のサーバープロセスが同じジョブを実行中
+            return key
+    conn = connect()
+    try:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO jobs (key, kind, label, status, progress, message, pid, created_at) "
+                         "VALUES (?, ?, ?, 'queued', 0, '', ?, ?)", (key, kind, label, os.getpid(), time.time()))
+    finally:
+        conn.close()
+    with _lock:
+        future = _futures.get(key)
+        if future is not None and not future.done():
+            return key
+        _live[key] = {"key": key, "kind": kind, "label": label, "status": "queued", "progress": 0.0, "message": "",
+                      "error": None, "pid": os.getpid()}
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="qidt-job")
+        _futures[key] = _executor.submit(_run, key, kind, fn, args, kwargs)
+    return key
+
+
+def wait(key, timeout):
+    # 短いジョブは画面を待たせずにその場で終わらせるため、少しだけ待つ
+    with _lock:
+        future = _futures.get(key)
+    if future is not None:
+        try:
+            future.result(timeout)
+        except Exception:
+            pass
+    return status(key)
+
+
+def cancel(key):
+    with _lock:
+        running = key in _live
+        if running:
+            _cancel_requested.add(key)
+    if not running:
+        row = status(key)
+        if row is not None and row["status"] not in FINISHED:
+            _update(key, status="cancelled", finished_at=time.time())
+
+
+# --- 状態・結果 ---
+def status(key):
+    with _lock:
+        if key in _live:
+            return dict(_live[key])
+    conn = connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE key = ?", (key,)).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row is not None else None
+
+
+@functools.lru_cache(maxsize=8)
+def _load(path, mtime_ns):
+    with perf.fs_op("read") as op, open(path, "rb") as f:
+        data = f.read()
+        op["bytes"] = len(data)
+    return pickle.loads(data)
+
+
+def result(key):
+    path = result_path(key)
+    return _load(path, os.stat(path).st_mtime_ns)
+
+
+def recent(limit=50):
+    conn = connect()
+    try:
+        return [dict(row) for row in conn.execute(
+            "SELECT key, kind, label, status, progress, message, error, created_at, started_at, finished_at "
+            "FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))]
+    finally:
+        conn.close()
+
+
+def prune(max_bytes=MAX_RESULT_BYTES):
+    # 最終アクセスの古い結果から消して上限に収める
+    return storage.prune_dir(JOBS_DIR, max_bytes, "*.pkl")
@@ -0,0 +1,200 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+
+# --- 性能計測（区間ごとの時間・ファイル操作・読み込みバイト数・セッションごとの再実行回数） ---
+# QIDT_PERF=0 で無効化。計測はスクリプト実行スレッドごとに分けて記録する
+ENABLED = os.environ.get("QIDT_PERF", "1") != "0"
+# セッションに残す直近の実行数
+HISTORY = 50
+IO_PATH = "/proc/thread-self/io"
+
+_lock = threading.Lock()
+_local = threading.local()
+# プロセス全体の累計（Prometheus 形式で出力する）
+_totals = {
+    "runs": 0,
+    "sessions": 0,
+    "run_seconds": 0.0,
+    "read_bytes": 0,
+    "read_syscalls": 0,
+    "tabs": {},
+    "sections": {},
+    "fs": {},
+}
+
+
+def _io_counters():
+    # Linux ではスレッド単位の read 系システムコールのバイト数・回数が取れる（mmap 経由は含まない）
+    try:
+        with open(IO_PATH, "rb") as f:
+            fields = dict(line.split(b":", 1) for line in f.read().splitlines() if b":" in line)
+        return int(fields[b"rchar"]), int(fields[b"syscr"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _add(table, key, **values):
+    entry = table.setdefault(key, {})
+    for name, value in values.items():
+        entry[name] = entry.get(name, 0) + value
+    if "seconds" in values:
+        entry["max_seconds"] = max(entry.get("max_seconds", 0.0), values["seconds"])
+
+
+# --- 1回のスクリプト実行 ---
+def begin_run(session_state):
+    if not ENABLED:
+        return
+    if "perf_session" not in session_state:
+        session_state["perf_session"] = uuid.uuid4().hex
+        with _lock:
+            _totals["sessions"] += 1
+    session_state["perf_runs"] = session_state.get("perf_runs", 0) + 1
+    _local.run = {
+        "start": time.perf_counter(),
+        "io": _io_counters(),
+        "sections": {},
+        "fs": {},
+    }
+
+
+def end_run(session_state, tab):
+    run = getattr(_local, "run", None)
+    if run is None:
+        return None
+    _local.run = None
+    seconds = time.perf_counter() - run["start"]
+    io_end = _io_counters()
+    read_bytes = read_syscalls = None
+    if run["io"] is not None and io_end is not None:
+        read_bytes, read_syscalls = io_end[0] - run["io"][0], io_end[1] - run["io"][1]
+    summary = {
+        "run": session_state.get("perf_runs", 0),
+        "tab": tab,
+        "at": time.time(),
+        "seconds": seconds,
+        "read_bytes": read_bytes,
+        "read_syscalls": read_syscalls,
+        "sections": run["sections"],
+        "fs": run["fs"],
+    }
+    history = session_state.setdefault("perf_history", collections.deque(maxlen=HISTORY))
+    history.append(summary)
+    with _lock:
+        _totals["runs"] += 1
+        _totals["run_seconds"] += seconds
+        _totals["read_bytes"] += read_bytes or 0
+        _totals["read_syscalls"] += read_syscalls or 0
+        _add(_totals["tabs"], tab, count=1, seconds=seconds)
+    return summary
+
+
+# --- 区間の計測 ---
+@contextlib.contextmanager
+def section(name):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_section(name, time.perf_counter() - start)
+
+
+def add_section(name, seconds):
+    run = getattr(_local, "run", None)
+    if run is not None:
+        _add(run["sections"], name, count=1, seconds=seconds)
+    with _lock:
+        _add(_totals["sections"], name, count=1, seconds=seconds)
+
+
+# --- ファイル操作の計測（種類ごとの回数・時間・読み込みバイト数） ---
+@contextlib.contextmanager
+def fs_op(kind):
+    # with fs_op("read") as op: ... op["bytes"] = n のように、終わってからバイト数・回数を渡せる
+    op = {"count": 1, "bytes": 0}
+    if not ENABLED:
+        yield op
+        return
+    start = time.perf_counter()
+    try:
+        yield op
+    finally:
+        add_fs(kind, op["count"], time.perf_counter() - start, op["bytes"])
+
+
+def add_fs(kind, count=1, seconds=0.0, n_bytes=0):
+    if not ENABLED:
+        return
+    run = getattr(_local, "run", None)
+    if run is not None:
+        _add(run["fs"], kind, count=count, seconds=seconds, bytes=n_bytes)
+    with _lock:
+        _add(_totals["fs"], kind, count=count, seconds=seconds, bytes=n_bytes)
+
+
+# --- 出力 ---
+def totals():
+    with _lock:
+        return json.loads(json.dumps(_totals))
+
+
+def snapshot(session_state):
+    return {
+        "session": {
+            "id": session_state.get("perf_session"),
+            "runs": session_state.get("perf_runs", 0),
+            "history": list(session_state.get("perf_history", [])),
+        },
+        "process": totals(),
+    }
+
+
+def to_json(session_state):
+    return json.dumps(snapshot(session_state), ensure_ascii=False, indent=2)
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def to_prometheus():
+    data = totals()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            label_text = ",".join(f'{k}="{_label(v)}"' for k, v in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    metric("qidt_script_runs_total", "counter", "Script reruns across all sessions.", [({}, data["runs"])])
+    metric("qidt_sessions_total", "counter", "Browser sessions seen by this process.", [({}, data["sessions"])])
+    metric("qidt_script_run_seconds_total", "counter", "Wall time spent in script runs.", [({}, data["run_seconds"])])
+    metric("qidt_read_bytes_total", "counter", "Bytes read by script runs (read syscalls).", [({}, data["read_bytes"])])
+    metric("qidt_read_syscalls_total", "counter", "Read syscalls made by script runs.", [({}, data["read_syscalls"])])
+    metric("qidt_tab_runs_total", "counter", "Script runs per tab.",
+           [({"tab": tab}, v["count"]) for tab, v in data["tabs"].items()])
+    metric("qidt_tab_run_seconds_total", "counter", "Wall time per tab.",
+           [({"tab": tab}, v["seconds"]) for tab, v in data["tabs"].items()])
+    metric("qidt_section_calls_total", "counter", "Timed section executions.",
+           [({"section": name}, v["count"]) for name, v in data["sections"].items()])
+    metric("qidt_section_seconds_total", "counter", "Wall time per section.",
+           [({"section": name}, v["seconds"]) for name, v in data["sections"].items()])
+    metric("qidt_section_max_seconds", "gauge", "Slowest single execution per section.",
+           [({"section": name}, v["max_seconds"]) for name, v in data["sections"].items()])
+    metric("qidt_fs_ops_total", "counter", "File-system operations by kind.",
+           [({"op": kind}, v["count"]) for kind, v in data["fs"].items()])
+    metric("qidt_fs_seconds_total", "counter", "Wall time in file-system operations by kind.",
+           [({"op": kind}, v["seconds"]) for kind, v in data["fs"].items()])
+    metric("qidt_fs_read_bytes_total", "counter", "Bytes read by file-system operations by kind.",
+           [({"op": kind}, v["bytes"]) for kind, v in data["fs"].items()])
+    return "\n".join(lines) + "\n"
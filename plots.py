@@ -0,0 +1,70 @@
+import io
+import numpy as np
+
+# --- 構造特性の散布図（大量点向け：ラベル間引き・インタラクティブ表示・PNGキャッシュ） ---
+# 既定で名前ラベルを付ける点の上限（残りはホバーで表示）
+MAX_LABELS = 30
+
+
+def label_mask(df, x_axis, y_axis, max_labels=MAX_LABELS, selected=(), name_col="構造名"):
+    # 点が少なければ全点、多ければロバストZスコアで外れ値上位＋選択した構造だけにラベルを付ける
+    n = len(df)
+    if n <= max_labels:
+        return np.ones(n, dtype=bool)
+    points = df[[x_axis, y_axis]].to_numpy(dtype=float)
+    median = np.nanmedian(points, axis=0)
+    mad = np.nanmedian(np.abs(points - median), axis=0) * 1.4826
+    z = np.abs(points - median) / np.where(mad > 0, mad, 1.0)
+    score = np.nan_to_num(np.hypot(z[:, 0], z[:, 1]), nan=-1.0)
+    mask = np.zeros(n, dtype=bool)
+    if max_labels > 0:
+        mask[np.argpartition(-score, max_labels - 1)[:max_labels]] = True
+    if selected:
+        mask |= df[name_col].isin(list(selected)).to_numpy()
+    return mask
+
+
+def scatter_png(df, x_axis, y_axis, mask, tag_col="タグ", name_col="構造名", dpi=110):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+
+    fig, ax = plt.subplots()
+    tags = df[tag_col].unique()
+    colors = sns.color_palette("husl", len(tags))
+    # 点が多いときは小さく・半透明にし、ラスタライズしてベクタ要素を増やさない
+    size = 36 if len(df) <= 500 else max(4, 36 * 500 / len(df))
+    for tag, color in zip(tags, colors):
+        subset = df[df[tag_col] == tag]
+        ax.scatter(subset[x_axis], subset[y_axis], label=tag, color=color, s=size,
+                   alpha=1.0 if len(df) <= 500 else 0.6, rasterized=True, linewidths=0)
+    labelled = df[mask]
+    for name, x, y in zip(labelled[name_col], labelled[x_axis], labelled[y_axis]):
+        ax.annotate(name, (x, y), fontsize=8)
+    ax.set_xlabel(x_axis)
+    ax.set_ylabel(y_axis)
+    ax.set_title(f"{y_axis} vs {x_axis} by タグ")
+    ax.legend()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def scatter_chart(df, x_axis, y_axis, mask, tag_col="タグ", name_col="構造名"):
+    import altair as alt
+
+    data = df[[name_col, tag_col, x_axis, y_axis]].copy()
+    data["_label"] = np.where(mask, data[name_col], "")
+    # 列名に記号を含むので、Vega-Lite 用に安全な名前へ置き換える
+    data.columns = ["name", "tag", "x", "y", "label"]
+    base = alt.Chart(data).encode(
+        x=alt.X("x:Q", title=x_axis, scale=alt.Scale(zero=False)),
+        y=alt.Y("y:Q", title=y_axis, scale=alt.Scale(zero=False)),
+    )
+    points = base.mark_circle(size=60 if len(data) <= 500 else 20, opacity=0.8).encode(
+        color=alt.Color("tag:N", title=tag_col),
+        tooltip=[alt.Tooltip("name:N", title=name_col), alt.Tooltip("tag:N", title=tag_col),
+                 alt.Tooltip("x:Q", title=x_axis, format=".6g"), alt.Tooltip("y:Q", title=y_axis, format=".6g")],
+    )
+    labels = base.transform_filter(alt.datum.label != "").mark_text(align="left", dx=5, dy=-5, fontSize=10).encode(text="label:N")
+    return (points + labels).properties(title=f"{y_axis} vs {x_axis} by タグ").interactive()
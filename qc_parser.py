@@ -0,0 +1,249 @@
+import glob
+import mmap
+import os
+import re
+import perf
+
+# --- ORCA / Gaussian 出力ファイルの1パス解析（メモリ使用量はファイルサイズに依存しない） ---
+OUTPUT_EXTENSIONS = ["out", "log"]
+
+FLOAT_RE = re.compile(rb"-?\d+\.\d+(?:[eEdD][-+]?\d+)?")
+ORCA_ORBITAL_RE = re.compile(rb"^\s*\d+\s+([\d.]+)\s+(-?\d+\.\d+)\s+-?\d+\.\d+\s*$")
+# 開殻系ではスピン密度の列が続く
+ORCA_MULLIKEN_RE = re.compile(rb"^\s*\d+\s+\S+\s*:\s*(-?\d+\.\d+)(?:\s+-?\d+\.\d+)?\s*$")
+ORCA_IR_RE = re.compile(rb"^\s*\d+:\s+(-?\d+\.\d+)\s+[-\d.eE+]+\s+([-\d.eE+]+)")
+GAUSSIAN_EIGEN_RE = re.compile(rb"-?\d+\.\d{5}")
+GAUSSIAN_MULLIKEN_RE = re.compile(rb"^\s*\d+\s+\S+\s+(-?\d+\.\d+)(?:\s+-?\d+\.\d+)?\s*$")
+
+
+def _floats(line):
+    return [float(v.replace(b"D", b"E").replace(b"d", b"e")) for v in FLOAT_RE.findall(line)]
+
+
+def _last_float(line, default=None):
+    values = _floats(line)
+    return values[-1] if values else default
+
+
+def _eigenvalues(values):
+    # Gaussian の固有値は F10.5 なので、負号同士が連結されても小数5桁で区切れる
+    return [float(v) for v in GAUSSIAN_EIGEN_RE.findall(values)]
+
+
+def _new_result():
+    return {
+        "program": None,
+        "scf_energy": None,
+        "homo": None,
+        "lumo": None,
+        "mulliken": [],
+        "dipole": None,
+        "frequencies": [],
+        "intensities": [],
+    }
+
+
+# --- ORCA ---
+def _parse_orca(lines, result):
+    state = None
+    orbitals, mulliken, freqs, intens = [], [], [], []
+    for line in lines:
+        if state == "orbitals":
+            m = ORCA_ORBITAL_RE.match(line)
+            if m:
+                orbitals.append((float(m.group(1)), float(m.group(2))))
+                continue
+            if orbitals or b"SPIN DOWN" in line:
+                result["homo"], result["lumo"] = _frontier(orbitals)
+                state = None
+            continue
+        if state == "mulliken":
+            m = ORCA_MULLIKEN_RE.match(line)
+            if m:
+                mulliken.append(float(m.group(1)))
+                continue
+            if line.lstrip().startswith(b"Sum of atomic charges") or (mulliken and not line.strip()):
+                result["mulliken"] = mulliken
+                state = None
+            continue
+        if state == "ir":
+            m = ORCA_IR_RE.match(line)
+            if m:
+                freqs.append(float(m.group(1)))
+                intens.append(float(m.group(2)))
+                continue
+            if freqs and not line.strip():
+                result["frequencies"], result["intensities"] = freqs, intens
+                state = None
+            continue
+
+        stripped = line.lstrip()
+        if stripped.startswith(b"FINAL SINGLE POINT ENERGY"):
+            # 書き込み途中の行（数値がまだ無い）は読み飛ばす
+            result["scf_energy"] = _last_float(line, result["scf_energy"])
+        elif stripped.startswith(b"ORBITAL ENERGIES"):
+            state, orbitals = "orbitals", []
+        elif stripped.startswith(b"MULLIKEN ATOMIC CHARGES"):
+            state, mulliken = "mulliken", []
+        elif stripped.startswith(b"Magnitude (Debye)"):
+            result["dipole"] = _last_float(line, result["dipole"])
+        elif stripped.startswith(b"IR SPECTRUM"):
+            state, freqs, intens = "ir", [], []
+    if state == "orbitals" and orbitals:
+        result["homo"], result["lumo"] = _frontier(orbitals)
+    if state == "mulliken" and mulliken:
+        result["mulliken"] = mulliken
+    if state == "ir" and freqs:
+        result["frequencies"], result["intensities"] = freqs, intens
+
+
+def _frontier(orbitals):
+    homo = lumo = None
+    for occupation, energy in orbitals:
+        if occupation > 0:
+            homo = energy
+        elif lumo is None:
+            lumo = energy
+    return homo, lumo
+
+
+# --- Gaussian ---
+def _parse_gaussian(lines, result):
+    state = None
+    occupied, virtual, mulliken = [], [], []
+    freqs, intens = [], []
+    in_eigen_block = False
+    expect_dipole = False
+    for line in lines:
+        if state == "mulliken":
+            m = GAUSSIAN_MULLIKEN_RE.match(line)
+            if m:
+                mulliken.append(float(m.group(1)))
+                continue
+            if b"Sum of Mulliken" in line:
+                result["mulliken"] = mulliken
+                state = None
+            continue
+
+        if expect_dipole:
+            expect_dipole = False
+            if b"Tot=" in line:
+                result["dipole"] = _last_float(line, result["dipole"])
+                continue
+
+        stripped = line.lstrip()
+        if stripped.startswith(b"Alpha  occ. eigenvalues --") or stripped.startswith(b"Alpha virt. eigenvalues --"):
+            if not in_eigen_block:
+                occupied, virtual, in_eigen_block = [], [], True
+            values = _eigenvalues(line.split(b"--", 1)[1])
+            (occupied if b"occ." in line else virtual).extend(values)
+            continue
+        if in_eigen_block and not stripped.startswith(b"Beta"):
+            in_eigen_block = False
+            result["homo"] = occupied[-1] if occupied else None
+            result["lumo"] = virtual[0] if virtual else None
+
+        if stripped.startswith(b"SCF Done:"):
+            values = _floats(line.partition(b"=")[2])
+            if values:
+                result["scf_energy"] = values[0]
+        elif (stripped.startswith(b"Mulliken charges") or stripped.startswith(b"Mulliken atomic charges")) \
+                and b"hydrogens summed" not in line:
+            state, mulliken = "mulliken", []
+        elif stripped.startswith(b"Dipole moment (field-independent basis, Debye)"):
+            expect_dipole = True
+        elif stripped.startswith(b"Harmonic frequencies"):
+            freqs, intens = [], []
+        elif stripped.startswith(b"Frequencies --"):
+            freqs.extend(_floats(line.split(b"--", 1)[1]))
+        elif stripped.startswith(b"IR Inten    --"):
+            intens.extend(_floats(line.split(b"--", 1)[1]))
+    if in_eigen_block:
+        result["homo"] = occupied[-1] if occupied else None
+        result["lumo"] = virtual[0] if virtual else None
+    # 振動解析が複数回ある場合は "Harmonic frequencies" ごとにリセットし、最後の組だけ残す
+    n = min(len(freqs), len(intens))
+    result["frequencies"], result["intensities"] = freqs[:n], intens[:n]
+
+
+# --- 入口 ---
+def _detect_program(head):
+    if b"O   R   C   A" in head:
+        return "ORCA"
+    if b"Gaussian" in head:
+        return "Gaussian"
+    if b"ORCA" in head:
+        return "ORCA"
+    return None
+
+
+def _iter_lines(source):
+    # パス → mmap 上の readline、ファイルオブジェクト → そのまま行ごとに読む
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            perf.add_fs("mmap", n_bytes=size)
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                yield from iter(mm.readline, b"")
+    else:
+        source.seek(0)
+        for line in source:
+            yield line if isinstance(line, bytes) else line.encode("utf-8", errors="ignore")
+
+
+def parse(source):
+    result = _new_result()
+    lines = _iter_lines(source)
+    head = []
+    for line in lines:
+        head.append(line)
+        if len(head) >= 200:
+            break
+    program = _detect_program(b"".join(head))
+    if program is None:
+        raise ValueError("ORCA / Gaussian の出力ファイルとして認識できませんでした")
+    result["program"] = program
+
+    def all_lines():
+        yield from head
+        yield from lines
+
+    if program == "ORCA":
+        _parse_orca(all_lines(), result)
+    else:
+        _parse_gaussian(all_lines(), result)
+    return result
+
+
+def form_values(result):
+    # 構造フォームの項目名に対応づけた値（見つからなかったものは含めない）
+    values = {
+        "SCFエネルギー": result["scf_energy"],
+        "HOMO": result["homo"],
+        "LUMO": result["lumo"],
+        "双極子モーメント": result["dipole"],
+    }
+    if result["mulliken"]:
+        values["Mulliken最大"] = max(result["mulliken"])
+        values["Mulliken最小"] = min(result["mulliken"])
+    return {k: v for k, v in values.items() if v is not None}
+
+
+def structure_values(total, substrate=None, molecule=None):
+    # 構造フォームの値：界面全体の出力＋基板・分子の出力の SCF エネルギー
+    values = form_values(total)
+    for key, result in [("E_total", total), ("E_substrate", substrate), ("E_molecule", molecule)]:
+        if result is not None and result["scf_energy"] is not None:
+            values[key] = result["scf_energy"]
+    return values
+
+
+# --- 保存済みの出力ファイル（記録の添付・構造フォルダ） ---
+def find_outputs(roots=("entries", "results")):
+    paths = []
+    for root in roots:
+        for ext in OUTPUT_EXTENSIONS:
+            paths.extend(glob.glob(f"{root}/**/*.{ext}", recursive=True))
+    return sorted(paths)
@@ -0,0 +1,170 @@
+import time
+import numpy as np
+import perf
+import results_store
+
+# --- 反応（保存済みの構造を S / TS / P として結び、差分量を反応表全体で一括計算） ---
+# ハートリー → 各単位
+UNITS = {"au": 1.0, "kJ/mol": 2625.499639, "kcal/mol": 627.509474}
+
+# (表示名, 列名, エネルギー単位で換算するか)
+VALUE_COLUMNS = [
+    ("ΔE", "delta_e", True),
+    ("障壁（正）", "barrier", True),
+    ("障壁（逆）", "reverse_barrier", True),
+    ("ΔQIDE", "delta_qide", True),
+    ("ΔHOMO", "delta_homo", True),
+    ("ΔLUMO", "delta_lumo", True),
+    ("Δギャップ", "delta_gap", True),
+    ("Δμ", "delta_mu", True),
+    ("ΔMulliken最大", "delta_mulliken_max", False),
+    ("ΔMulliken最小", "delta_mulliken_min", False),
+]
+VALUE_LABELS = [label for label, _, _ in VALUE_COLUMNS]
+# (接頭辞, 反応の列, 表示名)
+ROLES = [("s", "reactant", "S"), ("t", "ts", "TS"), ("p", "product", "P")]
+MEMBER_COLUMNS = ["scf_energy", "homo", "lumo", "mu", "qide", "mulliken_max", "mulliken_min"]
+# 一括登録の CSV で受け付ける列名
+CSV_ALIASES = {
+    "反応名": "name", "S": "reactant", "反応物": "reactant", "TS": "ts", "遷移状態": "ts",
+    "P": "product", "生成物": "product", "メモ": "notes",
+}
+
+
+def _members_sql():
+    # 定義か構造のどれかが書き換わった（署名が保存時と違う）反応だけを取り出す
+    columns = ["r.name AS name"]
+    joins = []
+    for prefix, ref, _ in ROLES:
+        columns.append(f"r.{ref} AS {prefix}_ref")
+        columns.append(f"{prefix}.name AS {prefix}_found")
+        columns += [f"{prefix}.{c} AS {prefix}_{c}" for c in MEMBER_COLUMNS]
+        joins.append(f"LEFT JOIN results {prefix} ON {prefix}.name = r.{ref}")
+    signature = "printf('%s|%s|%s|%s', r.updated_at, s.updated_at, t.updated_at, p.updated_at)"
+    columns.append(f"{signature} AS signature")
+    return (f"SELECT {', '.join(columns)} FROM reactions r {' '.join(joins)} "
+            f"LEFT JOIN reaction_values v ON v.name = r.name "
+            f"WHERE v.signature IS NULL OR v.signature != {signature}")
+
+
+def compute(members):
+    # members: 反応ごとに s_/t_/p_ + 構造の列を持つ表（見つからない構造は NaN）。戻り値: 列名 → 配列（ハートリー）
+    def col(prefix, name):
+        return members[f"{prefix}_{name}"].to_numpy(dtype="float64")
+
+    e_s, e_t, e_p = col("s", "scf_energy"), col("t", "scf_energy"), col("p", "scf_energy")
+    gap_s = col("s", "lumo") - col("s", "homo")
+    gap_p = col("p", "lumo") - col("p", "homo")
+    values = {
+        "delta_e": e_p - e_s,
+        "barrier": e_t - e_s,
+        "reverse_barrier": e_t - e_p,
+        "delta_gap": gap_p - gap_s,
+    }
+    for name in ["qide", "homo", "lumo", "mu", "mulliken_max", "mulliken_min"]:
+        values[f"delta_{name}"] = col("p", name) - col("s", name)
+    return values
+
+
+def _missing(members):
+    # 参照しているのに見つからない構造の役割（"S TS" など）
+    missing = np.full(len(members), "", dtype=object)
+    for prefix, _, label in ROLES:
+        absent = (members[f"{prefix}_ref"].notna() & members[f"{prefix}_found"].isna()).to_numpy()
+        missing = np.where(absent, missing + label + " ", missing)
+    return [m.strip() for m in missing]
+
+
+def refresh():
+    # 戻り値: 計算し直した反応の数。変わっていない反応は保存済みの値をそのまま使う
+    import pandas as pd
+
+    conn = results_store.connect()
+    try:
+        with perf.fs_op("sqlite"):
+            members = pd.read_sql_query(_members_sql(), conn)
+        with conn:
+            conn.execute("DELETE FROM reaction_values WHERE name NOT IN (SELECT name FROM reactions)")
+            if members.empty:
+                return 0
+            values = compute(members)
+            keys = ["name", "signature", "missing"] + [column for _, column, _ in VALUE_COLUMNS]
+            rows = pd.DataFrame({"name": members["name"], "signature": members["signature"], "missing": _missing(members), **values})
+            rows = rows[keys].astype(object).where(rows[keys].notna(), None)
+            conn.executemany(
+                f"INSERT OR REPLACE INTO reaction_values ({', '.join(keys)}) VALUES ({', '.join('?' * len(keys))})",
+                rows.itertuples(index=False, name=None))
+        return len(members)
+    finally:
+        conn.close()
+
+
+# --- 書き込み ---
+def _reaction_row(name, reactant, product, ts=None, notes=""):
+    name, reactant, product = (str(v or "").strip() for v in (name, reactant, product))
+    if not name or not reactant or not product:
+        raise ValueError("反応名・反応物・生成物は必須です")
+    ts = str(ts).strip() if ts is not None and str(ts).strip() and str(ts) != "nan" else None
+    notes = "" if notes is None or str(notes) == "nan" else str(notes)
+    return (name, reactant, ts, product, notes, time.time())
+
+
+def save_reactions(rows):
+    # rows: name / reactant / product / ts / notes を持つ dict のリスト（1トランザクション）
+    values = [_reaction_row(r.get("name"), r.get("reactant"), r.get("product"), r.get("ts"), r.get("notes", "")) for r in rows]
+    if not values:
+        return 0
+    conn = results_store.connect()
+    try:
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO reactions (name, reactant, ts, product, notes, updated_at) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", values)
+            results_store._bump_version(conn, "reactions_version")
+        return len(values)
+    finally:
+        conn.close()
+
+
+def save_reaction(name, reactant, product, ts=None, notes=""):
+    save_reactions([{"name": name, "reactant": reactant, "product": product, "ts": ts, "notes": notes}])
+
+
+def delete_reaction(name):
+    conn = results_store.connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM reactions WHERE name = ?", (name,))
+            conn.execute("DELETE FROM reaction_values WHERE name = ?", (name,))
+            results_store._bump_version(conn, "reactions_version")
+    finally:
+        conn.close()
+
+
+def data_version():
+    # 構造と反応の定義のどちらかが変われば変わる（キャッシュのキーに使う）
+    return (results_store.data_version(), results_store.data_version("reactions_version"))
+
+
+# --- 読み込み ---
+def load_table(unit="kJ/mol"):
+    # 差分量はエネルギーを unit に換算し、列名に単位を付ける（Mulliken 電荷の差はそのまま）
+    import pandas as pd
+
+    refresh()
+    select = ", ".join(f'v.{column} AS "{label}"' for label, column, _ in VALUE_COLUMNS)
+    conn = results_store.connect()
+    try:
+        with perf.fs_op("sqlite"):
+            df = pd.read_sql_query(
+                f'SELECT r.name AS "反応名", r.reactant AS "S", r.ts AS "TS", r.product AS "P", {select}, '
+                f'v.missing AS "見つからない構造", r.notes AS "メモ" '
+                f'FROM reactions r LEFT JOIN reaction_values v ON v.name = r.name ORDER BY r.name', conn)
+    finally:
+        conn.close()
+    factor = UNITS[unit]
+    renames = {}
+    for label, _, energy in VALUE_COLUMNS:
+        df[label] = df[label].astype("float64") * (factor if energy else 1.0)
+        if energy:
+            renames[label] = f"{label} [{unit}]"
+    return df.rename(columns=renames)
@@ -0,0 +1,291 @@
+import os
+import time
+from glob import glob
+from pathlib import Path
+import yaml
+import perf
+import storage
+
+# --- 構造別結果ストア（results/*/data.yaml を1つのSQLiteテーブルに集約） ---
+RESULTS_DIR = "results"
+STORE_PATH = os.path.join(RESULTS_DIR, "results.sqlite")
+
+# (表示名, 列名, 型)
+COLUMNS = [
+    ("構造名", "name", "TEXT"),
+    ("タグ", "tag", "TEXT"),
+    ("SCFエネルギー", "scf_energy", "REAL"),
+    ("HOMO", "homo", "REAL"),
+    ("LUMO", "lumo", "REAL"),
+    ("μ", "mu", "REAL"),
+    ("双極子モーメント", "dipole", "REAL"),
+    ("Mulliken最大", "mulliken_max", "REAL"),
+    ("Mulliken最小", "mulliken_min", "REAL"),
+    ("E_total", "e_total", "REAL"),
+    ("E_substrate", "e_substrate", "REAL"),
+    ("E_molecule", "e_molecule", "REAL"),
+    ("QIDE", "qide", "REAL"),
+    ("メモ", "notes", "TEXT"),
+]
+DISPLAY_KEYS = [label for label, _, _ in COLUMNS]
+NUMERIC_KEYS = [label for label, _, kind in COLUMNS if kind == "REAL"]
+LABEL_TO_COLUMN = {label: column for label, column, _ in COLUMNS}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    name         TEXT PRIMARY KEY,
+    tag          TEXT NOT NULL DEFAULT 'Other',
+    scf_energy   REAL,
+    homo         REAL,
+    lumo         REAL,
+    mu           REAL,
+    dipole       REAL,
+    mulliken_max REAL,
+    mulliken_min REAL,
+    e_total      REAL,
+    e_substrate  REAL,
+    e_molecule   REAL,
+    qide         REAL,
+    notes        TEXT NOT NULL DEFAULT '',
+    image        TEXT,
+    updated_at   REAL NOT NULL,
+    revision     INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_results_tag ON results(tag);
+CREATE TABLE IF NOT EXISTS reactions (
+    name       TEXT PRIMARY KEY,
+    reactant   TEXT NOT NULL,
+    ts         TEXT,
+    product    TEXT NOT NULL,
+    notes      TEXT NOT NULL DEFAULT '',
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reaction_values (
+    name               TEXT PRIMARY KEY,
+    signature          TEXT NOT NULL,
+    missing            TEXT NOT NULL DEFAULT '',
+    delta_e            REAL,
+    barrier            REAL,
+    reverse_barrier    REAL,
+    delta_qide         REAL,
+    delta_homo         REAL,
+    delta_lumo         REAL,
+    delta_gap          REAL,
+    delta_mu           REAL,
+    delta_mulliken_max REAL,
+    delta_mulliken_min REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('reactions_version', 0);
+-- 表を作り直すと番号は 0 から数え直すので、作るたびに変わる識別子と組にしてキャッシュのキーにする
+INSERT OR IGNORE INTO meta (key, value) VALUES ('store_id', abs(random()));
+"""
+
+
+# スキーマの確認はプロセスごとに1回だけ（接続のたびに書き込みロックを取らない）
+_schema_ready = set()
+
+
+def connect():
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    fresh = STORE_PATH not in _schema_ready or not os.path.exists(STORE_PATH)
+    conn = storage.sqlite_connect(STORE_PATH)
+    if fresh:
+        conn.executescript(SCHEMA)
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(results)")}
+        if "revision" not in columns:
+            with conn:
+                conn.execute("ALTER TABLE results ADD COLUMN revision INTEGER NOT NULL DEFAULT 0")
+        _schema_ready.add(STORE_PATH)
+    return conn
+
+
+# --- 派生量（フォーム・編集・一括登録で共通） ---
+def structure_tag(structure_name):
+    if "Trimer" in structure_name:
+        return "Trimer"
+    elif "Dimer" in structure_name:
+        return "Dimer"
+    elif "Tetramer" in structure_name:
+        return "Tetramer"
+    return "Other"
+
+
+def _known(*values):
+    return all(v is not None and v == v for v in values)
+
+
+def derive(record):
+    # 元の値が1つでも欠けていれば（None / NaN）μ・QIDE も None（0 として計算した偽の値を入れない）
+    record = dict(record)
+    homo, lumo = record.get("HOMO"), record.get("LUMO")
+    energies = [record.get(key) for key in ["E_total", "E_substrate", "E_molecule"]]
+    record["μ"] = - (homo + lumo) / 2 if _known(homo, lumo) else None
+    record["QIDE"] = energies[0] - energies[1] - energies[2] if _known(*energies) else None
+    record.setdefault("タグ", structure_tag(record["構造名"]))
+    return record
+
+
+# 構造フォームの数値項目（出力ファイルから取れなかったものは None のまま保存する）
+FORM_KEYS = ["SCFエネルギー", "HOMO", "LUMO", "Mulliken最大", "Mulliken最小", "E_total", "E_substrate", "E_molecule", "双極子モーメント"]
+
+
+def record_from_values(values, structure_name, notes=""):
+    record = {key: values.get(key) for key in FORM_KEYS}
+    record["構造名"] = structure_name
+    record["メモ"] = notes
+    return derive(record)
+
+
+def structure_dir(structure_name):
+    return Path(RESULTS_DIR) / structure_name.replace(" ", "_")
+
+
+def _bump_version(conn, key="version"):
+    conn.execute("UPDATE meta SET value = value + 1 WHERE key = ?", (key,))
+
+
+def data_version(key="version"):
+    # 戻り値: (ストアの識別子, 書き込みのたびに増える番号)。キャッシュ・ジョブのキーに使う。反応の定義は 'reactions_version'
+    conn = connect()
+    try:
+        values = dict(conn.execute("SELECT key, value FROM meta WHERE key IN ('store_id', ?)", (key,)).fetchall())
+        return values["store_id"], values[key]
+    finally:
+        conn.close()
+
+
+def _row_values(record, image):
+    values = {column: record.get(label) for label, column, _ in COLUMNS}
+    values["tag"] = values["tag"] or structure_tag(values["name"])
+    values["notes"] = values["notes"] or ""
+    values["image"] = image
+    values["updated_at"] = time.time()
+    return values
+
+
+def _upsert_sql(keys, overwrite=True):
+    columns = ", ".join(keys)
+    marks = ", ".join(":" + k for k in keys)
+    if not overwrite:
+        return f"INSERT OR IGNORE INTO results ({columns}) VALUES ({marks})"
+    updates = ", ".join(f"{k} = excluded.{k}" for k in keys if k != "name")
+    return f"INSERT INTO results ({columns}) VALUES ({marks}) ON CONFLICT(name) DO UPDATE SET {updates}, revision = revision + 1"
+
+
+def _update_sql(keys):
+    updates = ", ".join(f"{k} = :{k}" for k in keys if k != "name")
+    return f"UPDATE results SET {updates}, revision = revision + 1 WHERE name = :name AND revision = :expected_revision"
+
+
+# --- 書き込み ---
+def save_result(record, image=None, expected_revision=None):
+    # expected_revision を渡すと、読み込み後に他のセッションが更新していれば storage.ConflictError
+    values = _row_values(record, image)
+    if image is None:
+        values.pop("image")
+    conn = connect()
+    try:
+        with conn:
+            if expected_revision is None:
+                conn.execute(_upsert_sql(list(values)), values)
+            elif conn.execute(_update_sql(list(values)), {**values, "expected_revision": expected_revision}).rowcount == 0:
+                raise storage.ConflictError(values["name"])
+            _bump_version(conn)
+            return conn.execute("SELECT revision FROM results WHERE name = ?", (values["name"],)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def save_results(records):
+    # 一括書き込み（1トランザクション）。records は (record, image) のリスト。image が None なら既存の画像を残す
+    with_image = [_row_values(record, image) for record, image in records if image is not None]
+    without_image = [_row_values(record, None) for record, image in records if image is None]
+    for values in without_image:
+        values.pop("image")
+    if not with_image and not without_image:
+        return
+    conn = connect()
+    try:
+        with conn:
+            for rows in [with_image, without_image]:
+                if rows:
+                    conn.executemany(_upsert_sql(list(rows[0])), rows)
+            _bump_version(conn)
+    finally:
+        conn.close()
+
+
+def delete_result(structure_name):
+    conn = connect()
+    try:
+        with conn:
+            conn.execute("DELETE FROM results WHERE name = ?", (structure_name,))
+            _bump_version(conn)
+    finally:
+        conn.close()
+
+
+# --- 読み込み（1回のクエリでDataFrame化） ---
+def load_frame():
+    import pandas as pd
+
+    select = ", ".join(f'{column} AS "{label}"' for label, column, _ in COLUMNS)
+    conn = connect()
+    try:
+        with perf.fs_op("sqlite"):
+            df = pd.read_sql_query(f'SELECT {select}, image AS "画像", revision AS "更新番号" FROM results ORDER BY name', conn)
+    finally:
+        conn.close()
+    for key in NUMERIC_KEYS:
+        df[key] = df[key].astype("float64")
+    return df
+
+
+# --- 既存の results/*/data.yaml を一度だけ取り込む ---
+def yaml_migrated():
+    conn = connect()
+    try:
+        return conn.execute("SELECT 1 FROM meta WHERE key = 'yaml_migrated'").fetchone() is not None
+    finally:
+        conn.close()
+
+
+def migrate_yaml(force=False, progress=None):
+    # progress(割合, メッセージ) を渡すとフォルダ 100 件ごとに呼ぶ
+    conn = connect()
+    try:
+        if not force and conn.execute("SELECT 1 FROM meta WHERE key = 'yaml_migrated'").fetchone():
+            return 0
+        records = []
+        folders = glob(f"{RESULTS_DIR}/*/")
+        for i, folder in enumerate(folders):
+            if progress is not None and i % 100 == 0:
+                progress(i / len(folders), f"{i} / {len(folders)} フォルダ")
+            meta_path = Path(folder) / "data.yaml"
+            img_path = Path(folder) / "structure.png"
+            if not meta_path.exists():
+                continue
+            with perf.fs_op("yaml") as op, open(meta_path, "rb") as f:
+                raw = f.read()
+                op["bytes"] = len(raw)
+            data = yaml.safe_load(raw) or {}
+            if not data.get("構造名"):
+                continue
+            records.append(_row_values(data, str(img_path) if img_path.exists() else None))
+        with conn:
+            if records:
+                conn.executemany(_upsert_sql(list(records[0]), overwrite=False), records)
+                _bump_version(conn)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('yaml_migrated', 1)")
+        return len(records)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    print(f"{migrate_yaml(force=True)} 件の data.yaml を取り込みました")
@@ -0,0 +1,250 @@
+import hashlib
+import os
+import time
+import numpy as np
+import ir
+import perf
+import storage
+
+# --- スペクトルライブラリ（共通グリッド上の float32 行列をメモリマップし、類似度を行列演算で一括計算） ---
+LIBRARY_DIR = os.path.join("spectra", "library")
+MATRIX_PATH = os.path.join(LIBRARY_DIR, "matrix.f32")
+META_PATH = os.path.join(LIBRARY_DIR, "library.sqlite")
+# 共通グリッド（1 cm⁻¹ 間隔）。変えると既存の行列と合わなくなる
+GRID = (400.0, 4000.0, 3601)
+ROW_BYTES = GRID[2] * 4
+# 一度に読み込んで掛け算する行数（4096行 ≒ 59 MB）
+CHUNK_ROWS = 4096
+# シフト探索の粗い段階で何点おきにずらすか（上位候補は 1 点刻みで詰め直す）
+SHIFT_STRIDE = 5
+
+METHODS = {
+    "cosine": "コサイン類似度",
+    "pearson": "Pearson 相関",
+    "shifted": "ピークシフト許容（コサイン）",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spectra (
+    id          INTEGER PRIMARY KEY,
+    name        TEXT NOT NULL,
+    structure   TEXT,
+    note        TEXT,
+    source      TEXT NOT NULL DEFAULT '',
+    lineshape   TEXT,
+    sigma       REAL,
+    scale       REAL,
+    mean        REAL NOT NULL,
+    digest      TEXT NOT NULL UNIQUE,
+    deleted     INTEGER NOT NULL DEFAULT 0,
+    created_at  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_spectra_structure ON spectra(structure);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+_schema_ready = set()
+
+
+def connect():
+    os.makedirs(LIBRARY_DIR, exist_ok=True)
+    fresh = META_PATH not in _schema_ready or not os.path.exists(META_PATH)
+    conn = storage.sqlite_connect(META_PATH)
+    if fresh:
+        conn.executescript(SCHEMA)
+        _schema_ready.add(META_PATH)
+    return conn
+
+
+def data_version():
+    conn = connect()
+    try:
+        return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def grid():
+    return ir.make_grid(*GRID)
+
+
+def to_row(x, y):
+    # 任意のグリッドのスペクトルを共通グリッドへ線形補間し、L2 ノルム 1 の float32 にする（範囲外は 0）
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    order = np.argsort(x)
+    row = np.interp(grid(), x[order], y[order], left=0.0, right=0.0)
+    norm = np.linalg.norm(row)
+    return (row / norm if norm > 0 else row).astype(np.float32)
+
+
+# --- 書き込み（行列には追記のみ。行番号 = id） ---
+def add_spectra(items):
+    # items: name, x, y と任意の structure / note / source / lineshape / sigma / scale を持つ dict のリスト
+    # 戻り値: 各スペクトルの id（同じ内容が既にあればその id）
+    rows = [to_row(item["x"], item["y"]) for item in items]
+    digests = [hashlib.sha1(row.tobytes()).hexdigest() for row in rows]
+    ids = [None] * len(items)
+    with storage.file_lock(MATRIX_PATH):
+        conn = connect()
+        try:
+            known = {}
+            for start in range(0, len(digests), 500):
+                chunk = digests[start:start + 500]
+                marks = ", ".join("?" * len(chunk))
+                known.update(conn.execute(f"SELECT digest, id FROM spectra WHERE digest IN ({marks}) AND deleted = 0", chunk).fetchall())
+            n_rows = os.path.getsize(MATRIX_PATH) // ROW_BYTES if os.path.exists(MATRIX_PATH) else 0
+            new = []
+            for i, (item, row, digest) in enumerate(zip(items, rows, digests)):
+                if digest in known:
+                    ids[i] = known[digest]
+                    continue
+                known[digest] = ids[i] = n_rows + len(new)
+                new.append((ids[i], item, row, digest))
+            if not new:
+                return ids
+            with perf.fs_op("write") as op, open(MATRIX_PATH, "ab") as f:
+                # 途中で書き込みが切れた行があれば、行の境界から書き直す
+                f.truncate(n_rows * ROW_BYTES)
+                f.write(np.vstack([row for _, _, row, _ in new]).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+                op["bytes"] = len(new) * ROW_BYTES
+            with conn:
+                # 削除済みの同じ内容は digest が重複するので先に外す
+                conn.executemany("DELETE FROM spectra WHERE digest = ? AND deleted = 1", [(d,) for _, _, _, d in new])
+                conn.executemany(
+                    "INSERT INTO spectra (id, name, structure, note, source, lineshape, sigma, scale, mean, digest, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(i, item["name"], item.get("structure") or None, item.get("note") or None, item.get("source", ""),
+                      item.get("lineshape"), item.get("sigma"), item.get("scale"), float(row.mean()), digest, time.time())
+                     for i, item, row, digest in new])
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+        finally:
+            conn.close()
+    return ids
+
+
+def add_spectrum(name, x, y, **info):
+    return add_spectra([{"name": name, "x": x, "y": y, **info}])[0]
+
+
+def delete_spectra(ids):
+    # 行列の行はそのまま残し、検索対象から外す
+    conn = connect()
+    try:
+        with conn:
+            conn.executemany("UPDATE spectra SET deleted = 1 WHERE id = ?", [(int(i),) for i in ids])
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+    finally:
+        conn.close()
+
+
+# --- 読み込み ---
+def list_spectra():
+    import pandas as pd
+
+    conn = connect()
+    try:
+        return pd.read_sql_query(
+            'SELECT id, name AS "名前", structure AS "構造", note AS "記録", source AS "入力元", lineshape AS "線形", '
+            'sigma AS "σ", scale AS "スケーリング", mean, created_at FROM spectra WHERE deleted = 0 ORDER BY id', conn)
+    finally:
+        conn.close()
+
+
+def _matrix(n_rows):
+    if n_rows == 0:
+        return np.zeros((0, GRID[2]), dtype=np.float32)
+    return np.memmap(MATRIX_PATH, dtype=np.float32, mode="r", shape=(n_rows, GRID[2]))
+
+
+def spectra_rows(ids):
+    # 戻り値: (len(ids) × グリッド点数) の配列（L2 ノルム 1）
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.zeros((0, GRID[2]), dtype=np.float32)
+    return np.asarray(_matrix(int(ids.max()) + 1)[ids])
+
+
+def _shifted_queries(q, max_shift, stride=1):
+    # ±max_shift cm⁻¹ の範囲で stride 点ずつずらしたクエリ（はみ出した分は 0、各行を再規格化）
+    step = (GRID[1] - GRID[0]) / (GRID[2] - 1)
+    k = int(round(max_shift / step))
+    shifts = np.arange(-k, k + 1, stride)
+    Q = np.zeros((len(shifts), len(q)), dtype=np.float32)
+    for j, s in enumerate(shifts):
+        if s >= 0:
+            Q[j, s:] = q[:len(q) - s]
+        else:
+            Q[j, :s] = q[-s:]
+    norms = np.linalg.norm(Q, axis=1, keepdims=True)
+    return np.divide(Q, norms, out=np.zeros_like(Q), where=norms > 0), shifts * step
+
+
+def _scores(ids, Q):
+    # 戻り値: (len(ids) × len(Q)) の内積。行列はチャンクごとに読み込む
+    n_rows = int(ids.max()) + 1
+    matrix = _matrix(n_rows)
+    with perf.fs_op("mmap") as op:
+        if len(ids) * 2 < n_rows:
+            # 候補だけを読む（シフト探索の絞り込み後など）
+            order = np.argsort(ids)
+            scores = np.empty((len(ids), len(Q)), dtype=np.float32)
+            scores[order] = np.asarray(matrix[ids[order]]) @ Q.T
+            op["bytes"] = len(ids) * ROW_BYTES
+            return scores
+        scores = np.empty((n_rows, len(Q)), dtype=np.float32)
+        for start in range(0, n_rows, CHUNK_ROWS):
+            block = np.asarray(matrix[start:start + CHUNK_ROWS])
+            scores[start:start + len(block)] = block @ Q.T
+        op["bytes"] = n_rows * ROW_BYTES
+    return scores[ids]
+
+
+def _top(best, top):
+    top = min(int(top), len(best))
+    order = np.argpartition(-best, top - 1)[:top] if top < len(best) else np.arange(len(best))
+    return order[np.argsort(-best[order])]
+
+
+def search(x, y, method="cosine", top=20, max_shift=20.0):
+    # 戻り値: 類似度の高い順の表（shifted では最も合うずらし量も付ける）
+    meta = list_spectra()
+    if meta.empty:
+        return meta.assign(類似度=[])
+    ids = meta["id"].to_numpy(dtype=np.int64)
+    q = to_row(x, y)
+    if method == "pearson":
+        # 行は L2 ノルム 1 なので、中心化した行のノルムは √(1 - n·平均²)。中心化したクエリとの内積で足りる
+        q_c = q - q.mean()
+        q_norm = np.linalg.norm(q_c)
+        scores = _scores(ids, (q_c / q_norm if q_norm > 0 else q_c)[None, :])[:, 0]
+        means = meta["mean"].to_numpy(dtype=np.float64)
+        centered_norm = np.sqrt(np.clip(1.0 - GRID[2] * means ** 2, 0.0, None))
+        best = np.divide(scores, centered_norm, out=np.zeros(len(ids)), where=centered_norm > 0)
+    elif method == "shifted":
+        # 粗いずらし幅で全件を評価し、上位の候補だけ 1 点刻みで詰める
+        Q, _ = _shifted_queries(q, max_shift, SHIFT_STRIDE)
+        coarse = _scores(ids, Q).max(axis=1)
+        candidates = _top(coarse, max(int(top) * 5, 100))
+        Q, shifts = _shifted_queries(q, max_shift)
+        fine = _scores(ids[candidates], Q)
+        best = np.full(len(ids), -np.inf)
+        best[candidates] = fine.max(axis=1)
+        best_shift = np.zeros(len(ids), dtype=np.int64)
+        best_shift[candidates] = fine.argmax(axis=1)
+    else:
+        best = _scores(ids, q[None, :])[:, 0]
+
+    order = _top(best, top)
+    result = meta.iloc[order].drop(columns=["mean", "created_at"]).reset_index(drop=True)
+    result.insert(1, "類似度", best[order].astype(np.float64))
+    if method == "shifted":
+        # ライブラリ側のピークがクエリより何 cm⁻¹ 高波数にあるか
+        result.insert(2, "シフト (cm⁻¹)", shifts[best_shift[order]])
+    return result
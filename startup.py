@@ -0,0 +1,57 @@
+import importlib
+import os
+import threading
+import time
+
+# --- 重いモジュールの事前読み込み（パスワード認証後にバックグラウンドで実行） ---
+HEAVY_MODULES = [
+    "numpy",
+    "pandas",
+    "matplotlib.pyplot",
+    "seaborn",
+    "sklearn.cluster",
+]
+
+_lock = threading.Lock()
+_started = False
+_import_times = {}
+
+
+def _warm(modules):
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            if name == "matplotlib.pyplot":
+                # 描画はStreamlit経由なのでGUIバックエンドを選ばせない
+                import matplotlib
+                matplotlib.use("Agg")
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        with _lock:
+            _import_times[name] = time.perf_counter() - start
+
+
+def prewarm(modules=HEAVY_MODULES):
+    # プロセスにつき1回だけ。QIDT_PREWARM=0 で無効化（起動時間の計測用）
+    global _started
+    if os.environ.get("QIDT_PREWARM", "1") == "0":
+        return
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_warm, args=(list(modules),), name="qidt-prewarm", daemon=True).start()
+
+
+def import_times():
+    with _lock:
+        return dict(_import_times)
+
+
+# --- タブごとの描画時間（初回描画＝見出しまで、完了＝スクリプト終端まで） ---
+def record_paint(session_state, tab, script_start, stage):
+    elapsed_ms = (time.perf_counter() - script_start) * 1000
+    timings = session_state.setdefault("tab_paint_ms", {})
+    timings.setdefault(tab, {})[stage] = elapsed_ms
+    return elapsed_ms
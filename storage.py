@@ -0,0 +1,175 @@
+import contextlib
+import fnmatch
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# --- 複数セッションからの安全な書き込み（一時ファイル＋rename、レコード単位のロック） ---
+LOCK_TIMEOUT = 30.0
+
+
+class ConflictError(Exception):
+    # 読み込んだ後に他のセッションが同じレコードを更新していた
+    pass
+
+
+def atomic_write(path, data):
+    # 同じディレクトリの一時ファイルに書いてから置き換えるので、読み手は常に完全な内容を見る
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    _replace(path, lambda f: f.write(data))
+
+
+def atomic_copy(path, source, chunk_size=4 * 1024 * 1024):
+    # atomic_write のストリーミング版（source はバイナリで読めるファイルオブジェクト）。戻り値: 書いたバイト数
+    _replace(path, lambda f: shutil.copyfileobj(source, f, chunk_size))
+    return os.path.getsize(path)
+
+
+def _replace(path, write):
+    dir_path = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path, prefix=".tmp-", suffix=os.path.splitext(path)[1] + ".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+
+
+def _lock_path(path):
+    dir_path, name = os.path.split(path)
+    return os.path.join(dir_path, f".{name}.lock")
+
+
+@contextlib.contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    # path ごとの排他ロック（同じディレクトリの隠しファイル .<name>.lock を使う）
+    lock_path = _lock_path(path)
+    os.makedirs(os.path.dirname(lock_path) or ".", exist_ok=True)
+    if fcntl is not None:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"ロックを取得できませんでした: {path}")
+                    time.sleep(0.05)
+            yield
+        finally:
+            os.close(fd)
+        return
+
+    # fcntl が無い環境では排他作成したロックファイルで代用する
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"ロックを取得できませんでした: {path}")
+            time.sleep(0.05)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(lock_path)
+
+
+def mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def write_checked(path, data, expected_mtime_ns=None):
+    # expected_mtime_ns を渡すと、読み込み後に他で更新されていれば ConflictError
+    with file_lock(path):
+        if expected_mtime_ns is not None and mtime_ns(path) != expected_mtime_ns:
+            raise ConflictError(path)
+        atomic_write(path, data)
+        return mtime_ns(path)
+
+
+def remove_locked(path):
+    # ロックファイルは消さない（消すと、待っていた別プロセスが新しく作られた別の inode をロックしてしまう）
+    with file_lock(path):
+        os.remove(path)
+
+
+# --- キャッシュディレクトリの上限（最終アクセスの古いファイルから消す） ---
+def prune_dir(directory, max_bytes, pattern="*"):
+    # pattern に合うファイル（隠しファイル・書き込み途中の一時ファイルは除く）の合計を max_bytes 以下にする。戻り値: 消した数
+    try:
+        entries = [e for e in os.scandir(directory)
+                   if e.is_file() and not e.name.startswith(".") and fnmatch.fnmatch(e.name, pattern)]
+    except FileNotFoundError:
+        return 0
+    stats = sorted((e.stat().st_atime, e.stat().st_size, e.path) for e in entries)
+    total = sum(size for _, size, _ in stats)
+    removed = 0
+    for _, size, path in stats:
+        if total <= max_bytes:
+            break
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        total -= size
+        removed += 1
+    return removed
+
+
+# --- SQLite の接続（書き込みが重なっても待ってから進む） ---
+# WAL は読み手と書き手が互いを待たなくなるが、共有メモリを使うのでネットワーク上の
+# 共有ボリュームでは壊れることがある。ローカルディスクに置くときだけ QIDT_SQLITE_WAL=1 で有効にする
+SQLITE_WAL = os.environ.get("QIDT_SQLITE_WAL") == "1"
+
+
+def sqlite_connect(path, timeout=LOCK_TIMEOUT):
+    conn = sqlite3.connect(path, timeout=timeout)
+    conn.row_factory = sqlite3.Row
+    if SQLITE_WAL:
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+# --- 衝突しないファイル名 ---
+UNSAFE_CHARS = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def slugify(title):
+    slug = UNSAFE_CHARS.sub("_", title.strip()).replace(" ", "_").strip(".")
+    return slug or "untitled"
+
+
+def claim_path(dir_path, slug, ext):
+    # 同名があれば -2, -3, ... を付け、空ファイルを排他作成して名前を確保する
+    os.makedirs(dir_path, exist_ok=True)
+    n = 1
+    while True:
+        name = slug if n == 1 else f"{slug}-{n}"
+        path = os.path.join(dir_path, name + ext)
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return path
+        except FileExistsError:
+            n += 1
@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import attachments  # noqa: E402
+
+
+def test_grep_anchors_match_lines_inside_the_file(tmp_path):
+    path = tmp_path / "run.out"
+    path.write_text("".join(f"line {i} energy {i * 0.5:.1f}\n" for i in range(1, 101)))
+
+    matches, truncated = attachments.grep(str(path), r"^line 12 ", regex=True)
+    assert matches == [(12, "line 12 energy 6.0")]
+    assert not truncated
+
+    matches, _ = attachments.grep(str(path), r"energy 6\.0$", regex=True)
+    assert matches == [(12, "line 12 energy 6.0")]
+
+
+def test_grep_plain_text_is_escaped(tmp_path):
+    path = tmp_path / "run.out"
+    path.write_text("a.b\naxb\n")
+    matches, _ = attachments.grep(str(path), "a.b")
+    assert matches == [(1, "a.b")]
@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+
+import pytest  # noqa: E402
+import startup_budget  # noqa: E402
+
+
+def test_helper_import_budget(tmp_path):
+    elapsed_ms, failures = startup_budget.check_helpers(str(tmp_path))
+    assert not failures, "\n".join(failures)
+    assert elapsed_ms <= startup_budget.HELPER_IMPORT_BUDGET_MS
+
+
+def test_light_tabs_first_paint_budget(tmp_path):
+    paints, failures = startup_budget.check_tabs(str(tmp_path))
+    if paints is None:
+        pytest.skip("streamlit がインストールされていない")
+    assert not failures, "\n".join(failures)
+    for tab, paint in paints.items():
+        assert paint["first_paint"] <= startup_budget.TAB_FIRST_PAINT_BUDGET_MS, tab
+
+
+def test_helper_modules_cover_app_imports():
+    # app.py の先頭に補助モジュールの import を足したら、予算チェックの対象にも入る
+    for name in ["storage", "perf", "blobs", "jobs", "qc_parser", "exports", "attachments", "entry_index", "startup"]:
+        assert name in startup_budget.HELPER_MODULES
@@ -0,0 +1,80 @@
+import functools
+import hashlib
+import io
+import os
+
+import perf
+import storage
+
+# --- 画像のサムネイル（内容のハッシュ＋サイズをキーにディスクへキャッシュ） ---
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "cache", "thumbnails")
+# 一覧・詳細で表示する既定の長辺ピクセル数
+THUMB_SIZE = 320
+JPEG_QUALITY = 85
+# キャッシュの上限。超えたら古いものから消す
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+PRUNE_EVERY = 100
+
+_generated = 0
+
+
+@functools.lru_cache(maxsize=4096)
+def _content_hash(file_path, mtime_ns, size):
+    # 同じ画像が別の場所に添付されていても1つのサムネイルを共有する
+    digest = hashlib.sha256()
+    with perf.fs_op("read") as op, open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+        op["bytes"] = size
+    return digest.hexdigest()
+
+
+def content_hash(file_path):
+    st_result = os.stat(file_path)
+    return _content_hash(file_path, st_result.st_mtime_ns, st_result.st_size)
+
+
+def _render(file_path, max_size):
+    # 戻り値: (画像のバイト列, 拡張子)。透過のある画像は PNG、それ以外は JPEG
+    from PIL import Image, ImageOps
+
+    with Image.open(file_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size))
+        buffer = io.BytesIO()
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image.save(buffer, format="PNG", optimize=True)
+            return buffer.getvalue(), "png"
+        image.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        return buffer.getvalue(), "jpg"
+
+
+def thumbnail(file_path, max_size=THUMB_SIZE):
+    # 戻り値: サムネイルのパス。作れなければ元の画像のパス（表示は止めない）
+    global _generated
+    try:
+        digest = content_hash(file_path)
+    except OSError:
+        return file_path
+    for ext in ["jpg", "png"]:
+        cached = os.path.join(CACHE_DIR, f"{digest}_{max_size}.{ext}")
+        if os.path.exists(cached):
+            return cached
+    try:
+        with perf.fs_op("thumbnail"):
+            data, ext = _render(file_path, max_size)
+    except Exception:
+        # Pillow が無い・読めない画像は元のまま表示する
+        return file_path
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    cached = os.path.join(CACHE_DIR, f"{digest}_{max_size}.{ext}")
+    storage.atomic_write(cached, data)
+    _generated += 1
+    if _generated % PRUNE_EVERY == 0:
+        prune()
+    return cached
+
+
+def prune(max_bytes=MAX_CACHE_BYTES):
+    # 最終アクセス（無ければ更新）時刻の古いものから消して上限に収める
+    return storage.prune_dir(CACHE_DIR, max_bytes)